@@ -0,0 +1,178 @@
+import os, json, time, hashlib, threading
+
+# ---------- Nustatymai ----------
+# Talpyklos katalogą ir ribas galima keisti aplinkos kintamaisiais
+CACHE_DIR = os.getenv("AI_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".ai_cache"))
+CACHE_MAX_MB = float(os.getenv("AI_CACHE_MAX_MB", "200"))
+CACHE_MAX_AGE_DAYS = float(os.getenv("AI_CACHE_MAX_AGE_DAYS", "30"))
+# Visas katalogas peržiūrimas (seni įrašai, kitų procesų įrašai) tik kas tiek įrašymų arba viršijus dydį
+CACHE_SWEEP_EVERY = int(os.getenv("AI_CACHE_SWEEP_EVERY", "200"))
+
+
+class DiskCache:
+    """
+    Disko talpykla AI atsakymams, adresuojama pagal turinį:
+    - Raktas = SHA-256 nuo tikslių siunčiamų baitų + modelio + prompt'o versijos
+    - Kiekvienas įrašas - atskiras JSON failas (išlieka tarp sesijų ir paleidimų)
+    - Išmetimas pagal amžių ir bendrą dydį (seniausiai naudoti - pirmi); dydis sekamas atmintyje,
+      todėl įrašymas nevaikšto po visą katalogą
+    - Pataikymų/praleidimų skaitikliai
+    """
+
+    def __init__(self, directory, max_bytes, max_age_seconds, sweep_every=CACHE_SWEEP_EVERY):
+        self.directory = directory
+        self.max_bytes = int(max_bytes)
+        self.max_age_seconds = max_age_seconds
+        self.sweep_every = sweep_every
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._total = None  # bendras dydis baitais (None - dar neskaičiuotas)
+        self._writes = 0  # įrašymai nuo paskutinės peržiūros
+
+    @staticmethod
+    def make_key(*parts):
+        """Sukuria raktą iš dalių (str arba bytes)"""
+        digest = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode("utf-8")
+            # Ilgis prieš dalį - kad ("ab", "c") ir ("a", "bc") nesutaptų
+            digest.update(len(part).to_bytes(8, "big"))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        """Grąžina išsaugotą reikšmę arba None"""
+        path = self._path(key)
+        try:
+            age = time.time() - os.path.getmtime(path)
+            if age > self.max_age_seconds:
+                os.remove(path)
+                self._count(False)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)["value"]
+            # Atnaujiname laiką - LRU išmetimui
+            os.utime(path, None)
+        except (OSError, ValueError, KeyError):
+            self._count(False)
+            return None
+        self._count(True)
+        return value
+
+    def set(self, key, value):
+        """Išsaugo reikšmę (JSON) ir, jei reikia, išmeta senus įrašus"""
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Rašome į laikiną failą ir pervadiname - kad lygiagretūs skaitytojai nematytų pusės failo
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"created": time.time(), "value": value}, f, ensure_ascii=False)
+            size = os.path.getsize(tmp_path)
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        except OSError:
+            # Talpykla neprivaloma - klaida neturi sustabdyti darbo
+            return
+
+        with self._lock:
+            self._writes += 1
+            sweep = (
+                self._total is None
+                or self._writes >= self.sweep_every
+                or self._total + size - replaced > self.max_bytes
+            )
+            if not sweep:
+                self._total += size - replaced
+        if sweep:
+            self._evict()
+
+    def _entries(self):
+        entries = []
+        for root, _dirs, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st_info = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st_info.st_mtime, st_info.st_size, path))
+        return entries
+
+    def _evict(self):
+        """Išmeta per senus įrašus, o jei viršytas dydis - seniausiai naudotus"""
+        now = time.time()
+        entries = []
+        total = 0
+        for mtime, size, path in self._entries():
+            if now - mtime > self.max_age_seconds:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            entries.append((mtime, size, path))
+            total += size
+
+        if total > self.max_bytes:
+            # Išmetama su atsarga (iki 90%) - kitiems įrašymams nereikės iškart vėl peržiūrėti katalogo
+            target = self.max_bytes * 0.9
+            for mtime, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                if total <= target:
+                    break
+
+        with self._lock:
+            self._total = total
+            self._writes = 0
+
+    def clear(self):
+        """Ištrina visus įrašus"""
+        for _mtime, _size, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self._lock:
+            self._total = 0
+
+    def stats(self):
+        """Grąžina skaitiklius: pataikymai, praleidimai, įrašų kiekis, dydis"""
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(entries),
+            "bytes": sum(size for _mtime, size, _path in entries),
+        }
+
+
+# Bendra talpykla vaizdų analizėms (naudoja app.py ir app_cloud.py)
+analysis_cache = DiskCache(
+    os.path.join(CACHE_DIR, "analyses"),
+    max_bytes=CACHE_MAX_MB * 1024 * 1024,
+    max_age_seconds=CACHE_MAX_AGE_DAYS * 24 * 3600,
+)
@@ -0,0 +1,192 @@
+import os, time, uuid, logging, threading
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import trace
+from rate_limiter import session
+from ai_parallel import analyze_in_parallel
+from content_ai import analyze_image, analyze_and_caption, create_captions, repair_captions
+
+logger = logging.getLogger(__name__)
+
+# ---------- Nustatymai ----------
+# AI turinys kuriamas fone - bendrame procesui gijų baseine (Streamlit perkrovimai jo nenutraukia)
+AI_JOB_WORKERS = int(os.getenv("AI_JOB_WORKERS", "4"))
+# Kiek darbų (laukiančių + vykdomų) gali būti iš viso ir vienai sesijai
+AI_JOB_QUEUE_SIZE = int(os.getenv("AI_JOB_QUEUE_SIZE", "16"))
+AI_JOB_MAX_PER_SESSION = int(os.getenv("AI_JOB_MAX_PER_SESSION", "1"))
+# Baigti darbai laikomi tiek laiko (rezultatus galima paimti ir po perkrovimo)
+AI_JOB_RETENTION_MINUTES = float(os.getenv("AI_JOB_RETENTION_MINUTES", "30"))
+# Kaip dažnai naršyklė klausia darbo būsenos: kol kuriami tekstai - dažnai (pirmi žodžiai per < 1 s), kitaip - retai
+AI_JOB_POLL_SECONDS = float(os.getenv("AI_JOB_POLL_SECONDS", "1"))
+AI_JOB_STREAM_POLL_SECONDS = float(os.getenv("AI_JOB_STREAM_POLL_SECONDS", "0.2"))
+
+
+class JobQueueFull(Exception):
+    """Eilė pilna (bendra arba sesijos riba) - darbas nepriimtas"""
+
+
+class AIJob:
+    """Vieno fone vykdomo darbo būsena (atnaujinama darbo gijoje, skaitoma UI gijoje)"""
+
+    def __init__(self, owner):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.owner = owner
+        self.status = "queued"  # queued -> running -> done / error
+        self.progress = 0.0
+        self.message = "⏳ Laukiama eilėje..."
+        self.partial = ""
+        self.streaming = False  # kuriami tekstai (tokenai atkeliauja dalimis)
+        self.analyses = []
+        self.warnings = []
+        self.result = None
+        self.error = None
+        self.trace = None
+        self.created = time.time()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def update(self, **fields):
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+
+    def warn(self, text):
+        with self._lock:
+            self.warnings.append(text)
+
+    def snapshot(self):
+        """Nuosekli būsenos kopija UI atvaizdavimui"""
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "progress": self.progress,
+                "message": self.message,
+                "partial": self.partial,
+                "analyses": list(self.analyses),
+                "warnings": list(self.warnings),
+                "result": self.result,
+                "error": self.error,
+            }
+
+
+class JobQueue:
+    """
+    Ribota darbų eilė fone:
+    - Bendra riba (max_pending) - viršijus naujas darbas atmetamas (JobQueueFull), o ne kaupiamas
+    - Riba sesijai (max_per_owner) - vienas vartotojas negali užimti visos eilės
+    - Baigti darbai laikomi retention_seconds, vėliau išmetami
+    """
+
+    def __init__(self, workers, max_pending, max_per_owner, retention_seconds):
+        self.max_pending = max_pending
+        self.max_per_owner = max_per_owner
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ai-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, owner, func, *args, **kwargs):
+        """Pateikia func(job, *args, **kwargs); grąžina AIJob arba kelia JobQueueFull"""
+        with self._lock:
+            self._prune()
+            active = [job for job in self._jobs.values() if job.active]
+            if sum(job.owner == owner for job in active) >= self.max_per_owner:
+                raise JobQueueFull("Jūsų ankstesnis AI darbas dar vykdomas")
+            if len(active) >= self.max_pending:
+                raise JobQueueFull("Serveris užimtas - per daug AI darbų eilėje")
+            job = AIJob(owner)
+            self._jobs[job.job_id] = job
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def _run(self, job, func, args, kwargs):
+        job.update(status="running", message="🚀 Pradedama...")
+        try:
+            # Darbo OpenAI užklausos planuoklyje priskiriamos jo sesijai (sąžininga eilė)
+            with session(job.owner):
+                result = func(job, *args, **kwargs)
+            job.update(status="done", result=result, progress=1.0)
+        except Exception as e:
+            logger.exception("AI darbas %s nepavyko", job.job_id)
+            job.update(status="error", error=str(e))
+        finally:
+            job.update(finished=time.time())
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def position(self, job):
+        """Kiek laukiančių darbų yra prieš šį (0 - vykdomas arba sekantis)"""
+        with self._lock:
+            return sum(other.status == "queued" and other.created < job.created for other in self._jobs.values())
+
+    def _prune(self):
+        """Išmeta senus baigtus darbus (kviečiama su užraktu)"""
+        cutoff = time.time() - self.retention_seconds
+        for job_id, job in list(self._jobs.items()):
+            if job.finished is not None and job.finished < cutoff:
+                del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in ("queued", "running", "done", "error")}
+
+
+# Bendra visoms sesijoms eilė (modulis importuojamas vieną kartą procesui)
+ai_jobs = JobQueue(AI_JOB_WORKERS, AI_JOB_QUEUE_SIZE, AI_JOB_MAX_PER_SESSION, AI_JOB_RETENTION_MINUTES * 60)
+
+
+def content_job(job, client, payloads, season, holiday, fast_mode=False, reuse_similar=False, fresh=False):
+    """
+    AI turinys fone: analizės, tekstai (tarpiniai rezultatai - job.partial) ir sezono taisyklių patikra.
+    payloads = [(nuotraukos nr., (base64, detail)), ...]; fresh - tekstai kuriami iš naujo (be talpyklos).
+    Grąžina {"captions", "analyses", "validation", "cached"}.
+    """
+    with trace("AI turinys") as current:
+        job.update(trace=current)
+        images = [payload for _i, payload in payloads]
+
+        if fast_mode:
+            # Greitas režimas - analizės ir tekstai viena užklausa
+            job.update(progress=0.5, message=f"⚡ Analizuojamos nuotraukos ir kuriamas turinys ({len(images)} nuotr., viena užklausa)...")
+            analyses, captions = analyze_and_caption(client, images, season, holiday)
+            job.update(analyses=analyses, partial=captions, message="🔎 Tikrinamos sezono ir šventės taisyklės...")
+            cached = False
+            try:
+                captions, validation = repair_captions(client, captions, season, holiday)
+            except Exception as e:
+                job.warn(f"⚠️ Nepavyko pataisyti tekstų: {e}")
+                validation = None
+        else:
+            job.update(message=f"🔍 Analizuojamos redaguotos nuotraukos (0/{len(images)})...")
+
+            def on_analysis_done(idx, done_count, error):
+                job.update(
+                    progress=done_count / (len(images) + 1),
+                    message=f"🔍 Analizuojamos redaguotos nuotraukos ({done_count}/{len(images)})..."
+                )
+                if error is not None:
+                    job.warn(f"❌ Klaida apdorojant nuotrauką {payloads[idx][0]+1}: {error}")
+
+            results = analyze_in_parallel(images, lambda payload: analyze_image(client, *payload, reuse_similar=reuse_similar), on_done=on_analysis_done)
+            analyses = [analysis for analysis, error in results if error is None]
+            if not analyses:
+                raise RuntimeError("Nepavyko išanalizuoti nė vienos nuotraukos")
+
+            # Tekstai (iš talpyklos arba nauji) - tarpinis rezultatas atnaujinamas vos atkeliauja tokenai
+            job.update(analyses=analyses, progress=1.0, streaming=True, message="✍️ Kuriamas turinys...")
+            captions, validation, cached = create_captions(
+                client, " ".join(analyses), season, holiday,
+                fresh=fresh, on_text=lambda text: job.update(partial=text)
+            )
+            job.update(streaming=False)
+            if validation is None:
+                job.warn("⚠️ Nepavyko patikrinti ir pataisyti tekstų pagal sezono taisykles")
+
+        return {"captions": captions, "analyses": analyses, "validation": validation, "cached": cached}
@@ -0,0 +1,32 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from instrumentation import propagate
+
+# Kiek vaizdų analizuojama vienu metu (galima keisti aplinkos kintamuoju)
+MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "4"))
+
+
+def analyze_in_parallel(payloads, analyze_fn, max_workers=None, on_done=None):
+    """
+    Lygiagrečiai paleidžia analyze_fn kiekvienam payload'ui (riboto dydžio gijų baseine).
+    - Rezultatai grąžinami ta pačia tvarka kaip payloads: [(analizė, klaida), ...]
+    - Klaida fiksuojama kiekvienai nuotraukai atskirai (kitos tęsiamos)
+    - on_done(index, done_count, error) kviečiamas iškvietėjo gijoje, vos baigus vieną
+      (todėl jame galima saugiai atnaujinti Streamlit progress bar)
+    - Gijos mato iškvietėjo diagnostikos matavimą (instrumentation.trace)
+    """
+    max_workers = max(1, min(max_workers or MAX_CONCURRENCY, len(payloads) or 1))
+    results = [(None, None)] * len(payloads)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analyze") as executor:
+        futures = {executor.submit(propagate(analyze_fn), payload): i for i, payload in enumerate(payloads)}
+        for done_count, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            try:
+                results[i] = (future.result(), None)
+            except Exception as e:
+                results[i] = (None, e)
+            if on_done:
+                on_done(i, done_count, results[i][1])
+
+    return results
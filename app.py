@@ -1,8 +1,38 @@
 import streamlit as st
-import io, os, base64
-from openai import OpenAI
+import io, os, time, uuid, hashlib, logging
 from dotenv import load_dotenv
-from PIL import Image, ImageDraw, ImageFont, ImageEnhance, ImageOps, ImageFilter
+from ai_cache import analysis_cache
+from similar_index import similar_index
+from openai_client import get_client
+from asset_store import SessionAssetStore, sweep_stale_sessions
+from content_ai import split_variants
+from ai_jobs import AI_JOB_POLL_SECONDS, AI_JOB_STREAM_POLL_SECONDS, JobQueueFull, ai_jobs, content_job
+from rate_limiter import scheduler
+from vision_payload import prepare_vision_payload
+from image_pipeline import AUTO_ENHANCE, render_overlay, render_overlay_image
+from image_hash import image_fingerprint, find_duplicates
+from instrumentation import stage
+from diagnostics import traced, remember_trace, diagnostics_panel
+from preview import COLLAGE_PREVIEW_EDGE, display_rendition, thumbnail_rendition, record_sent, begin_rerun_meter, end_rerun_meter, metered
+from collage import COLLAGE_STYLES, COLLAGE_LAYOUTS, COLLAGE_TILE_SIZE, build_collage, encode_collage
+from collage_compare import new_seed, render_style_thumbnails
+
+# Fragmentai (Streamlit >= 1.37) - senesnėse versijose sekcijos tiesiog vykdomos kartu su visu skriptu
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
+
+def polling_fragment(seconds):
+    """Fragmentas, perkraunamas kas `seconds` sekundžių (be fragmentų - perkraunamas visas puslapis)"""
+    native = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+    if native is not None:
+        return native(run_every=seconds)
+    
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            func(*args, **kwargs)
+            time.sleep(seconds)
+            st.rerun()
+        return wrapper
+    return decorator
 
 # Bandome importuoti camera input (jei neveiks, praleidžia)
 try:
@@ -13,6 +43,8 @@ except ImportError:
 
 # ---------- Nustatymai ----------
 load_dotenv()
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+begin_rerun_meter()
 
 # Version: 2.3 - Simplified, no AI editing
 # Bandome gauti API raktą iš .env failo (vietinis) arba Streamlit secrets (cloud)
@@ -28,7 +60,8 @@ if not api_key:
     st.error("❌ OpenAI API raktas nerastas! Patikrinkite konfigūraciją.")
     st.stop()
 
-client = OpenAI(api_key=api_key)
+# Bendras procesui klientas - HTTP jungtys išlieka tarp perkrovimų ir sesijų
+client = get_client(api_key)
 
 st.set_page_config(
     page_title="Žaliuzių turinio kūrėjas", 
@@ -47,100 +80,20 @@ def add_marketing_overlay(image_file, add_watermark=False, add_border=False, bri
     - Vandens ženklą (ryškų, baltą su šešėliu)
     - Rėmelį
     - Spalvų koregavimą (šviesumas, kontrastas, sodrumas)
+    Etapai talpinami (image_pipeline), todėl pakeitus vieną nustatymą
+    perskaičiuojami tik nuo jo priklausantys etapai.
     """
     try:
-        from PIL import ImageEnhance, ImageDraw, ImageFont, ImageFilter
-        
-        # Atidarome nuotrauką
-        img = Image.open(image_file)
-        
-        # Konvertuojame į RGB jei reikia
-        if img.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # Spalvų koregavimai
-        if brightness != 1.0:
-            enhancer = ImageEnhance.Brightness(img)
-            img = enhancer.enhance(brightness)
-        
-        if contrast != 1.0:
-            enhancer = ImageEnhance.Contrast(img)
-            img = enhancer.enhance(contrast)
-        
-        if saturation != 1.0:
-            enhancer = ImageEnhance.Color(img)
-            img = enhancer.enhance(saturation)
-        
-        # Pridedame rėmelį
-        if add_border:
-            from PIL import ImageOps
-            border_color = (255, 255, 255)  # Baltas rėmelis
-            border_width = 20
-            img = ImageOps.expand(img, border=border_width, fill=border_color)
-        
-        # Vandens ženklas (RYŠKUS IR REGULIUOJAMAS DYDIS)
-        if add_watermark and watermark_text:
-            draw = ImageDraw.Draw(img)
-            width, height = img.size
-            
-            # PAPRASTA formulė: watermark_size procentai tiesiai nuo mažesnio nuotraukos matmens
-            # pvz: 1000px nuotrauka, 80% slider → 800px šrifto aukštis (per didelis!)
-            # Geriau: 1000px, 80 slider → 80px šriftas (normalus)
-            # TIESIAI: slider reikšmė = px dydis
-            font_size = max(30, int(watermark_size))
-            
-            # Bandome įkelti geresnį fontą (PRIORITY: Bold)
-            font = None
-            font_paths = [
-                "C:/Windows/Fonts/arialbd.ttf",  # Arial Bold (Windows)
-                "C:/Windows/Fonts/arial.ttf",    # Arial Regular
-                "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",  # Linux Bold
-                "/System/Library/Fonts/Helvetica.ttc"  # Mac
-            ]
-            
-            for font_path in font_paths:
-                try:
-                    font = ImageFont.truetype(font_path, font_size)
-                    break
-                except:
-                    continue
-            
-            # Jei niekas neveikė - sukuriame DIDELĮ default
-            if font is None:
-                font = ImageFont.load_default()
-                # Default font nemažas - pakartojame tekstą kad būtų didesnis
-                watermark_text = watermark_text * 2
-            
-            # Pozicija - dešiniame apatiniame kampe
-            try:
-                text_bbox = draw.textbbox((0, 0), watermark_text, font=font)
-            except:
-                text_bbox = (0, 0, len(watermark_text) * 10, 20)
-            
-            text_width = text_bbox[2] - text_bbox[0]
-            text_height = text_bbox[3] - text_bbox[1]
-            
-            x = width - text_width - 30
-            y = height - text_height - 30
-            
-            # Piešiame STORESNI šešėlį (juodą)
-            for offset in [(3, 3), (2, 2), (1, 1), (4, 4)]:
-                draw.text((x + offset[0], y + offset[1]), watermark_text, fill=(0, 0, 0), font=font)
-            
-            # Piešiame BALTĄ RYŠKŲ tekstą
-            draw.text((x, y), watermark_text, fill=(255, 255, 255), font=font)
-        
-        # Išsaugome į bytes su AUKŠTA kokybe
-        output = io.BytesIO()
-        img.save(output, format='JPEG', quality=98, optimize=False)
-        output.seek(0)
-        return output
+        return io.BytesIO(render_overlay(
+            image_file,
+            add_watermark=add_watermark,
+            add_border=add_border,
+            brightness=brightness,
+            contrast=contrast,
+            saturation=saturation,
+            watermark_text=watermark_text,
+            watermark_size=watermark_size
+        ))
         
     except Exception as e:
         st.error(f"Klaida redaguojant nuotrauką: {e}")
@@ -149,196 +102,88 @@ def add_marketing_overlay(image_file, add_watermark=False, add_border=False, bri
         image_file.seek(0)
         return image_file
 
-def analyze_image(image_bytes):
-    """Naudoja GPT-4o-mini vaizdo analizei su konkrečiu produktų atpažinimu"""
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": """Tu esi langų uždangalų ir žaliuzių produktų atpažinimo EKSPERTAS. 
-Tavo užduotis - TIKSLIAI ir DETALIZUOTAI identifikuoti KIEKVIENĄ produktą nuotraukoje."""},
-            {"role": "user", "content": [
-                {"type": "text", "text": """Analizuok šią nuotrauką kaip ŽALIUZIŲ EKSPERTAS ir BŪTINAI nurodyk:
-
-1. **PRODUKTO TIPAS IR KIEKIS** (labai svarbu!):
-   ⚠️ Jei matai KELIS skirtingus produktus - BŪTINAI aprašyk KIEKVIENĄ ATSKIRAI!
-   Produktų tipai:
-   - Roletai (tekstiliniai, roll-up blinds)
-   - Roletai Diena-Naktis / Zebra (duo blinds su juostelėmis)
-   - Horizontalios žaliuzės / Venetian (horizontalios lamelės)
-   - Vertikalios žaliuzės (vertikalios lamelės)
-   - Plisuotos žaliuzės / Pleated (sulankstomos)
-   - Medinės žaliuzės / Wood blinds (medžio lamelės)
-   - Romanetės / Roman shades
-   - Lamelės / Panel blinds
-   - Užuolaidos / Curtains
-
-2. **SPALVOS, MEDŽIAGA, TEKSTŪRA**:
-   - Tikslios spalvos (balta, pilka, smėlio, mėlyna, etc.)
-   - Medžiaga (medis, audinys, PVC, aliuminis)
-   - Ar matinė, blizgi, skaidri, tamsinanti
-
-3. **MONTAVIMO VIETA IR KAMBARYS**:
-   - Kokio tipo kambarys (svetainė, miegamasis, virtuvė, biuras)
-   - Kaip sumontuota (sienoje, lubose, lange)
-
-4. **VIZUALINĖS DETALĖS**:
-   - Apšvietimas (dienos šviesa, dirbtinė)
-   - Interjero stilius
-   - Vandens ženklas ar tekstas (jei yra)
-   - Vaizdas pro langą
-
-PRIVALOMA: Pradėk aprašymą nuo TIKSLAUS produkto tipo. 
-Pavyzdys: "Nuotraukoje matosi TRYS SKIRTINGI PRODUKTAI: 1) PLISUOTOS ŽALIUZĖS pilkos spalvos, 2) MEDINĖS HORIZONTALIOS ŽALIUZĖS šviesaus ąžuolo, 3) ROLETAI DIENA-NAKTIS balti..." """},
-                {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64," + image_bytes}}
-            ]}
-        ],
-        max_tokens=500
-    )
-    return response.choices[0].message.content.strip()
-
-def generate_captions(analysis_text, season, holiday):
-    """Sukuria 3 teksto variantus lietuviškai pagal tikslią produkto analizę"""
-    
-    # ULTRA GRIEŽTA sezonų ir švenčių kontrolė
-    season_data = {
-        "Pavasaris": {
-            "must_have": ["pavasari", "atsinaujinim", "šviesi", "gaivu", "pavasario"],
-            "forbidden": ["žiem", "šalt", "snieg", "kalėd", "ruduo", "ruden", "vasara", "vasar", "karšt"],
-            "message": "pavasario gaivumą ir šviesumą"
-        },
-        "Vasara": {
-            "must_have": ["vasara", "vasar", "saulė", "šilum", "vėsin", "karšt"],
-            "forbidden": ["žiem", "šalt", "snieg", "kalėd", "pavasa", "ruduo", "ruden"],
-            "message": "vasaros šviesumą ir vėsumą"
-        },
-        "Ruduo": {
-            "must_have": ["ruden", "jauk", "šilt", "rudeni", "ruduo"],
-            "forbidden": ["žiem", "kalėd", "pavasa", "vasara", "karšt", "sniegas"],
-            "message": "rudenio jaukumą"
-        },
-        "Žiema": {
-            "must_have": ["žiem", "šalt", "šilum", "kalėd"],
-            "forbidden": ["pavasa", "vasara", "ruden", "karšt", "velyk"],
-            "message": "žiemos šilumą"
-        }
-    }
+# Kiek redaguotų nuotraukų laikoma registre (vienos sesijos ribose)
+RENDER_REGISTRY_SIZE = 16
+
+def upload_identity(image_file):
+    """Grąžina įkelto failo tapatybę: Streamlit file_id arba turinio maišą (kameros nuotraukoms)"""
+    file_id = getattr(image_file, "file_id", None)
+    if file_id:
+        return file_id
+    return hashlib.blake2b(image_file.getvalue(), digest_size=16).hexdigest()
+
+def session_assets():
+    """Sesijos nuotraukų saugykla diske (session_state laikomos tik rodyklės, žr. asset_store.py)"""
+    if "asset_store" not in st.session_state:
+        sweep_stale_sessions()
+        st.session_state.asset_store = SessionAssetStore()
+    return st.session_state.asset_store
+
+def clear_session_files(results=False):
+    """
+    Išvalo visas įkeltas nuotraukas (visų skirtukų rodykles ir sesijos saugyklą).
+    results=True - kartu išvalomi collage ir AI rezultatai.
+    """
+    st.session_state.uploaded_files = []
+    st.session_state.manual_files = []
+    st.session_state.camera_photos = []
+    st.session_state.render_registry = {}
+    session_assets().clear()
+    if results:
+        for key in ("collage_result", "collage_compare", "ai_content_result", "ai_validation",
+                    "ai_content_cached", "ai_job_id", "ai_job_error", "ai_job_warnings"):
+            st.session_state.pop(key, None)
+
+def collapse_duplicates(handles):
+    """
+    Ta pati nuotrauka per kelis skirtukus (ar jos perkoduota kopija) paliekama vieną kartą.
+    Grąžina (unikalios rodyklės, [(dublikatas, originalas), ...]).
+    """
+    assets = session_assets()
+    opened = [(handle, assets.open(handle)) for handle in handles]
+    opened = [(handle, file) for handle, file in opened if file is not None]
+    duplicates = find_duplicates([image_fingerprint(file) for _handle, file in opened])
+    unique = [handle for i, (handle, _file) in enumerate(opened) if i not in duplicates]
+    pairs = [(opened[i][0], opened[j][0]) for i, (j, _distance) in duplicates.items()]
+    return unique, pairs
+
+def render_edited(image_file, **overlay_params):
+    """
+    Grąžina redaguotą nuotrauką (failą iš sesijos saugyklos) pagal registrą.
+    Raktas = failo tapatybė + add_marketing_overlay parametrai, todėl peržiūra,
+    collage ir AI analizė naudoja tą patį rezultatą - nuotrauka apdorojama tik kartą.
+    """
+    registry = st.session_state.setdefault("render_registry", {})
+    assets = session_assets()
+    key = (upload_identity(image_file), tuple(sorted(overlay_params.items())))
     
-    # Švenčių kontrolė
-    holiday_data = {
-        "Velykos": {
-            "must_have": ["velyk", "velykini", "pavasari"],
-            "forbidden": ["kalėd", "nauj metin", "žiem"],
-            "keywords": "Velykų, pavasario šventės, šeimos susibūrimas"
-        },
-        "Šv. Kalėdos": {
-            "must_have": ["kalėd", "švent", "žiem"],
-            "forbidden": ["velyk", "pavasa", "vasara"],
-            "keywords": "Kalėdų, žiemos švenčių, dovanų"
-        },
-        "Kūčios": {
-            "must_have": ["kūč", "kalėd", "žiem"],
-            "forbidden": ["velyk", "pavasa"],
-            "keywords": "Kūčių, šventinės vakarienės, šeimos"
-        },
-        "Šv. Valentino diena": {
-            "must_have": ["valentin", "meilė"],
-            "forbidden": ["kalėd", "velyk"],
-            "keywords": "Valentino dienos, meilės, romantikos"
-        }
-    }
+    # Perkeliame į galą - seniausiai naudoti išmetami pirmi
+    handle = registry.pop(key, None)
+    edited = assets.open(handle) if handle else None
     
-    current_season = season_data.get(season, season_data["Pavasaris"])
-    current_holiday = holiday_data.get(holiday, None) if holiday != "Nėra" else None
-    
-    # Sukuriame ULTRA GRIEŽTĄ prompt'ą
-    forbidden_list = current_season["forbidden"].copy()
-    must_have_list = current_season["must_have"].copy()
-    
-    if current_holiday:
-        forbidden_list.extend(current_holiday["forbidden"])
-        must_have_list.extend(current_holiday["must_have"])
-        holiday_text = f"""
-🎄 PRIVALOMA ŠVENTĖ: {holiday}
-Kiekviename tekste TURI būti: {current_holiday["keywords"]}
-NIEKADA nerašyk apie: {', '.join(current_holiday["forbidden"])}
-"""
-    else:
-        holiday_text = "Šventės nėra - nerašyk apie jokias šventes!"
-    
-    prompt = f"""KRITIŠKAI SVARBU! Perskaityk šias taisykles 3 KARTUS prieš rašydamas:
-
-═══════════════════════════════════════
-🚨 ABSOLIUČIOS TAISYKLĖS (NEGALIMA PAŽEISTI!) 🚨
-═══════════════════════════════════════
-
-📅 SEZONAS: {season.upper()}
-✅ PRIVALOMA naudoti šiuos žodžius: {', '.join(must_have_list)}
-❌ GRIEŽTAI DRAUDŽIAMA naudoti: {', '.join(forbidden_list)}
-
-{holiday_text}
-
-📋 PRODUKTAI (iš nuotraukų):
-{analysis_text}
-
-═══════════════════════════════════════
-📝 UŽDUOTIS: Sukurk 3 tekstus (iki 250 simbolių kiekvienas)
-═══════════════════════════════════════
-
-**TEKSTO PAVYZDYS KĄ RAŠYTI:**
-"Pavasario gaivumas su mūsų žaliuzėmis! 🌸 Šviesios spalvos, atsinaujinimas, nauji sprendimai Velykų proga!"
-
-**TEKSTO PAVYZDYS KO NERAŠYTI:**
-"Žiemos šiluma..." ❌ (jei sezonas PAVASARIS!)
-"Kalėdų dovanos..." ❌ (jei šventė VELYKOS!)
-
-═══════════════════════════════════════
-
-VARIANTAS 1 - MARKETINGINIS 💼
-- Profesionalus tonas
-- Produktų privalumai + {current_season["message"]}
-{f"- {holiday} šventės kontekstas" if holiday != "Nėra" else ""}
-- 2-3 hashtag'us
-
-VARIANTAS 2 - DRAUGIŠKAS 🏡
-- Šiltas tonas
-- Praktiška nauda + {current_season["message"]}
-{f"- {holiday} jaukumas" if holiday != "Nėra" else ""}
-- 1-2 hashtag'us
-
-VARIANTAS 3 - SU HUMORU 😄
-- Linksmas tonas
-- Juokas + {current_season["message"]}
-{f"- {holiday} su šypsena" if holiday != "Nėra" else ""}
-- 2-3 hashtag'us
-
-═══════════════════════════════════════
-⚠️ PRIEŠ SIŲSDAMAS ATSAKYMĄ - PATIKRINK:
-═══════════════════════════════════════
-1. Ar KIEKVIENAME tekste yra bent vienas iš: {', '.join(must_have_list[:3])}?
-2. Ar NĖRA nei vieno iš: {', '.join(forbidden_list[:5])}?
-3. Ar produktai paminėti tiksliais pavadinimais?
-
-Jei bent vienas patikrinimas FAILED - PERRAŠYK tekstus!
-
-Atskirk variantus su "---"
-Rašyk LIETUVIŠKAI.
-"""
-    
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": f"Tu esi AI asistentas. ABSOLIUTI TAISYKLĖ: Dabar yra {season} sezonas{f' ir {holiday} šventė' if holiday != 'Nėra' else ''}. Tu NIEKADA nerašai apie kitus sezonus ar šventes. Jei bandysi pažeisti - tekstas bus atmestas."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.5,  # DAR sumažinta - maksimalus tikslumas
-        max_tokens=1200
-    )
-    return response.choices[0].message.content.strip()
+    if edited is None:
+        image_file.seek(0)
+        rendered = add_marketing_overlay(image_file, **overlay_params)
+        if rendered is image_file:
+            # Klaida redaguojant - originalo į registrą nededame
+            image_file.seek(0)
+            return image_file
+        
+        handle = assets.put(rendered.getvalue(), name=getattr(image_file, "name", None))
+        edited = assets.open(handle)
+        if edited is None:
+            # Netilpo į sesijos biudžetą - grąžiname tiesiogiai
+            return rendered
+    
+    registry[key] = handle
+    while len(registry) > RENDER_REGISTRY_SIZE:
+        registry.pop(next(iter(registry)))
+    return edited
 
-def image_to_base64(image_file):
-    """Konvertuoja įkeltą failą į base64 be kompresijos"""
-    image_file.seek(0)
-    return base64.b64encode(image_file.read()).decode()
+def show_image(data, **kwargs):
+    """st.image su apskaita - kiek vaizdų baitų išsiunčiama naršyklei per perkrovimą"""
+    record_sent(len(data))
+    st.image(data, **kwargs)
 
 # ---------- Pagrindinis UI ----------
 st.sidebar.header("⚙️ Nustatymai")
@@ -359,6 +204,16 @@ holiday = st.sidebar.selectbox(
 )
 
 auto_process = st.sidebar.checkbox("🤖 Automatinis apdorojimas", value=True)
+fast_mode = st.sidebar.checkbox(
+    "⚡ Greitas režimas (viena AI užklausa)",
+    value=False,
+    help="Visos nuotraukos ir tekstų nurodymai siunčiami viena užklausa - greičiau kasdieniams įrašams, bet tekstai nerodomi rašymo metu"
+)
+reuse_similar = st.sidebar.checkbox(
+    "♻️ Naudoti panašių nuotraukų analizes",
+    value=False,
+    help="Jei beveik tokia pati ir tų pačių spalvų nuotrauka (tas pats produktas, vitrina) jau buvo analizuota - naudojama jos analizė, be naujos AI užklausos"
+)
 
 st.sidebar.markdown("---")
 st.sidebar.markdown("### 🎨 Marketinginis redagavimas")
@@ -380,9 +235,9 @@ auto_enhance = st.sidebar.checkbox("✨ AUTO spalvų optimizacija", value=True,
 if auto_enhance:
     st.sidebar.info("💡 Automatinė optimizacija įjungta - nuotraukos bus pagerintos!")
     # Automatiniai nustatymai marketinginėms nuotraukoms
-    brightness = 1.1  # Šiek tiek šviesiau
-    contrast = 1.15   # Ryškesnis kontrastas
-    saturation = 1.1  # Sodresni spalvos
+    brightness = AUTO_ENHANCE["brightness"]  # Šiek tiek šviesiau
+    contrast = AUTO_ENHANCE["contrast"]      # Ryškesnis kontrastas
+    saturation = AUTO_ENHANCE["saturation"]  # Sodresni spalvos
 else:
     st.sidebar.markdown("**Rankinė spalvų korekcija:**")
     brightness = st.sidebar.slider("☀️ Šviesumas", 0.5, 1.5, 1.0, 0.05, help="<1.0 tamsiau, >1.0 šviesiau")
@@ -391,6 +246,9 @@ else:
 
 st.sidebar.markdown("---")
 st.sidebar.markdown("💡 **Patarimas:** Įkelkite ryškias, kokybiškas nuotraukas su žaliuzėmis ar roletais.")
+st.sidebar.caption(f"🗄️ Analizių talpykla: {analysis_cache.hits} pataikymai / {analysis_cache.misses} praleidimai")
+similar_stats = similar_index.stats()
+st.sidebar.caption(f"♻️ Panašios nuotraukos: {similar_stats['hits']} / {similar_stats['hits'] + similar_stats['misses']} ({similar_stats['hit_rate']:.0%})")
 
 # Failų įkėlimas
 
@@ -442,6 +300,7 @@ st.markdown("### 📸 Įkelkite nuotraukas")
 tab1, tab2, tab3 = st.tabs(["📁 Failų įkėlimas", "📷 Kamera", "🔧 Rankiniu būdu"])
 
 uploaded_files = []
+assets = session_assets()
 
 with tab1:
     st.markdown("**Standartinis būdas** (veikia PC ir kai kuriuose telefonuose)")
@@ -452,7 +311,7 @@ with tab1:
         key="standard_uploader"
     )
     if files_standard:
-        uploaded_files.extend(files_standard)
+        uploaded_files.extend(assets.put_upload(file) for file in files_standard)
         st.success(f"✅ Įkelta {len(files_standard)} nuotraukų!")
 
 with tab2:
@@ -462,26 +321,23 @@ with tab2:
         # Patikrinimas ar veikia kamera
         camera_photo = camera_input_live()
         if camera_photo is not None:
-            st.image(camera_photo, caption="Užfiksuota nuotrauka")
+            # Konvertuojame PIL image į bytes (peržiūrai ir saugyklai)
+            img_bytes = io.BytesIO()
+            camera_photo.save(img_bytes, format='JPEG')
+            show_image(display_rendition(img_bytes.getvalue()), caption="Užfiksuota nuotrauka")
             
             if st.button("📸 Pridėti šią nuotrauką", key="add_camera"):
-                # Konvertuojame PIL į UploadedFile formato objektą
                 if "camera_photos" not in st.session_state:
                     st.session_state.camera_photos = []
                 
-                # Konvertuojame PIL image į bytes
-                img_bytes = io.BytesIO()
-                camera_photo.save(img_bytes, format='JPEG')
-                img_bytes.seek(0)
-                
-                st.session_state.camera_photos.append(img_bytes.getvalue())
+                st.session_state.camera_photos.append(assets.put(img_bytes.getvalue(), name="kamera.jpg", pinned=True))
                 st.success("📸 Nuotrauka pridėta!")
                 st.rerun()
         
         # Rodyti pridėtas nuotraukas iš kameros
         if "camera_photos" in st.session_state and st.session_state.camera_photos:
             st.info(f"🖼️ Pridėta iš kameros: {len(st.session_state.camera_photos)} nuotraukų")
-            uploaded_files.extend([io.BytesIO(photo) for photo in st.session_state.camera_photos])
+            uploaded_files.extend(st.session_state.camera_photos)
     else:
         st.error("📷 Kameros komponentas nepasiekiamas. Naudokite kitus būdus.")
 
@@ -501,7 +357,7 @@ with tab3:
         
         col1, col2 = st.columns([1,1])
         with col1:
-            st.image(single_file, caption="Peržiūra", width=200)
+            show_image(thumbnail_rendition(single_file, 200), caption="Peržiūra", width=200)
             st.caption(f"📏 Dydis: {file_size_mb:.2f} MB")
         with col2:
             if st.button("➕ Pridėti šią nuotrauką", key="add_single"):
@@ -509,7 +365,7 @@ with tab3:
                     st.session_state.manual_files = []
                 
                 if len(st.session_state.manual_files) < 4:
-                    st.session_state.manual_files.append(single_file)
+                    st.session_state.manual_files.append(assets.put_upload(single_file))
                     st.success(f"Pridėta! Iš viso: {len(st.session_state.manual_files)}")
                     st.rerun()
                 else:
@@ -522,14 +378,21 @@ with tab3:
         
         # Preview mažų nuotraukų
         cols = st.columns(4)
-        for i, file in enumerate(st.session_state.manual_files):
+        for i, file in enumerate(assets.open_all(st.session_state.manual_files)):
             with cols[i]:
-                st.image(file, width=100)
+                show_image(thumbnail_rendition(file, 100), width=100)
         
         if st.button("🗑️ Išvalyti visas rankiniu būdu pridėtas", key="clear_manual"):
             st.session_state.manual_files = []
             st.rerun()
 
+# Pasikartojančios nuotraukos (pvz. ta pati per failų ir rankinį skirtuką) - tik vieną kartą
+uploaded_files, duplicate_uploads = collapse_duplicates(uploaded_files)
+if duplicate_uploads:
+    st.info("🔁 Pasikartojančios nuotraukos praleistos: " + ", ".join(
+        f"{duplicate.name} (= {original.name})" for duplicate, original in duplicate_uploads
+    ))
+
 # Mobilus failų valdymas
 if uploaded_files:
     st.session_state.uploaded_files = uploaded_files
@@ -538,9 +401,9 @@ if uploaded_files:
     # Rodyti preview
     if len(uploaded_files) <= 4:
         cols = st.columns(len(uploaded_files))
-        for i, file in enumerate(uploaded_files):
+        for i, file in enumerate(assets.open_all(uploaded_files)):
             with cols[i]:
-                st.image(file, caption=f"#{i+1}", width=150)
+                show_image(thumbnail_rendition(file, 150), caption=f"#{i+1}", width=150)
     else:
         st.warning("⚠️ Per daug nuotraukų! Bus naudojamos tik pirmosios 4.")
         uploaded_files = uploaded_files[:4]
@@ -552,50 +415,37 @@ elif "uploaded_files" not in st.session_state:
 # Globalus išvalymo mygtukas
 if st.session_state.uploaded_files:
     if st.button("🗑️ Išvalyti VISAS nuotraukas", type="secondary", key="clear_all"):
-        st.session_state.uploaded_files = []
-        if "manual_files" in st.session_state:
-            st.session_state.manual_files = []
-        if "camera_photos" in st.session_state:
-            st.session_state.camera_photos = []
+        clear_session_files()
         st.rerun()
 
 # Rodyti instrukcijas jei nėra failų
 if not st.session_state.uploaded_files:
     st.info("👆 **Pasirinkite vieną iš būdų aukščiau įkelti nuotraukas**")
 
-# Naudojame session_state failus
-files_to_process = st.session_state.uploaded_files
+# ---------- UI sekcijos ----------
+# Kiekviena sekcija - atskiras fragmentas su aiškiomis įvestimis: sąveika su vienos
+# sekcijos valdikliais (collage stilius, atsisiuntimas, AI mygtukas) perkrauna tik ją.
 
-if files_to_process:
-    st.success(f"✅ Įkelta {len(files_to_process)} nuotraukų!")
-    
-    # Rodyti ir leisti atsisiųsti kiekvieną nuotrauką atskirai
+@fragment
+@metered("peržiūra")
+@traced("peržiūra", only_computed=True)
+def preview_section(files, overlay):
+    """Redaguotų nuotraukų peržiūra ir atsisiuntimas"""
     st.markdown("### 🎨 Redaguotos nuotraukos")
     st.info("Reguliuokite redagavimo nustatymus šoniniame meniu (šviesumas, kontrastas, vandens ženklas)")
     
-    cols = st.columns(min(len(files_to_process), 4))
-    for i, file in enumerate(files_to_process):
+    cols = st.columns(min(len(files), 4))
+    for i, file in enumerate(files):
         with cols[i % 4]:
-            file.seek(0)
-            
             # SVARBU: Vandens ženklas tik ant paskutinės nuotraukos (jei jų daugiau nei 1)
-            show_watermark = add_watermark and (len(files_to_process) == 1 or i == len(files_to_process) - 1)
+            show_watermark = overlay["add_watermark"] and (len(files) == 1 or i == len(files) - 1)
             
-            # Redaguojame nuotrauką
-            edited = add_marketing_overlay(
-                file,
-                add_watermark=show_watermark,
-                add_border=add_border,
-                brightness=brightness,
-                contrast=contrast,
-                saturation=saturation,
-                watermark_text=watermark_text,
-                watermark_size=watermark_size
-            )
+            # Redaguojame nuotrauką (rezultatas išsaugomas registre AI analizei)
+            edited = render_edited(file, **dict(overlay, add_watermark=show_watermark))
             edited.seek(0)
             
-            # Rodyti peržiūrą
-            st.image(edited, caption=f"Nuotrauka {i+1}", use_container_width=True)
+            # Rodyti peržiūrą - sumažinta versija (pilna kokybė - tik atsisiuntimui)
+            show_image(display_rendition(edited), caption=f"Nuotrauka {i+1}", use_container_width=True)
             
             # Download mygtukas kiekvienai nuotraukai
             filename = getattr(file, 'name', f'nuotrauka_{i+1}.jpg')
@@ -610,8 +460,42 @@ if files_to_process:
                 key=f"download_{i}",
                 use_container_width=True
             )
+
+def collage_tiles(files, overlay):
+    """Collage plytelės: sumažinta raiška, be rėmelio, vandens ženklas - tik paskutinei nuotraukai"""
+    edited_images = []
+    for idx, file in enumerate(files):
+        # SVARBU: Vandens ženklas tik ant paskutinės nuotraukos collage
+        show_watermark = overlay["add_watermark"] and (idx == len(files) - 1)
+        
+        # Plytelės dekoduojamos iškart sumažinta raiška (pilna reikalinga tik atsisiuntimui)
+        img = render_overlay_image(
+            file,
+            (COLLAGE_TILE_SIZE, COLLAGE_TILE_SIZE),
+            **dict(overlay, add_watermark=show_watermark, add_border=False)  # Collage'ui be rėmelio
+        )
+        edited_images.append(img)
+    return edited_images
+
+def make_collage(files, overlay, collage_style, collage_layout, season, holiday, seed=None):
+    """Pilno dydžio collage -> sesijos saugykla (session_state - tik rodyklė)"""
+    edited_images = collage_tiles(files, overlay)
+    
+    # Sudedame collage pagal stilių ir išdėstymą (žr. collage.py)
+    with stage("collage_compose", style=collage_style, layout=collage_layout):
+        collage = build_collage(edited_images, collage_style, collage_layout, season, holiday, seed=seed)
     
-    # COLLAGE KŪRIMAS
+    with stage("collage_encode") as entry:
+        collage_bytes = encode_collage(collage)
+        entry["bytes_out"] = len(collage_bytes)
+    
+    st.session_state.collage_result = session_assets().put(collage_bytes, name="collage.jpg", pinned=True)
+    st.session_state.collage_filename = f"collage_{season}_{holiday}.jpg"
+
+@fragment
+@metered("collage")
+def collage_section(files, overlay, season, holiday):
+    """Collage kūrimas ir rezultatas"""
     st.markdown("---")
     st.markdown("### 🖼️ Collage Kūrėjas")
     
@@ -623,368 +507,323 @@ if files_to_process:
     
     st.info(f"✨ Automatinė tema: **{auto_theme}** (pagal jūsų nustatymus kairėje)")
     
-    if len(files_to_process) >= 2:
+    if len(files) >= 2:
         # Stilius pasirinkimas
         collage_style = st.selectbox(
             "🎨 Collage stilius:",
-            [
-                "📸 Polaroid - Nuotraukos su baltais rėmeliais, pasuktos",
-                "📱 Instagram Grid - Tvarkingas tinklelis su tarpais",
-                "🎨 Scrapbook - Kūrybiškas, atsitiktinis išdėstymas",
-                "🖼️ Gallery Wall - Galerijos siena su juodais rėmeliais",
-                "✨ Minimalist - Minimalus stilius, baltas fonas"
-            ],
+            COLLAGE_STYLES,
             help="Pasirinkite collage stilių",
             key="collage_style_selector"
         )
         
         collage_layout = st.selectbox(
             "📐 Išdėstymas:",
-            ["2x2 Grid (4 nuotraukos)", "1x2 Horizontal (2 nuotraukos)", "2x1 Vertical (2 nuotraukos)", "1x3 Horizontal (3 nuotraukos)", "3x1 Vertical (3 nuotraukos)"],
+            COLLAGE_LAYOUTS,
             help="Pasirinkite kaip išdėstyti nuotraukas"
         )
         
-        if st.button("🎨 Sukurti Collage", type="primary", use_container_width=True):
-            with st.spinner("🖼️ Kuriamas tematinis collage..."):
+        col_create, col_compare = st.columns(2)
+        with col_create:
+            create_clicked = st.button("🎨 Sukurti Collage", type="primary", use_container_width=True)
+        with col_compare:
+            compare_clicked = st.button(
+                "🔍 Palyginti visus stilius",
+                use_container_width=True,
+                help="Visi stiliai mažomis miniatiūromis vienu metu - pilno dydžio collage kuriamas tik pasirinktam"
+            )
+        
+        if create_clicked:
+            with st.spinner("🖼️ Kuriamas tematinis collage..."), traced("collage"):
                 try:
-                    # Paruošiame redaguotas nuotraukas
-                    edited_images = []
-                    for idx, file in enumerate(files_to_process):
-                        file.seek(0)
-                        
-                        # SVARBU: Vandens ženklas tik ant paskutinės nuotraukos collage
-                        show_watermark = add_watermark and (idx == len(files_to_process) - 1)
-                        
-                        edited = add_marketing_overlay(
-                            file,
-                            add_watermark=show_watermark,
-                            add_border=False,  # Collage'ui be rėmelio
-                            brightness=brightness,
-                            contrast=contrast,
-                            saturation=saturation,
-                            watermark_text=watermark_text,
-                            watermark_size=watermark_size
-                        )
-                        edited.seek(0)
-                        img = Image.open(edited)
-                        edited_images.append(img)
-                    
-                    # Nustatome layout
-                    if "2x2" in collage_layout:
-                        rows, cols = 2, 2
-                        needed = 4
-                    elif "1x2" in collage_layout:
-                        rows, cols = 1, 2
-                        needed = 2
-                    elif "2x1" in collage_layout:
-                        rows, cols = 2, 1
-                        needed = 2
-                    elif "1x3" in collage_layout:
-                        rows, cols = 1, 3
-                        needed = 3
-                    elif "3x1" in collage_layout:
-                        rows, cols = 3, 1
-                        needed = 3
-                    
-                    # Apkarpome jei per daug
-                    edited_images = edited_images[:needed]
-                    
-                    # Jei per mažai - dubliuojame
-                    while len(edited_images) < needed:
-                        edited_images.append(edited_images[-1])
-                    
-                    import random
-                    
-                    # NUSTATOME STILIŲ PAGAL PASIRINKIMĄ
-                    
-                    # Automatiškai nustatome fono spalvą pagal sezoną/šventę
-                    if holiday != "Nėra":
-                        if "Kalėdos" in holiday:
-                            bg_color = (235, 245, 240)
-                        elif "Velykos" in holiday:
-                            bg_color = (255, 250, 235)
-                        elif "Valentino" in holiday:
-                            bg_color = (255, 245, 248)
-                        elif "Naujieji" in holiday:
-                            bg_color = (240, 245, 255)
-                        else:
-                            bg_color = (245, 245, 240)
-                    else:
-                        if season == "Pavasaris":
-                            bg_color = (248, 252, 245)
-                        elif season == "Vasara":
-                            bg_color = (255, 252, 240)
-                        elif season == "Ruduo":
-                            bg_color = (250, 245, 235)
-                        else:
-                            bg_color = (245, 248, 252)
-                    
-                    # ============ POLAROID STILIUS ============
-                    if "Polaroid" in collage_style:
-                        polaroid_width = 500
-                        polaroid_height = 500
-                        border_size = 20
-                        bottom_border = 60
-                        
-                        if needed == 4:
-                            canvas_width, canvas_height = 1800, 1800
-                            positions = [(200, 150, -8), (850, 100, 12), (300, 850, 5), (950, 900, -10)]
-                        elif needed == 3:
-                            canvas_width, canvas_height = 2000, 1200
-                            positions = [(200, 250, -10), (750, 150, 8), (450, 700, -5)]
-                        else:
-                            canvas_width, canvas_height = 1600, 1200
-                            positions = [(250, 300, -12), (850, 350, 8)]
-                        
-                        collage = Image.new('RGB', (canvas_width, canvas_height), bg_color)
-                        
-                        for idx, img in enumerate(edited_images[:needed]):
-                            img_resized = img.resize((polaroid_width, polaroid_height), Image.Resampling.LANCZOS)
-                            polaroid_img = Image.new('RGB', 
-                                (polaroid_width + border_size * 2, 
-                                 polaroid_height + border_size + bottom_border), 
-                                (255, 255, 255))
-                            polaroid_img.paste(img_resized, (border_size, border_size))
-                            
-                            x, y, angle = positions[idx]
-                            rotated = polaroid_img.rotate(angle, expand=True, fillcolor=bg_color)
-                            collage.paste(rotated, (x, y))
-                    
-                    # ============ INSTAGRAM GRID STILIUS ============
-                    elif "Instagram Grid" in collage_style:
-                        img_size = 600
-                        gap = 30
-                        
-                        canvas_width = cols * img_size + (cols + 1) * gap
-                        canvas_height = rows * img_size + (rows + 1) * gap
-                        
-                        collage = Image.new('RGB', (canvas_width, canvas_height), bg_color)
-                        
-                        idx = 0
-                        for row in range(rows):
-                            for col in range(cols):
-                                if idx < len(edited_images):
-                                    img_resized = edited_images[idx].resize((img_size, img_size), Image.Resampling.LANCZOS)
-                                    x = gap + col * (img_size + gap)
-                                    y = gap + row * (img_size + gap)
-                                    collage.paste(img_resized, (x, y))
-                                    idx += 1
-                    
-                    # ============ SCRAPBOOK STILIUS ============
-                    elif "Scrapbook" in collage_style:
-                        if needed == 4:
-                            canvas_width, canvas_height = 1900, 1900
-                        elif needed == 3:
-                            canvas_width, canvas_height = 2100, 1300
-                        else:
-                            canvas_width, canvas_height = 1700, 1300
-                        
-                        collage = Image.new('RGB', (canvas_width, canvas_height), bg_color)
-                        
-                        # Atsitiktiniai dydžiai ir pozicijos
-                        for idx, img in enumerate(edited_images[:needed]):
-                            size_var = random.randint(450, 650)
-                            img_resized = img.resize((size_var, size_var), Image.Resampling.LANCZOS)
-                            
-                            # Pridedame atsitiktinį rėmelį
-                            border_color = random.choice([(255,255,255), (250,250,240), (245,240,235)])
-                            border_width = random.randint(15, 35)
-                            bordered = ImageOps.expand(img_resized, border=border_width, fill=border_color)
-                            
-                            # Atsitiktinė pozicija ir kampas
-                            max_x = canvas_width - bordered.width - 100
-                            max_y = canvas_height - bordered.height - 100
-                            x = random.randint(50, max(51, max_x))
-                            y = random.randint(50, max(51, max_y))
-                            angle = random.randint(-15, 15)
-                            
-                            rotated = bordered.rotate(angle, expand=True, fillcolor=bg_color)
-                            collage.paste(rotated, (x, y))
-                    
-                    # ============ GALLERY WALL STILIUS ============
-                    elif "Gallery Wall" in collage_style:
-                        img_size = 550
-                        gap = 40
-                        
-                        canvas_width = cols * img_size + (cols + 1) * gap
-                        canvas_height = rows * img_size + (rows + 1) * gap
-                        
-                        collage = Image.new('RGB', (canvas_width, canvas_height), (240, 240, 240))
-                        
-                        idx = 0
-                        for row in range(rows):
-                            for col in range(cols):
-                                if idx < len(edited_images):
-                                    img_resized = edited_images[idx].resize((img_size, img_size), Image.Resampling.LANCZOS)
-                                    # Juodas rėmelis
-                                    framed = ImageOps.expand(img_resized, border=15, fill=(20, 20, 20))
-                                    x = gap + col * (img_size + gap)
-                                    y = gap + row * (img_size + gap)
-                                    collage.paste(framed, (x, y))
-                                    idx += 1
-                    
-                    # ============ MINIMALIST STILIUS ============
-                    elif "Minimalist" in collage_style:
-                        img_size = 600
-                        gap = 60
-                        
-                        canvas_width = cols * img_size + (cols + 1) * gap
-                        canvas_height = rows * img_size + (rows + 1) * gap
-                        
-                        collage = Image.new('RGB', (canvas_width, canvas_height), (255, 255, 255))
-                        
-                        idx = 0
-                        for row in range(rows):
-                            for col in range(cols):
-                                if idx < len(edited_images):
-                                    img_resized = edited_images[idx].resize((img_size, img_size), Image.Resampling.LANCZOS)
-                                    # Labai plonas pilkas rėmelis
-                                    framed = ImageOps.expand(img_resized, border=2, fill=(200, 200, 200))
-                                    x = gap + col * (img_size + gap)
-                                    y = gap + row * (img_size + gap)
-                                    collage.paste(framed, (x, y))
-                                    idx += 1
-                    
-                    # Išsaugome
-                    collage_bytes = io.BytesIO()
-                    collage.save(collage_bytes, format='JPEG', quality=95)
-                    collage_bytes.seek(0)
-                    
-                    # Išsaugome į session_state
-                    st.session_state.collage_result = collage_bytes.getvalue()
-                    st.session_state.collage_filename = f"collage_{season}_{holiday}.jpg"
-                    
+                    make_collage(files, overlay, collage_style, collage_layout, season, holiday)
                 except Exception as e:
                     st.error(f"❌ Klaida kuriant collage: {str(e)}")
                     import traceback
                     st.error(traceback.format_exc())
+        
+        if compare_clicked:
+            with st.spinner("🖼️ Kuriamos visų stilių miniatiūros..."), traced("collage palyginimas"):
+                try:
+                    # Plytelės paruošiamos vieną kartą - visi stiliai kuriami iš jų lygiagrečiai
+                    edited_images = collage_tiles(files, overlay)
+                    seed = new_seed()
+                    with stage("collage_compare", layout=collage_layout, styles=len(COLLAGE_STYLES)) as entry:
+                        thumbnails = render_style_thumbnails(edited_images, collage_layout, season, holiday, seed)
+                        entry["bytes_out"] = sum(len(data) for data in thumbnails.values())
+                    
+                    assets = session_assets()
+                    st.session_state.collage_compare = {
+                        "layout": collage_layout,
+                        "season": season,
+                        "holiday": holiday,
+                        "seed": seed,
+                        "thumbnails": {
+                            style: assets.put(data, name=f"collage_palyginimas_{i}.jpg")
+                            for i, (style, data) in enumerate(thumbnails.items())
+                        },
+                    }
+                except Exception as e:
+                    st.error(f"❌ Klaida kuriant stilių palyginimą: {str(e)}")
+        
+        # Stilių palyginimas - pasirinktam stiliui kuriamas pilnas collage (tas pats išdėstymas ir sėkla)
+        comparison = st.session_state.get("collage_compare")
+        if comparison:
+            st.markdown(f"#### 🔍 Stilių palyginimas ({comparison['layout'].split(' ')[0]})")
+            cols = st.columns(len(comparison["thumbnails"]))
+            for i, (style, handle) in enumerate(comparison["thumbnails"].items()):
+                thumbnail = session_assets().open(handle)
+                if thumbnail is None:
+                    continue
+                with cols[i]:
+                    show_image(thumbnail.getvalue(), caption=style.split(" - ")[0], use_container_width=True)
+                    pick_clicked = st.button("✅ Rinktis", key=f"pick_collage_style_{i}", use_container_width=True)
+                if pick_clicked:
+                    with st.spinner("🖼️ Kuriamas pasirinkto stiliaus collage..."), traced("collage"):
+                        try:
+                            make_collage(
+                                files, overlay, style, comparison["layout"],
+                                comparison["season"], comparison["holiday"], seed=comparison["seed"]
+                            )
+                        except Exception as e:
+                            st.error(f"❌ Klaida kuriant collage: {str(e)}")
     else:
         st.warning("⚠️ Collage reikia bent 2 nuotraukų!")
     
     # Rodyti collage rezultatą (jei sukurtas)
+    collage_file = None
     if "collage_result" in st.session_state and st.session_state.collage_result:
+        collage_file = session_assets().open(st.session_state.collage_result)
+    
+    if collage_file is not None:
         st.markdown("---")
         st.markdown("### ✅ Sukurtas Collage")
-        st.image(st.session_state.collage_result, caption="Jūsų Collage", use_container_width=True)
+        show_image(
+            display_rendition(collage_file, COLLAGE_PREVIEW_EDGE),
+            caption="Jūsų Collage",
+            use_container_width=True
+        )
         
         st.download_button(
             label="📥 Atsisiųsti Collage",
-            data=st.session_state.collage_result,
+            data=collage_file.getvalue(),
             file_name=st.session_state.collage_filename,
             mime="image/jpeg",
             use_container_width=True,
             key="download_collage_persistent"
         )
-    
-    # AI TURINIO GENERAVIMAS
-    st.markdown("---")
-    st.markdown("### 📝 AI Turinio Generavimas")
-    st.info("💡 Sukurkite tekstus socialiniams tinklams pagal jūsų nuotraukas")
-    
-    # Mygtukas čia
-    if st.button("🚀 Sukurti AI Turinį", type="primary", use_container_width=True, key="create_ai_content_btn"):
-        st.session_state.trigger_ai_content = True
-    
-    # Mygtukas išvalyti failus
-    st.markdown("---")
-    if st.button("🗑️ Išvalyti visus failus ir rezultatus", type="secondary", use_container_width=True):
-        st.session_state.uploaded_files = []
-        if "collage_result" in st.session_state:
-            del st.session_state.collage_result
-        if "ai_content_result" in st.session_state:
-            del st.session_state.ai_content_result
-        st.rerun()
-    
-    if len(files_to_process) > 4:
-        st.warning("⚠️ Per daug failų! Pasirinkite iki 4 nuotraukų.")
-        files_to_process = files_to_process[:4]
-        st.session_state.uploaded_files = files_to_process
 
-# Apdorojimas tik jei yra failų ir trigger'is aktyvuotas
-if "trigger_ai_content" in st.session_state and st.session_state.trigger_ai_content and files_to_process and len(files_to_process) > 0:
+@traced("AI paruošimas")
+def prepare_ai_payloads(files, overlay):
+    """Redaguotos nuotraukos -> vision payload'ai [(nuotraukos nr., (base64, detail)), ...]"""
     progress_bar = st.progress(0)
     status_text = st.empty()
     
-    all_analyses = []
-    
-    # Analizuojame REDAGUOTAS nuotraukas (su vandens ženklu, spalvų koregavimu)
-    for i, file in enumerate(files_to_process):
-        status_text.text(f"🔍 Analizuojama redaguota nuotrauka {i+1}/{len(files_to_process)}...")
-        progress_bar.progress((i + 1) / (len(files_to_process) + 1))
+    # Paruošiame REDAGUOTAS nuotraukas (su vandens ženklu, spalvų koregavimu)
+    payloads = []
+    for i, file in enumerate(files):
+        status_text.text(f"🎨 Ruošiama nuotrauka {i+1}/{len(files)}...")
+        progress_bar.progress(i / len(files))
         
         try:
-            file.seek(0)
-            
             # SVARBU: Vandens ženklas tik ant paskutinės nuotraukos (jei jų daugiau nei 1)
-            show_watermark = add_watermark and (len(files_to_process) == 1 or i == len(files_to_process) - 1)
+            show_watermark = overlay["add_watermark"] and (len(files) == 1 or i == len(files) - 1)
             
-            # Sukuriame redaguotą nuotrauką (su visais efektais)
-            edited = add_marketing_overlay(
-                file,
-                add_watermark=show_watermark,
-                add_border=add_border,
-                brightness=brightness,
-                contrast=contrast,
-                saturation=saturation,
-                watermark_text=watermark_text,
-                watermark_size=watermark_size
-            )
+            # Redaguota nuotrauka iš registro (jau apdorota peržiūrai)
+            edited = render_edited(file, **dict(overlay, add_watermark=show_watermark))
             edited.seek(0)
             
-            # Konvertuojame REDAGUOTĄ nuotrauką į base64
-            image_b64 = base64.b64encode(edited.read()).decode()
-            
-            # Analizuojame redaguotą nuotrauką
-            analysis = analyze_image(image_b64)
-            all_analyses.append(analysis)
+            # Sumažiname ir perkoduojame REDAGUOTĄ nuotrauką siuntimui (base64 + detail)
+            payloads.append((i, prepare_vision_payload(edited)))
             
         except Exception as e:
             st.error(f"❌ Klaida apdorojant nuotrauką {i+1}: {str(e)}")
             continue
     
-    if all_analyses:
-        status_text.text("✍️ Kuriamas turinys...")
-        progress_bar.progress(1.0)
-        
-        # Sujungiame visas analizes
-        combined_analysis = " ".join(all_analyses)
-        
-        # Generuojame tekstą
-        try:
-            captions = generate_captions(combined_analysis, season, holiday)
-            
-            # Išsaugome į session_state
-            st.session_state.ai_content_result = captions
-            st.session_state.ai_analyses = all_analyses
-            
-        except Exception as e:
-            st.error(f"❌ Klaida generuojant turinį: {e}")
-    
     progress_bar.empty()
     status_text.empty()
-    
-    # Reset trigger TIKTAI pabaigoje
-    st.session_state.trigger_ai_content = False
+    return payloads
 
-# Rodyti AI turinio rezultatus (jei sukurti)
-if "ai_content_result" in st.session_state and st.session_state.ai_content_result:
+def submit_ai_content(files, overlay, season, holiday, fast_mode=False, reuse_similar=False, fresh=False):
+    """Paruošia nuotraukas ir pateikia AI darbą fono eilei (darbo ID - į session_state); fresh - be tekstų talpyklos"""
+    payloads = prepare_ai_payloads(files, overlay)
+    if not payloads:
+        return
+    
+    owner = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+    try:
+        job = ai_jobs.submit(owner, content_job, client, payloads, season, holiday, fast_mode, reuse_similar, fresh)
+    except JobQueueFull as e:
+        st.warning(f"⏳ {e}. Pabandykite po kelių sekundžių.")
+        return
+    st.session_state.ai_job_id = job.job_id
+    st.session_state.pop("ai_job_error", None)
+    st.session_state.ai_job_warnings = []
+
+def collect_ai_job(job):
+    """Baigto darbo rezultatai -> session_state (kaip ir anksčiau sinchroniškai)"""
+    if job.trace is not None:
+        remember_trace(job.trace)
+    del st.session_state.ai_job_id
+    state = job.snapshot()
+    st.session_state.ai_job_warnings = state["warnings"]
+    if state["status"] == "error":
+        st.session_state.ai_job_error = state["error"]
+        return
+    st.session_state.pop("ai_job_error", None)
+    st.session_state.ai_content_result = state["result"]["captions"]
+    st.session_state.ai_analyses = state["result"]["analyses"]
+    st.session_state.ai_validation = state["result"]["validation"]
+    st.session_state.ai_content_cached = state["result"]["cached"]
+
+def show_ai_job(job, streaming):
+    """Fono darbo būsena ir tarpiniai rezultatai (streaming - kuriuo dažniu šiuo metu klausiama)"""
+    if job is None:
+        # Darbas išmestas (pvz. serveris perkrautas) - nebelaukiame
+        st.session_state.pop("ai_job_id", None)
+        st.warning("⚠️ AI darbas nebepasiekiamas - sukurkite turinį iš naujo.")
+        return
+    
+    if not job.active:
+        collect_ai_job(job)
+        st.rerun()
+    if job.streaming != streaming:
+        # Prasidėjo arba baigėsi tekstų kūrimas - perjungiamas klausimo dažnis
+        st.rerun()
+    
+    state = job.snapshot()
+    if state["status"] == "queued":
+        position = ai_jobs.position(job)
+        st.info(f"⏳ Laukiama eilėje" + (f" (prieš jus: {position})" if position else "") + "...")
+    else:
+        st.progress(state["progress"], text=state["message"])
+        # Užklausos laukia bendrų OpenAI limitų (kartu su kitų vartotojų užklausomis)
+        position = scheduler.position(job.owner)
+        if position is not None:
+            st.caption(f"🚦 OpenAI limitų eilė: jūsų vieta {position}")
+    for warning in state["warnings"]:
+        st.error(warning)
+    
+    # Tekstų variantai - vos atkeliauja tokenai
+    for variant in split_variants(state["partial"]):
+        st.info(variant)
+
+@polling_fragment(AI_JOB_POLL_SECONDS)
+def ai_job_status():
+    """Darbas eilėje arba analizuojamos nuotraukos - būsena tikrinama retai"""
+    show_ai_job(ai_jobs.get(st.session_state.get("ai_job_id")), streaming=False)
+
+@polling_fragment(AI_JOB_STREAM_POLL_SECONDS)
+def ai_job_stream_status():
+    """Kuriami tekstai - tikrinama dažnai, kad nauji žodžiai pasirodytų iškart"""
+    show_ai_job(ai_jobs.get(st.session_state.get("ai_job_id")), streaming=True)
+
+@fragment
+@metered("AI turinys")
+def ai_section(files, overlay, season, holiday, fast_mode=False, reuse_similar=False):
+    """AI turinio generavimas ir rezultatai"""
     st.markdown("---")
-    st.success("✅ Turinys sėkmingai sukurtas!")
+    st.markdown("### 📝 AI Turinio Generavimas")
+    st.info("💡 Sukurkite tekstus socialiniams tinklams pagal jūsų nuotraukas")
+    
+    # Mygtukai čia (kol darbas vyksta - išjungti)
+    job_running = "ai_job_id" in st.session_state
+    col_create, col_fresh = st.columns([3, 1])
+    with col_create:
+        if st.button("🚀 Sukurti AI Turinį", type="primary", use_container_width=True, key="create_ai_content_btn", disabled=job_running):
+            submit_ai_content(files, overlay, season, holiday, fast_mode, reuse_similar)
+    with col_fresh:
+        # Tie patys duomenys grąžina tekstus iš talpyklos - šis mygtukas visada kuria naujus
+        if st.button("🔄 Kurti iš naujo", use_container_width=True, key="regenerate_ai_content_btn",
+                     disabled=job_running or not st.session_state.get("ai_content_result"),
+                     help="Nauji tekstai, nenaudojant anksčiau sukurtų (talpyklos)"):
+            submit_ai_content(files, overlay, season, holiday, fast_mode, reuse_similar, fresh=True)
+    
+    # AI turinys kuriamas fone - perkrovimai ir kiti veiksmai jo nenutraukia
+    if "ai_job_id" in st.session_state:
+        job = ai_jobs.get(st.session_state.ai_job_id)
+        if job is not None and job.streaming:
+            ai_job_stream_status()
+        else:
+            ai_job_status()
+    
+    if st.session_state.get("ai_job_error"):
+        st.error(f"❌ Klaida generuojant turinį: {st.session_state.ai_job_error}")
+    for warning in st.session_state.get("ai_job_warnings") or []:
+        st.error(warning)
+    
+    # Rodyti AI turinio rezultatus (jei sukurti)
+    if "ai_content_result" in st.session_state and st.session_state.ai_content_result:
+        st.markdown("---")
+        st.success("✅ Turinys sėkmingai sukurtas!")
+        if st.session_state.get("ai_content_cached"):
+            st.caption("⚡ Tekstai iš talpyklos (ta pati analizė, sezonas ir šventė). Naujiems - „🔄 Kurti iš naujo“.")
+        
+        # Rezultatai
+        st.subheader("📝 Socialinių tinklų įrašai")
+        
+        # Rodyti sugeneruotą turinį
+        st.markdown("### 🎯 Paruošti tekstai:")
+        st.text_area("Kopijuokite tekstą:", value=st.session_state.ai_content_result, height=200, key="ai_content_persistent")
+        
+        # Sezono/šventės taisyklių patikros rezultatai
+        validation = st.session_state.get("ai_validation")
+        if validation:
+            st.markdown("**🔎 Sezono taisyklių patikra:**")
+            for result in validation:
+                repaired = f" (pataisyta {result['repairs']} k.)" if result["repairs"] else ""
+                if result["ok"]:
+                    st.caption(f"✅ Variantas {result['variant']}: atitinka sezono ir šventės taisykles{repaired}")
+                else:
+                    problems = []
+                    for kind in result.get("missing") or (["sezono/šventės"] if result["missing_required"] else []):
+                        problems.append(f"trūksta privalomo {kind} žodžio")
+                    if result["forbidden"]:
+                        problems.append(f"draudžiami žodžiai: {', '.join(result['forbidden'])}")
+                    st.warning(f"⚠️ Variantas {result['variant']}: {'; '.join(problems)}{repaired}")
+        
+        # Analitikos informacija
+        if "ai_analyses" in st.session_state:
+            with st.expander("📊 Detali analizė"):
+                st.markdown("**Vaizdų analizė:**")
+                for i, analysis in enumerate(st.session_state.ai_analyses):
+                    st.markdown(f"**Nuotrauka {i+1}:** {analysis}")
+
+# Naudojame session_state failus (rodyklės į sesijos saugyklą)
+if len(st.session_state.uploaded_files) > 4:
+    st.warning("⚠️ Per daug failų! Pasirinkite iki 4 nuotraukų.")
+    st.session_state.uploaded_files = st.session_state.uploaded_files[:4]
+
+files_to_process = assets.open_all(st.session_state.uploaded_files)
+
+if files_to_process:
     
-    # Rezultatai
-    st.subheader("📝 Socialinių tinklų įrašai")
+    st.success(f"✅ Įkelta {len(files_to_process)} nuotraukų!")
     
-    # Rodyti sugeneruotą turinį
-    st.markdown("### 🎯 Paruošti tekstai:")
-    st.text_area("Kopijuokite tekstą:", value=st.session_state.ai_content_result, height=200, key="ai_content_persistent")
+    # Redagavimo nustatymai iš šoninio meniu (vandens ženklas - tik paskutinei nuotraukai)
+    overlay_settings = dict(
+        add_watermark=add_watermark,
+        add_border=add_border,
+        brightness=brightness,
+        contrast=contrast,
+        saturation=saturation,
+        watermark_text=watermark_text,
+        watermark_size=watermark_size
+    )
+    
+    preview_section(files_to_process, overlay_settings)
+    collage_section(files_to_process, overlay_settings, season, holiday)
+    ai_section(files_to_process, overlay_settings, season, holiday, fast_mode, reuse_similar)
     
-    # Analitikos informacija
-    if "ai_analyses" in st.session_state:
-        with st.expander("📊 Detali analizė"):
-            st.markdown("**Vaizdų analizė:**")
-            for i, analysis in enumerate(st.session_state.ai_analyses):
-                st.markdown(f"**Nuotrauka {i+1}:** {analysis}")
+    # Mygtukas išvalyti failus
+    st.markdown("---")
+    if st.button("🗑️ Išvalyti visus failus ir rezultatus", type="secondary", use_container_width=True):
+        clear_session_files(results=True)
+        st.rerun()
+
+diagnostics_panel()
 
 # Footer
 st.markdown("---")
-st.markdown("🌿 *Sukūrta žaliuzių ir roletų verslui* | Powered by OpenAI")
\ No newline at end of file
+st.markdown("🌿 *Sukūrta žaliuzių ir roletų verslui* | Powered by OpenAI")
+
+end_rerun_meter()
\ No newline at end of file
@@ -1,10 +1,17 @@
 import streamlit as st
-import io, os, base64
-from openai import OpenAI
+import os, uuid, logging
 from dotenv import load_dotenv
+from ai_cache import analysis_cache
+from openai_client import get_client
+from rate_limiter import create_completion, session
+from ai_parallel import analyze_in_parallel
+from vision_payload import prepare_vision_payload
+from instrumentation import stage, record_usage
+from diagnostics import traced, diagnostics_panel
 
 # ---------- Nustatymai ----------
 load_dotenv()
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
 # Bandome gauti API raktą iš .env failo (vietinis) arba Streamlit secrets (cloud)
 api_key = os.getenv("OPENAI_API_KEY")
@@ -19,7 +26,12 @@ if not api_key:
     st.error("❌ OpenAI API raktas nerastas! Patikrinkite konfigūraciją.")
     st.stop()
 
-client = OpenAI(api_key=api_key)
+# Bendras procesui klientas - HTTP jungtys išlieka tarp perkrovimų ir sesijų
+client = get_client(api_key)
+
+# Vaizdų analizės modelis ir prompt'o versija (keičiant prompt'ą - pakelti versiją)
+ANALYSIS_MODEL = "gpt-4o-mini"
+ANALYSIS_PROMPT_VERSION = "cloud-v1"
 
 st.set_page_config(page_title="Žaliuzių turinio kūrėjas", page_icon="🌞", layout="wide")
 
@@ -27,19 +39,30 @@ st.title("🌿 Žaliuzių & Roletų turinio kūrėjas")
 st.caption("Įkelk iki 4 nuotraukų ir gauk paruoštus įrašus socialiniams tinklams.")
 
 # ---------- Pagalbinės funkcijos ----------
-def analyze_image(image_bytes):
-    """Naudoja GPT-4o-mini vaizdo analizei"""
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "Tu esi vaizdų analizės specialistas, apibūdink nuotraukas lietuviškai."},
-            {"role": "user", "content": [
-                {"type": "text", "text": "Aprašyk, kas matosi šioje nuotraukoje. Pastebėk aplinką, apšvietimą, spalvas, ar matosi langai ar žaliuzės, koks įspūdis susidaro."},
-                {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64," + image_bytes}}
-            ]}
-        ]
-    )
-    return response.choices[0].message.content.strip()
+def analyze_image(image_bytes, detail="auto"):
+    """Naudoja GPT-4o-mini vaizdo analizei (rezultatai talpinami diske)"""
+    with stage("analyze_image", bytes_in=len(image_bytes), detail=detail) as entry:
+        cache_key = analysis_cache.make_key(ANALYSIS_MODEL, ANALYSIS_PROMPT_VERSION, detail, image_bytes)
+        cached = analysis_cache.get(cache_key)
+        entry["cache_hit"] = cached is not None
+        if cached is not None:
+            return cached
+        
+        response = create_completion(
+            client,
+            model=ANALYSIS_MODEL,
+            messages=[
+                {"role": "system", "content": "Tu esi vaizdų analizės specialistas, apibūdink nuotraukas lietuviškai."},
+                {"role": "user", "content": [
+                    {"type": "text", "text": "Aprašyk, kas matosi šioje nuotraukoje. Pastebėk aplinką, apšvietimą, spalvas, ar matosi langai ar žaliuzės, koks įspūdis susidaro."},
+                    {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64," + image_bytes, "detail": detail}}
+                ]}
+            ]
+        )
+        record_usage(entry, response.usage)
+        analysis = response.choices[0].message.content.strip()
+        analysis_cache.set(cache_key, analysis)
+        return analysis
 
 def generate_captions(analysis_text, season):
     """Sukuria 3 teksto variantus lietuviškai"""
@@ -50,16 +73,15 @@ def generate_captions(analysis_text, season):
     1) marketinginis, 2) draugiškas, 3) su humoru. 
     Lietuviškai, gali pridėti 1–2 tinkamus hashtag'us.
     """
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.9
-    )
-    return response.choices[0].message.content.strip()
-
-def image_to_base64(image_file):
-    """Konvertuoja įkeltą failą į base64"""
-    return base64.b64encode(image_file.getvalue()).decode()
+    with stage("generate_captions", bytes_in=len(analysis_text.encode())) as entry:
+        response = create_completion(
+            client,
+            model="gpt-4o-mini",
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.9
+        )
+        record_usage(entry, response.usage)
+        return response.choices[0].message.content.strip()
 
 # ---------- Pagrindinis UI ----------
 st.sidebar.header("⚙️ Nustatymai")
@@ -74,6 +96,7 @@ auto_process = st.sidebar.checkbox("🤖 Automatinis apdorojimas", value=True)
 
 st.sidebar.markdown("---")
 st.sidebar.markdown("💡 **Patarimas:** Įkelkite ryškias, kokybiškas nuotraukas su žaliuzėmis ar roletais.")
+st.sidebar.caption(f"🗄️ Analizių talpykla: {analysis_cache.hits} pataikymai / {analysis_cache.misses} praleidimai")
 
 # Failų įkėlimas
 uploaded_files = st.file_uploader(
@@ -97,62 +120,63 @@ if uploaded_files:
     
     # Apdorojimo mygtukas
     if st.button("🚀 Sukurti turinį", type="primary", use_container_width=True):
-        progress_bar = st.progress(0)
-        status_text = st.empty()
+        with traced("AI turinys"), session(st.session_state.setdefault("session_id", uuid.uuid4().hex)):
+            progress_bar = st.progress(0)
+            status_text = st.empty()
         
-        all_analyses = []
+            # Analizuojame visas nuotraukas LYGIAGREČIAI (rezultatų tvarka išlaikoma)
+            status_text.text(f"🔍 Analizuojamos nuotraukos (0/{len(uploaded_files)})...")
         
-        for i, file in enumerate(uploaded_files):
-            status_text.text(f"🔍 Analizuojama nuotrauka {i+1}/{len(uploaded_files)}...")
-            progress_bar.progress((i + 1) / (len(uploaded_files) + 1))
-            
-            try:
-                # Konvertuojame į base64
-                image_b64 = image_to_base64(file)
-                
-                # Analizuojame
-                analysis = analyze_image(image_b64)
-                all_analyses.append(analysis)
-                
-            except Exception as e:
-                st.error(f"❌ Klaida apdorojant nuotrauką {i+1}: {e}")
-                continue
+            def on_analysis_done(i, done_count, error):
+                status_text.text(f"🔍 Analizuojamos nuotraukos ({done_count}/{len(uploaded_files)})...")
+                progress_bar.progress(done_count / (len(uploaded_files) + 1))
+                if error is not None:
+                    st.error(f"❌ Klaida apdorojant nuotrauką {i+1}: {error}")
         
-        if all_analyses:
-            status_text.text("✍️ Kuriamas turinys...")
-            progress_bar.progress(1.0)
+            results = analyze_in_parallel(
+                uploaded_files,
+                lambda file: analyze_image(*prepare_vision_payload(file)),
+                on_done=on_analysis_done
+            )
+            all_analyses = [analysis for analysis, error in results if error is None]
+        
+            if all_analyses:
+                status_text.text("✍️ Kuriamas turinys...")
+                progress_bar.progress(1.0)
             
-            # Sujungiame visas analizes
-            combined_analysis = " ".join(all_analyses)
+                # Sujungiame visas analizes
+                combined_analysis = " ".join(all_analyses)
             
-            # Generuojame tekstą
-            try:
-                captions = generate_captions(combined_analysis, season)
+                # Generuojame tekstą
+                try:
+                    captions = generate_captions(combined_analysis, season)
                 
-                st.success("✅ Turinys sėkmingai sukurtas!")
+                    st.success("✅ Turinys sėkmingai sukurtas!")
                 
-                # Rezultatai
-                st.subheader("📝 Socialinių tinklų įrašai")
+                    # Rezultatai
+                    st.subheader("📝 Socialinių tinklų įrašai")
                 
-                # Rodyti sugeneruotą turinį
-                st.markdown("### 🎯 Paruošti tekstai:")
-                st.text_area("Kopijuokite tekstą:", value=captions, height=200)
+                    # Rodyti sugeneruotą turinį
+                    st.markdown("### 🎯 Paruošti tekstai:")
+                    st.text_area("Kopijuokite tekstą:", value=captions, height=200)
                 
-                # Analitikos informacija
-                with st.expander("📊 Detali analizė"):
-                    st.markdown("**Vaizdų analizė:**")
-                    for i, analysis in enumerate(all_analyses):
-                        st.markdown(f"**Nuotrauka {i+1}:** {analysis}")
+                    # Analitikos informacija
+                    with st.expander("📊 Detali analizė"):
+                        st.markdown("**Vaizdų analizė:**")
+                        for i, analysis in enumerate(all_analyses):
+                            st.markdown(f"**Nuotrauka {i+1}:** {analysis}")
                 
-            except Exception as e:
-                st.error(f"❌ Klaida generuojant turinį: {e}")
+                except Exception as e:
+                    st.error(f"❌ Klaida generuojant turinį: {e}")
         
-        progress_bar.empty()
-        status_text.empty()
+            progress_bar.empty()
+            status_text.empty()
 
 else:
     st.info("👆 Įkelkite nuotraukas, kad pradėtumėte!")
 
+diagnostics_panel()
+
 # Footer
 st.markdown("---")
 st.markdown("🌿 *Sukūrta žaliuzių ir roletų verslui* | Powered by OpenAI")
\ No newline at end of file
@@ -0,0 +1,259 @@
+import os, time, mmap, uuid, shutil, hashlib, logging, tempfile, threading, weakref
+from collections import OrderedDict, namedtuple
+
+logger = logging.getLogger(__name__)
+
+# ---------- Nustatymai ----------
+# Sesijų nuotraukos laikomos diske (ne session_state) - atmintyje lieka tik rodyklės
+ASSET_DIR = os.getenv("SESSION_ASSET_DIR", os.path.join(tempfile.gettempdir(), "zaliuziu_assets"))
+SESSION_BUDGET_MB = float(os.getenv("SESSION_BUDGET_MB", "256"))
+
+# Sesijų katalogai, kurių niekas nelietė tiek valandų, laikomi apleistais (pvz. po proceso lūžio)
+ASSET_MAX_IDLE_HOURS = float(os.getenv("ASSET_MAX_IDLE_HOURS", "12"))
+
+# Rodyklė į saugomą failą (laikoma session_state vietoje baitų)
+AssetHandle = namedtuple("AssetHandle", "asset_id name size")
+
+
+class AssetFile:
+    """
+    Tik skaitomas failas iš saugyklos (mmap). Turi tuos pačius atributus, kuriuos
+    programa naudoja iš UploadedFile: name, size, file_id, read/seek/tell/getvalue.
+    """
+
+    def __init__(self, handle, path):
+        self.name = handle.name
+        self.size = handle.size
+        self.file_id = handle.asset_id
+        self.content_hash = handle.asset_id
+        self._position = 0
+        if handle.size:
+            with open(path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._map = b""
+
+    def read(self, size=-1):
+        end = len(self._map) if size is None or size < 0 else min(len(self._map), self._position + size)
+        data = self._map[self._position:end]
+        self._position = end
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._position, os.SEEK_END: len(self._map)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def getvalue(self):
+        return self._map[:]
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._map = b""
+
+    def detach(self):
+        """Perkelia turinį į atmintį ir uždaro mmap (failą galima trinti, skaitymas veikia toliau)"""
+        if isinstance(self._map, mmap.mmap):
+            mapped = self._map
+            self._map = mapped[:]
+            mapped.close()
+
+
+# Šio proceso gyvų saugyklų katalogai - jų valymas neliečia, kad ir kiek laiko sesija neaktyvi
+_live_directories = set()
+_live_lock = threading.Lock()
+
+
+def _close_files(files, asset_id=None, keep_data=False):
+    """Uždaro atidarytų failų mmap (visų arba vieno asset_id) - kitaip Windows neleidžia jų trinti"""
+    for file in list(files):
+        if asset_id is None or file.file_id == asset_id:
+            if keep_data:
+                file.detach()
+            else:
+                file.close()
+            files.discard(file)
+
+
+def _release_directory(directory, files):
+    _close_files(files)
+    _remove_directory(directory)
+
+
+def _remove_directory(directory):
+    with _live_lock:
+        _live_directories.discard(directory)
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def sweep_stale_sessions(root=ASSET_DIR, max_idle_seconds=ASSET_MAX_IDLE_HOURS * 3600):
+    """Ištrina apleistų sesijų katalogus (kurių sesija baigėsi nesutvarkius)"""
+    if not os.path.isdir(root):
+        return 0
+    removed = 0
+    now = time.time()
+    with _live_lock:
+        live = set(_live_directories)
+    for entry in os.scandir(root):
+        try:
+            if entry.path in live:
+                continue
+            if entry.is_dir() and now - entry.stat().st_mtime > max_idle_seconds:
+                _remove_directory(entry.path)
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+class SessionAssetStore:
+    """
+    Vienos sesijos nuotraukų saugykla laikinajame kataloge:
+    - Baitai įrašomi į diską, session_state laikomos tik AssetHandle rodyklės
+    - Skaitoma per mmap (AssetFile)
+    - Baitų biudžetas sesijai: viršijus išmetami seniausiai naudoti failai
+      (pirma - perskaičiuojami, pvz. redaguotos nuotraukos; vartotojo nuotraukos - tik paskutinės)
+    - Sesijai pasibaigus (objektą surinkus šiukšlių surinkėjui) katalogas ištrinamas
+    """
+
+    def __init__(self, root=ASSET_DIR, max_bytes=SESSION_BUDGET_MB * 1024 * 1024):
+        os.makedirs(root, exist_ok=True)
+        self.directory = os.path.join(root, uuid.uuid4().hex)
+        os.makedirs(self.directory)
+        self.max_bytes = int(max_bytes)
+        self._items = OrderedDict()  # asset_id -> (handle, pinned)
+        self._uploads = {}  # UploadedFile.file_id -> handle
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._open_files = weakref.WeakSet()  # Atidaryti AssetFile - uždaromi prieš trinant failus
+        with _live_lock:
+            _live_directories.add(self.directory)
+        self._finalizer = weakref.finalize(self, _release_directory, self.directory, self._open_files)
+
+    def _path(self, asset_id):
+        return os.path.join(self.directory, asset_id)
+
+    def put(self, data, name=None, pinned=False):
+        """Išsaugo baitus ir grąžina AssetHandle (vienodas turinys saugomas vieną kartą)"""
+        data = bytes(data)
+        asset_id = hashlib.blake2b(data, digest_size=16).hexdigest()
+        handle = AssetHandle(asset_id, name or f"{asset_id}.jpg", len(data))
+
+        with self._lock:
+            if asset_id in self._items:
+                old_handle, old_pinned = self._items.pop(asset_id)
+                if os.path.exists(self._path(asset_id)):
+                    self._items[asset_id] = (handle, old_pinned or pinned)
+                    return handle
+                # Failą ištrynė kitas procesas (apleistų katalogų valymas) - įrašome iš naujo
+                pinned = old_pinned or pinned
+                self._bytes -= old_handle.size
+
+        # Katalogas galėjo būti ištrintas kito proceso valymo metu
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self._path(asset_id)}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(asset_id))
+
+        with self._lock:
+            if asset_id not in self._items:
+                self._items[asset_id] = (handle, pinned)
+                self._bytes += handle.size
+                self._evict()
+        os.utime(self.directory)  # Katalogo mtime = paskutinis sesijos aktyvumas
+        return handle
+
+    def put_upload(self, uploaded_file):
+        """Įkeltas failas (UploadedFile) į saugyklą - vieną kartą kiekvienam file_id"""
+        file_id = getattr(uploaded_file, "file_id", None)
+        handle = self._uploads.get(file_id) if file_id else None
+        if handle is not None and self.contains(handle):
+            return handle
+
+        uploaded_file.seek(0)
+        handle = self.put(uploaded_file.read(), name=getattr(uploaded_file, "name", None), pinned=True)
+        if file_id:
+            self._uploads[file_id] = handle
+        return handle
+
+    def contains(self, handle):
+        with self._lock:
+            if handle.asset_id not in self._items:
+                return False
+        return os.path.exists(self._path(handle.asset_id))
+
+    def open(self, handle):
+        """Atidaro failą skaitymui (AssetFile) arba grąžina None, jei jis jau išmestas"""
+        with self._lock:
+            if handle.asset_id not in self._items:
+                return None
+            self._items.move_to_end(handle.asset_id)
+        try:
+            file = AssetFile(handle, self._path(handle.asset_id))
+        except FileNotFoundError:
+            # Failas ištrintas iš disko - įrašas nebegalioja
+            self._forget(handle.asset_id)
+            return None
+        except OSError:
+            return None
+        with self._lock:
+            self._open_files.add(file)
+        return file
+
+    def _forget(self, asset_id):
+        with self._lock:
+            item = self._items.pop(asset_id, None)
+            if item is not None:
+                self._bytes -= item[0].size
+            _close_files(self._open_files, asset_id, keep_data=True)
+
+    def open_all(self, handles):
+        """Atidaro visus dar esamus failus (išmestieji praleidžiami)"""
+        files = (self.open(handle) for handle in handles)
+        return [file for file in files if file is not None]
+
+    def _evict(self):
+        """Išmeta seniausiai naudotus failus, kol telpama į biudžetą (kviečiama su užraktu)"""
+        for evict_pinned in (False, True):
+            for asset_id, (handle, pinned) in list(self._items.items()):
+                if self._bytes <= self.max_bytes:
+                    return
+                if pinned and not evict_pinned:
+                    continue
+                if pinned:
+                    logger.warning("Sesijos biudžetas viršytas - išmetama vartotojo nuotrauka %s", handle.name)
+                del self._items[asset_id]
+                self._bytes -= handle.size
+                # Šio perkrovimo metu failas dar gali būti skaitomas - turinys lieka atmintyje
+                _close_files(self._open_files, asset_id, keep_data=True)
+                try:
+                    os.remove(self._path(asset_id))
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {"files": len(self._items), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    def clear(self):
+        """Ištrina visus sesijos failus (katalogas lieka)"""
+        with self._lock:
+            asset_ids = list(self._items)
+            self._items.clear()
+            self._uploads.clear()
+            self._bytes = 0
+            _close_files(self._open_files)
+        for asset_id in asset_ids:
+            try:
+                os.remove(self._path(asset_id))
+            except OSError:
+                pass
+
+    def close(self):
+        """Ištrina sesijos katalogą (taip pat kviečiama automatiškai, kai sesija baigiasi)"""
+        self._finalizer()
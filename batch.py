@@ -0,0 +1,258 @@
+"""
+Paketinis nuotraukų apdorojimas be Streamlit (pvz. visos savaitės įrašams paruošti).
+
+Įvestis - katalogas arba JSON manifestas:
+- Katalogas su pakatalogiais: kiekvienas pakatalogis = vienas nuotraukų rinkinys
+- Katalogas tik su nuotraukomis: vienas rinkinys
+- manifest.json: [{"name": "...", "photos": ["a.jpg", ...], "season": "...", "holiday": "..."}, ...]
+  (season/holiday neprivalomi, santykiniai keliai - nuo manifesto katalogo)
+
+Pavyzdys:
+    python batch.py nuotraukos/ --output rezultatai/ --season Vasara --watermark "#RūbaiLangams" --ai
+"""
+import argparse, json, os, sys, time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+from image_pipeline import AUTO_ENHANCE, render_overlay, render_overlay_image
+from collage import COLLAGE_STYLE_NAMES, COLLAGE_LAYOUT_NAMES, COLLAGE_TILE_SIZE, build_collage, encode_collage
+from vision_payload import prepare_vision_payload
+from ai_parallel import MAX_CONCURRENCY
+from openai_client import get_client
+from content_ai import analyze_image, create_captions
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+SEASONS = ["Pavasaris", "Vasara", "Ruduo", "Žiema"]
+
+# Kaip ir programoje - daugiausia 4 nuotraukos viename rinkinyje
+MAX_PHOTOS_PER_SET = 4
+
+
+def list_images(directory):
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def discover_sets(source):
+    """Suranda nuotraukų rinkinius kataloge arba manifeste"""
+    if os.path.isfile(source):
+        base_dir = os.path.dirname(os.path.abspath(source))
+        with open(source, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        sets = []
+        for i, entry in enumerate(manifest):
+            sets.append({
+                "name": entry.get("name", f"rinkinys_{i+1}"),
+                "photos": [os.path.join(base_dir, photo) for photo in entry["photos"]],
+                "season": entry.get("season"),
+                "holiday": entry.get("holiday"),
+            })
+        return sets
+
+    subdirs = sorted(
+        entry.path for entry in os.scandir(source)
+        if entry.is_dir() and list_images(entry.path)
+    )
+    if subdirs:
+        return [{"name": os.path.basename(path), "photos": list_images(path)} for path in subdirs]
+    return [{"name": os.path.basename(os.path.abspath(source)), "photos": list_images(source)}]
+
+
+def auto_layout(count):
+    """Išdėstymas pagal nuotraukų kiekį"""
+    return {2: "1x2", 3: "1x3"}.get(count, "2x2")
+
+
+def render_set(job):
+    """
+    Apdoroja vieną rinkinį (vykdoma procesų baseine):
+    redaguotos nuotraukos, collage ir (jei reikia) vision payload'ai.
+    """
+    photos = job["photos"]
+    overlay = job["overlay"]
+    out_dir = job["out_dir"]
+    os.makedirs(out_dir, exist_ok=True)
+
+    result = {"name": job["name"], "out_dir": out_dir, "photos": len(photos), "payloads": [], "errors": []}
+    tiles = []
+
+    for i, path in enumerate(photos):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+
+            # SVARBU: Vandens ženklas tik ant paskutinės nuotraukos (jei jų daugiau nei 1)
+            show_watermark = overlay["add_watermark"] and (len(photos) == 1 or i == len(photos) - 1)
+            edited = render_overlay(data, **dict(overlay, add_watermark=show_watermark))
+
+            base_name = os.path.splitext(os.path.basename(path))[0]
+            with open(os.path.join(out_dir, f"{base_name}_edited.jpg"), "wb") as f:
+                f.write(edited)
+
+            if job["ai"]:
+                result["payloads"].append(prepare_vision_payload(edited))
+
+            if job["collage_style"]:
+                # Collage plytelės - be rėmelio, sumažinta raiška
+                tiles.append(render_overlay_image(
+                    data,
+                    (COLLAGE_TILE_SIZE, COLLAGE_TILE_SIZE),
+                    **dict(overlay, add_watermark=overlay["add_watermark"] and i == len(photos) - 1, add_border=False)
+                ))
+        except Exception as e:
+            result["errors"].append(f"{os.path.basename(path)}: {e}")
+
+    if job["collage_style"] and len(tiles) >= 2:
+        try:
+            layout = job["collage_layout"] or auto_layout(len(tiles))
+            collage = build_collage(tiles, job["collage_style"], layout, job["season"], job["holiday"])
+            with open(os.path.join(out_dir, "collage.jpg"), "wb") as f:
+                f.write(encode_collage(collage))
+        except Exception as e:
+            result["errors"].append(f"collage: {e}")
+
+    return result
+
+
+def write_captions(client, analysis_text, season, holiday):
+    """Tekstai (su talpykla) + sezono/šventės taisyklių patikra (netinkami variantai pataisomi)"""
+    captions, validation, _cached = create_captions(client, analysis_text, season, holiday)
+    return captions, validation or []
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Paketinis žaliuzių nuotraukų apdorojimas")
+    parser.add_argument("source", help="Katalogas su nuotraukų rinkiniais arba JSON manifestas")
+    parser.add_argument("--output", "-o", default="rezultatai", help="Rezultatų katalogas")
+    parser.add_argument("--season", choices=SEASONS, default="Vasara", help="Metų laikas")
+    parser.add_argument("--holiday", default="Nėra", help="Šventė (pvz. 'Velykos')")
+    parser.add_argument("--watermark", default="", help="Vandens ženklo tekstas (tuščias - be ženklo)")
+    parser.add_argument("--watermark-size", type=int, default=150, help="Vandens ženklo dydis px")
+    parser.add_argument("--border", action="store_true", help="Pridėti baltą rėmelį")
+    parser.add_argument("--no-enhance", action="store_true", help="Išjungti AUTO spalvų optimizaciją")
+    parser.add_argument("--collage-style", choices=COLLAGE_STYLE_NAMES + ["none"], default="Instagram Grid", help="Collage stilius")
+    parser.add_argument("--collage-layout", choices=COLLAGE_LAYOUT_NAMES, default=None, help="Išdėstymas (numatyta - pagal nuotraukų kiekį)")
+    parser.add_argument("--ai", action="store_true", help="Analizuoti nuotraukas ir sukurti tekstus (OpenAI)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Procesų kiekis vaizdų apdorojimui")
+    parser.add_argument("--ai-concurrency", type=int, default=MAX_CONCURRENCY, help="Kiek OpenAI užklausų vienu metu")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    load_dotenv()
+
+    client = None
+    if args.ai:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            print("❌ OpenAI API raktas nerastas (OPENAI_API_KEY)!", file=sys.stderr)
+            return 1
+        client = get_client(api_key)
+
+    sets = [s for s in discover_sets(args.source) if s["photos"]]
+    if not sets:
+        print("❌ Nerasta nuotraukų!", file=sys.stderr)
+        return 1
+
+    enhance = {"brightness": 1.0, "contrast": 1.0, "saturation": 1.0} if args.no_enhance else AUTO_ENHANCE
+    jobs = []
+    for photo_set in sets:
+        if len(photo_set["photos"]) > MAX_PHOTOS_PER_SET:
+            print(f"⚠️ {photo_set['name']}: per daug nuotraukų, naudojamos tik pirmosios {MAX_PHOTOS_PER_SET}")
+        jobs.append({
+            "name": photo_set["name"],
+            "photos": photo_set["photos"][:MAX_PHOTOS_PER_SET],
+            "out_dir": os.path.join(args.output, photo_set["name"]),
+            "season": photo_set.get("season") or args.season,
+            "holiday": photo_set.get("holiday") or args.holiday,
+            "overlay": dict(
+                enhance,
+                add_watermark=bool(args.watermark),
+                add_border=args.border,
+                watermark_text=args.watermark,
+                watermark_size=args.watermark_size,
+            ),
+            "collage_style": None if args.collage_style == "none" else args.collage_style,
+            "collage_layout": args.collage_layout,
+            "ai": args.ai,
+        })
+
+    total_photos = sum(len(job["photos"]) for job in jobs)
+    jobs_by_name = {job["name"]: job for job in jobs}
+    print(f"📸 {len(jobs)} rinkiniai, {total_photos} nuotraukų, {args.workers} procesai")
+
+    started = time.perf_counter()
+    results = []
+    failures = 0
+
+    # Vaizdai - procesų baseine (CPU), OpenAI užklausos - ribotame gijų baseine (tinklas)
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as render_pool, \
+            ThreadPoolExecutor(max_workers=max(1, args.ai_concurrency), thread_name_prefix="openai") as api_pool:
+        futures = {render_pool.submit(render_set, job): job["name"] for job in jobs}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"❌ {futures[future]}: {e}")
+                failures += 1
+                continue
+
+            for error in result["errors"]:
+                print(f"❌ {result['name']}: {error}")
+            print(f"✅ {result['name']}: {result['photos']} nuotr. -> {result['out_dir']}")
+
+            # Analizės pradedamos iškart, kol kiti rinkiniai dar apdorojami
+            if args.ai:
+                result["analysis_futures"] = [
+                    api_pool.submit(analyze_image, client, image_b64, detail)
+                    for image_b64, detail in result["payloads"]
+                ]
+            results.append(result)
+
+        render_seconds = time.perf_counter() - started
+
+        if args.ai:
+            for result in results:
+                analyses = []
+                for i, analysis_future in enumerate(result["analysis_futures"]):
+                    try:
+                        analyses.append(analysis_future.result())
+                    except Exception as e:
+                        print(f"❌ {result['name']}: klaida analizuojant nuotrauką {i+1}: {e}")
+                result["analyses"] = analyses
+                if analyses:
+                    job = jobs_by_name[result["name"]]
+                    result["caption_future"] = api_pool.submit(
+                        write_captions, client, " ".join(analyses), job["season"], job["holiday"]
+                    )
+
+            for result in results:
+                if "caption_future" not in result:
+                    continue
+                try:
+                    captions, validation = result["caption_future"].result()
+                except Exception as e:
+                    print(f"❌ {result['name']}: klaida generuojant turinį: {e}")
+                    continue
+                with open(os.path.join(result["out_dir"], "tekstai.txt"), "w", encoding="utf-8") as f:
+                    f.write(captions + "\n")
+                with open(os.path.join(result["out_dir"], "analize.json"), "w", encoding="utf-8") as f:
+                    json.dump(result["analyses"], f, ensure_ascii=False, indent=2)
+                print(f"📝 {result['name']}: tekstai sukurti")
+                for check in validation:
+                    if not check["ok"]:
+                        print(f"⚠️ {result['name']}: variantas {check['variant']} neatitinka sezono taisyklių")
+
+    total_seconds = time.perf_counter() - started
+    print(
+        f"🏁 Apdorota {total_photos} nuotraukų per {total_seconds:.1f} s "
+        f"({total_photos / total_seconds:.2f} nuotr./s; vaizdai {total_photos / render_seconds:.2f} nuotr./s)"
+    )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,382 @@
+"""
+Našumo testas be tinklo: nuotraukų redagavimas, spalvų varikliai, visi collage stiliai ir vision payload.
+
+Naudojamos sintetinės nuotraukos (1, 12 ir 48 MP), kiekvienas atvejis vykdomas
+atskirame procese (kad atminties piko matavimas nepriklausytų nuo kitų atvejų).
+Matuojama: laikas (mediana iš kelių kartojimų), atminties pikas ir rezultato dydis.
+Prieš matavimą patikrinama, ar spalvų varikliai (fused ir pil) sutampa ±MAX_ABS_DIFF tikslumu.
+
+Pavyzdžiai:
+    python benchmark.py --save-baseline        # dabartiniai rezultatai - bazinė linija
+    python benchmark.py                        # palyginimas su bazine linija (klaidos kodas 1 - regresija)
+    python benchmark.py --sizes 1 12 --only collage
+"""
+import argparse, json, os, sys, time, random, platform, statistics, tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageChops, __version__ as PIL_VERSION
+
+# Atminties pikas - iš OS (apima Pillow C atmintį). Linux - VmHWM (pikas atstatomas prieš matavimą),
+# kitur - ru_maxrss (nemažėja, todėl lengvi atvejai po sunkaus paruošimo rodo ~0); be resource (Windows) - tik Python atmintis
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    import tracemalloc
+    RESOURCE_AVAILABLE = False
+
+from image_pipeline import AUTO_ENHANCE, stage_cache, render_overlay, render_overlay_image
+from color_engine import NUMPY_AVAILABLE, MAX_ABS_DIFF, enhance_chain, fused_color
+from collage import COLLAGE_STYLES, COLLAGE_LAYOUTS, COLLAGE_TILE_SIZE, parse_layout, build_collage, encode_collage
+from vision_payload import prepare_vision_payload
+from watermark import get_font, watermark_sprite
+
+# Sintetinių nuotraukų raiškos (MP -> plotis, aukštis)
+IMAGE_SIZES = {1: (1152, 864), 12: (4000, 3000), 48: (8000, 6000)}
+
+# Collage plytelės - iš tokios raiškos nuotraukų (kaip telefonų)
+COLLAGE_SOURCE_MP = 12
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+IMAGE_CACHE_DIR = os.path.join(tempfile.gettempdir(), "zaliuziu_benchmark")
+
+# Leistinas pablogėjimas nuo bazinės linijos (dalimis)
+THRESHOLDS = {"seconds": 0.25, "peak_mb": 0.25, "output_bytes": 0.10}
+
+# Mažesni laiko skirtumai laikomi triukšmu (s)
+MIN_TIME_DELTA = 0.005
+
+# Spalvų variklių patikra: atsitiktinių RGB vaizdų kiekis ir parametrų intervalas (slankikliai x AUTO_ENHANCE)
+COLOR_CHECK_SAMPLES = 200
+COLOR_CHECK_RANGE = (0.5, 2.0)
+
+COLOR_ENGINES = {"fused": fused_color, "pil": enhance_chain}
+
+WATERMARK = dict(watermark_text="#RūbaiLangams", watermark_size=150)
+OVERLAY_VARIANTS = {
+    "be_zenklo": dict(add_watermark=False, add_border=False),
+    "zenklas": dict(add_watermark=True, add_border=False),
+    "remelis": dict(add_watermark=False, add_border=True),
+    "zenklas_remelis": dict(add_watermark=True, add_border=True),
+}
+
+
+def synthetic_image(megapixels, seed=0):
+    """
+    Deterministinė sintetinė JPEG nuotrauka (glotnūs spalvų plotai + triukšmas, kaip tikroje nuotraukoje).
+    Sugeneruota laikoma laikinajame kataloge. Grąžina failo kelią.
+    """
+    os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+    path = os.path.join(IMAGE_CACHE_DIR, f"{megapixels}mp_{seed}.jpg")
+    if os.path.exists(path):
+        return path
+
+    width, height = IMAGE_SIZES[megapixels]
+    rng = random.Random(seed)
+    small = (max(2, width // 64), max(2, height // 64))
+    blocks = Image.frombytes("RGB", small, bytes(rng.randrange(256) for _ in range(small[0] * small[1] * 3)))
+    img = blocks.resize((width, height), Image.Resampling.BICUBIC)
+
+    channels = []
+    for channel in img.split():
+        noise = Image.effect_noise((width, height), 12)
+        channels.append(ImageChops.add(channel, noise, offset=-128))
+    img = Image.merge("RGB", channels)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    img.save(tmp_path, format="JPEG", quality=90)
+    os.replace(tmp_path, path)
+    return path
+
+
+def check_color_engines(samples=COLOR_CHECK_SAMPLES, seed=0):
+    """
+    Palygina fused_color su enhance_chain atsitiktiniuose RGB vaizduose (atsitiktiniai dydžiai ir parametrai).
+    Grąžina (didžiausias skirtumas, parametrai, prie kurių jis gautas) arba None be NumPy.
+    """
+    if not NUMPY_AVAILABLE:
+        return None
+    rng = random.Random(seed)
+    worst, worst_params = 0, None
+    for _ in range(samples):
+        size = (rng.randint(1, 96), rng.randint(1, 96))
+        img = Image.frombytes("RGB", size, rng.randbytes(size[0] * size[1] * 3))
+        params = {name: round(rng.uniform(*COLOR_CHECK_RANGE), 2) for name in ("brightness", "contrast", "saturation")}
+        difference = ImageChops.difference(fused_color(img, **params), enhance_chain(img, **params))
+        diff = max(high for _low, high in difference.getextrema())
+        if diff > worst or worst_params is None:
+            worst, worst_params = diff, params
+    return worst, worst_params
+
+
+def build_cases(sizes, only=None):
+    """Visi atvejai: redagavimas (kiekviena raiška x variantas), spalvų varikliai, collage (stilius x išdėstymas), payload"""
+    cases = []
+    for mp in sizes:
+        for variant, params in OVERLAY_VARIANTS.items():
+            cases.append({"name": f"overlay/{mp}MP/{variant}", "kind": "overlay", "mp": mp, "params": params})
+
+    for mp in sizes:
+        for engine in COLOR_ENGINES if NUMPY_AVAILABLE else ["pil"]:
+            cases.append({"name": f"color/{mp}MP/{engine}", "kind": "color", "mp": mp, "engine": engine})
+
+    cases.append({"name": f"collage_tiles/{COLLAGE_SOURCE_MP}MP", "kind": "collage_tiles", "mp": COLLAGE_SOURCE_MP})
+    for style in COLLAGE_STYLES:
+        style_name = style.split(" - ")[0].split(" ", 1)[1]
+        for layout in COLLAGE_LAYOUTS:
+            cases.append({
+                "name": f"collage/{style_name}/{layout.split(' ')[0]}",
+                "kind": "collage", "mp": COLLAGE_SOURCE_MP, "style": style, "layout": layout
+            })
+
+    for mp in sizes:
+        cases.append({"name": f"payload/{mp}MP", "kind": "payload", "mp": mp})
+
+    if only:
+        cases = [case for case in cases if any(part in case["name"] for part in only)]
+    return cases
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _collage_tiles(sources):
+    """Collage plytelės kaip programoje: sumažinta raiška, be rėmelio, ženklas ant paskutinės"""
+    return [
+        render_overlay_image(
+            data, (COLLAGE_TILE_SIZE, COLLAGE_TILE_SIZE),
+            **AUTO_ENHANCE, **WATERMARK, add_watermark=i == len(sources) - 1, add_border=False
+        )
+        for i, data in enumerate(sources)
+    ]
+
+
+def _case_runner(case):
+    """Paruošia įvestis (nematuojama) ir grąžina matuojamą funkciją"""
+    kind = case["kind"]
+    if kind == "overlay":
+        data = _read(synthetic_image(case["mp"]))
+        params = {**AUTO_ENHANCE, **WATERMARK, **case["params"]}
+        return lambda: render_overlay(data, **params)
+
+    if kind == "payload":
+        data = _read(synthetic_image(case["mp"]))
+        return lambda: prepare_vision_payload(data)[0]
+
+    if kind == "color":
+        # Matuojamas tik spalvų koregavimas (dekodavimas - paruošimas)
+        img = Image.open(synthetic_image(case["mp"])).convert("RGB")
+        adjust = COLOR_ENGINES[case["engine"]]
+        return lambda: adjust(img, **AUTO_ENHANCE)
+
+    sources = [_read(synthetic_image(case["mp"], seed)) for seed in range(4)]
+    if kind == "collage_tiles":
+        return lambda: _collage_tiles(sources)
+
+    _rows, _cols, needed = parse_layout(case["layout"])
+    tiles = _collage_tiles(sources[:needed])
+
+    def run_collage():
+        random.seed(0)  # Scrapbook - atsitiktinis išdėstymas, bet kartojamas
+        collage = build_collage(tiles, case["style"], case["layout"], "Vasara", "Nėra")
+        return encode_collage(collage)
+
+    return run_collage
+
+
+def _proc_status_mb(field):
+    """VmRSS/VmHWM iš /proc/self/status (MB) arba None"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    """Atstato VmHWM (Linux >= 4.0). Grąžina True, jei pavyko"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return _proc_status_mb("VmHWM") is not None
+    except OSError:
+        return False
+
+
+def _max_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux - KB, macOS - baitai
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _output_size(output):
+    if isinstance(output, (bytes, str)):
+        return len(output)
+    if isinstance(output, Image.Image):
+        output = [output]
+    if isinstance(output, list):
+        return sum(img.width * img.height * len(img.getbands()) for img in output)
+    return 0
+
+
+def clear_caches():
+    """Tuščios talpyklos (etapų, šriftų, vandens ženklų) - kiekvienas kartojimas matuoja šaltą atvejį"""
+    stage_cache.clear()
+    watermark_sprite.cache_clear()
+    get_font.cache_clear()
+
+
+def run_case(case, repeat):
+    """Vykdo vieną atvejį (atskirame procese): kiekvienas kartojimas - su tuščiomis talpyklomis"""
+    run = _case_runner(case)
+    clear_caches()
+
+    hwm_available = _reset_peak_rss()
+    if hwm_available:
+        memory_before = _proc_status_mb("VmRSS")
+    elif RESOURCE_AVAILABLE:
+        memory_before = _max_rss_mb()
+    else:
+        tracemalloc.start()
+
+    timings = []
+    output = None
+    for _ in range(repeat):
+        clear_caches()
+        started = time.perf_counter()
+        output = run()
+        timings.append(time.perf_counter() - started)
+
+    if hwm_available:
+        peak_mb = _proc_status_mb("VmHWM") - memory_before
+    elif RESOURCE_AVAILABLE:
+        peak_mb = _max_rss_mb() - memory_before
+    else:
+        peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+
+    return {
+        "seconds": round(statistics.median(timings), 4),
+        "min_seconds": round(min(timings), 4),
+        "peak_mb": round(peak_mb, 1),
+        "output_bytes": _output_size(output),
+    }
+
+
+def compare(results, baseline, thresholds=THRESHOLDS):
+    """Grąžina {atvejis: [regresijų aprašymai]} pagal leistinas ribas"""
+    regressions = {}
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        problems = []
+        for metric, threshold in thresholds.items():
+            old, new = base.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            if metric == "seconds" and new - old < MIN_TIME_DELTA:
+                continue
+            if new > old * (1 + threshold):
+                problems.append(f"{metric} {old} -> {new} (+{(new / old - 1) * 100:.0f}%)")
+        if problems:
+            regressions[name] = problems
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Redagavimo, collage ir vision payload našumo testas (be tinklo)")
+    parser.add_argument("--sizes", type=int, nargs="+", choices=sorted(IMAGE_SIZES), default=sorted(IMAGE_SIZES), help="Nuotraukų raiškos (MP)")
+    parser.add_argument("--only", nargs="+", help="Vykdyti tik atvejus, kurių pavadinime yra nurodytas tekstas")
+    parser.add_argument("--repeat", type=int, default=3, help="Kartojimų kiekis kiekvienam atvejui")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Bazinės linijos JSON failas")
+    parser.add_argument("--save-baseline", action="store_true", help="Išsaugoti rezultatus kaip bazinę liniją")
+    parser.add_argument("--time-threshold", type=float, default=THRESHOLDS["seconds"], help="Leistinas laiko pablogėjimas (dalimis)")
+    parser.add_argument("--memory-threshold", type=float, default=THRESHOLDS["peak_mb"], help="Leistinas atminties pablogėjimas (dalimis)")
+    parser.add_argument("--size-threshold", type=float, default=THRESHOLDS["output_bytes"], help="Leistinas rezultato dydžio padidėjimas (dalimis)")
+    parser.add_argument("--json", help="Rezultatus įrašyti į JSON failą")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cases = build_cases(args.sizes, args.only)
+    if not cases:
+        print("❌ Nėra atvejų pagal --only filtrą", file=sys.stderr)
+        return 1
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+
+    color_check = check_color_engines()
+    if color_check is None:
+        print("ℹ️ NumPy nėra - spalvų variklių patikra praleista")
+    else:
+        worst, params = color_check
+        if worst > MAX_ABS_DIFF:
+            print(f"❌ fused_color skiriasi nuo enhance_chain {worst} lygiais (> {MAX_ABS_DIFF}), parametrai: {params}")
+            return 1
+        print(f"✅ Spalvų varikliai sutampa (didžiausias skirtumas {worst} <= {MAX_ABS_DIFF}, {COLOR_CHECK_SAMPLES} vaizdai)")
+
+    print(f"🏁 {len(cases)} atvejai, {args.repeat} kartojimai (Python {platform.python_version()}, Pillow {PIL_VERSION})")
+    print("   Sintetinės nuotraukos ruošiamos (pirmą kartą gali užtrukti)...")
+    for mp in set(args.sizes) | {COLLAGE_SOURCE_MP}:
+        for seed in range(4 if mp == COLLAGE_SOURCE_MP else 1):
+            synthetic_image(mp, seed)
+
+    # Kiekvienas atvejis - naujame procese, po vieną (laikai nesikerta)
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    print(f"{'Atvejis':<42} {'Laikas s':>9} {'Min s':>8} {'Pikas MB':>9} {'Dydis KB':>10}  Palyginimas")
+    for case in cases:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(run_case, case, args.repeat).result()
+        results[case["name"]] = result
+
+        base = baseline.get(case["name"])
+        delta = f"{(result['seconds'] / base['seconds'] - 1) * 100:+.0f}% laiko" if base and base.get("seconds") else ""
+        print(
+            f"{case['name']:<42} {result['seconds']:>9.3f} {result['min_seconds']:>8.3f} "
+            f"{result['peak_mb']:>9.1f} {result['output_bytes'] / 1024:>10.1f}  {delta}"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "pillow": PIL_VERSION,
+                "machine": platform.machine(),
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"💾 Bazinė linija išsaugota: {args.baseline}")
+        return 0
+
+    if not baseline:
+        print("ℹ️ Bazinės linijos nėra - palyginimas praleistas (naudokite --save-baseline)")
+        return 0
+
+    thresholds = {"seconds": args.time_threshold, "peak_mb": args.memory_threshold, "output_bytes": args.size_threshold}
+    regressions = compare(results, baseline, thresholds)
+    if regressions:
+        print(f"❌ Regresijos ({len(regressions)}):")
+        for name, problems in regressions.items():
+            print(f"   {name}: {'; '.join(problems)}")
+        return 1
+
+    print("✅ Regresijų nėra")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
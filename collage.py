@@ -0,0 +1,217 @@
+import io, random
+from PIL import Image, ImageOps
+
+COLLAGE_STYLES = [
+    "📸 Polaroid - Nuotraukos su baltais rėmeliais, pasuktos",
+    "📱 Instagram Grid - Tvarkingas tinklelis su tarpais",
+    "🎨 Scrapbook - Kūrybiškas, atsitiktinis išdėstymas",
+    "🖼️ Gallery Wall - Galerijos siena su juodais rėmeliais",
+    "✨ Minimalist - Minimalus stilius, baltas fonas"
+]
+
+COLLAGE_LAYOUTS = ["2x2 Grid (4 nuotraukos)", "1x2 Horizontal (2 nuotraukos)", "2x1 Vertical (2 nuotraukos)", "1x3 Horizontal (3 nuotraukos)", "3x1 Vertical (3 nuotraukos)"]
+
+# Trumpi pavadinimai (komandinei eilutei): "Polaroid", "2x2" - build_collage juos atpažįsta taip pat
+COLLAGE_STYLE_NAMES = [style.split(" - ")[0].split(" ", 1)[1] for style in COLLAGE_STYLES]
+COLLAGE_LAYOUT_NAMES = [layout.split(" ")[0] for layout in COLLAGE_LAYOUTS]
+
+# Didžiausia collage plytelės kraštinė (Scrapbook iki 650px) - tiek užtenka dekoduoti
+COLLAGE_TILE_SIZE = 650
+
+
+def parse_layout(collage_layout):
+    """Grąžina (eilutės, stulpeliai, reikalingas nuotraukų kiekis) pagal išdėstymo pavadinimą"""
+    if "2x2" in collage_layout:
+        return 2, 2, 4
+    elif "1x2" in collage_layout:
+        return 1, 2, 2
+    elif "2x1" in collage_layout:
+        return 2, 1, 2
+    elif "1x3" in collage_layout:
+        return 1, 3, 3
+    elif "3x1" in collage_layout:
+        return 3, 1, 3
+    raise ValueError(f"Nežinomas išdėstymas: {collage_layout}")
+
+
+def background_color(season, holiday):
+    """Automatiškai nustatome fono spalvą pagal sezoną/šventę"""
+    if holiday != "Nėra":
+        if "Kalėdos" in holiday:
+            bg_color = (235, 245, 240)
+        elif "Velykos" in holiday:
+            bg_color = (255, 250, 235)
+        elif "Valentino" in holiday:
+            bg_color = (255, 245, 248)
+        elif "Naujieji" in holiday:
+            bg_color = (240, 245, 255)
+        else:
+            bg_color = (245, 245, 240)
+    else:
+        if season == "Pavasaris":
+            bg_color = (248, 252, 245)
+        elif season == "Vasara":
+            bg_color = (255, 252, 240)
+        elif season == "Ruduo":
+            bg_color = (250, 245, 235)
+        else:
+            bg_color = (245, 248, 252)
+    return bg_color
+
+
+def canvas_size(collage_style, collage_layout):
+    """Pilno dydžio collage drobės matmenys (plotis, aukštis) pagal stilių ir išdėstymą"""
+    rows, cols, needed = parse_layout(collage_layout)
+    if "Polaroid" in collage_style:
+        return {4: (1800, 1800), 3: (2000, 1200)}.get(needed, (1600, 1200))
+    if "Scrapbook" in collage_style:
+        return {4: (1900, 1900), 3: (2100, 1300)}.get(needed, (1700, 1300))
+    if "Instagram Grid" in collage_style:
+        img_size, gap = 600, 30
+    elif "Gallery Wall" in collage_style:
+        img_size, gap = 550, 40
+    elif "Minimalist" in collage_style:
+        img_size, gap = 600, 60
+    else:
+        raise ValueError(f"Nežinomas collage stilius: {collage_style}")
+    return cols * img_size + (cols + 1) * gap, rows * img_size + (rows + 1) * gap
+
+
+def build_collage(edited_images, collage_style, collage_layout, season, holiday, seed=None, scale=1.0):
+    """
+    Sukuria tematinį collage iš redaguotų nuotraukų (PIL vaizdų).
+    Stilius ir išdėstymas atpažįstami pagal pavadinimo dalį (pvz. "Polaroid", "2x2").
+    seed - atsitiktinio išdėstymo (Scrapbook) sėkla: su ta pačia sėkla collage kartojasi.
+    scale - mastelis (miniatiūroms): visi dydžiai, tarpai ir rėmeliai sumažinami, išdėstymas lieka tas pats.
+    """
+    rng = random.Random(seed) if seed is not None else random
+    rows, cols, needed = parse_layout(collage_layout)
+
+    def px(value):
+        return max(1, round(value * scale))
+
+    # Apkarpome jei per daug
+    edited_images = list(edited_images[:needed])
+
+    # Jei per mažai - dubliuojame
+    while len(edited_images) < needed:
+        edited_images.append(edited_images[-1])
+
+    bg_color = background_color(season, holiday)
+    canvas_width, canvas_height = canvas_size(collage_style, collage_layout)
+
+    # ============ POLAROID STILIUS ============
+    if "Polaroid" in collage_style:
+        polaroid_width = 500
+        polaroid_height = 500
+        border_size = 20
+        bottom_border = 60
+
+        if needed == 4:
+            positions = [(200, 150, -8), (850, 100, 12), (300, 850, 5), (950, 900, -10)]
+        elif needed == 3:
+            positions = [(200, 250, -10), (750, 150, 8), (450, 700, -5)]
+        else:
+            positions = [(250, 300, -12), (850, 350, 8)]
+
+        collage = Image.new('RGB', (px(canvas_width), px(canvas_height)), bg_color)
+
+        for idx, img in enumerate(edited_images[:needed]):
+            img_resized = img.resize((px(polaroid_width), px(polaroid_height)), Image.Resampling.LANCZOS)
+            polaroid_img = Image.new('RGB', 
+                (px(polaroid_width + border_size * 2), 
+                 px(polaroid_height + border_size + bottom_border)), 
+                (255, 255, 255))
+            polaroid_img.paste(img_resized, (px(border_size), px(border_size)))
+
+            x, y, angle = positions[idx]
+            rotated = polaroid_img.rotate(angle, expand=True, fillcolor=bg_color)
+            collage.paste(rotated, (px(x), px(y)))
+
+    # ============ INSTAGRAM GRID STILIUS ============
+    elif "Instagram Grid" in collage_style:
+        img_size = 600
+        gap = 30
+
+        collage = Image.new('RGB', (px(canvas_width), px(canvas_height)), bg_color)
+
+        idx = 0
+        for row in range(rows):
+            for col in range(cols):
+                if idx < len(edited_images):
+                    img_resized = edited_images[idx].resize((px(img_size), px(img_size)), Image.Resampling.LANCZOS)
+                    x = gap + col * (img_size + gap)
+                    y = gap + row * (img_size + gap)
+                    collage.paste(img_resized, (px(x), px(y)))
+                    idx += 1
+
+    # ============ SCRAPBOOK STILIUS ============
+    elif "Scrapbook" in collage_style:
+        collage = Image.new('RGB', (px(canvas_width), px(canvas_height)), bg_color)
+
+        # Atsitiktiniai dydžiai ir pozicijos (skaičiuojami pilnam dydžiui - miniatiūra atrodo taip pat)
+        for idx, img in enumerate(edited_images[:needed]):
+            size_var = rng.randint(450, 650)
+            img_resized = img.resize((px(size_var), px(size_var)), Image.Resampling.LANCZOS)
+
+            # Pridedame atsitiktinį rėmelį
+            border_color = rng.choice([(255,255,255), (250,250,240), (245,240,235)])
+            border_width = rng.randint(15, 35)
+            bordered = ImageOps.expand(img_resized, border=px(border_width), fill=border_color)
+
+            # Atsitiktinė pozicija ir kampas
+            max_x = canvas_width - (size_var + 2 * border_width) - 100
+            max_y = canvas_height - (size_var + 2 * border_width) - 100
+            x = rng.randint(50, max(51, max_x))
+            y = rng.randint(50, max(51, max_y))
+            angle = rng.randint(-15, 15)
+
+            rotated = bordered.rotate(angle, expand=True, fillcolor=bg_color)
+            collage.paste(rotated, (px(x), px(y)))
+
+    # ============ GALLERY WALL STILIUS ============
+    elif "Gallery Wall" in collage_style:
+        img_size = 550
+        gap = 40
+
+        collage = Image.new('RGB', (px(canvas_width), px(canvas_height)), (240, 240, 240))
+
+        idx = 0
+        for row in range(rows):
+            for col in range(cols):
+                if idx < len(edited_images):
+                    img_resized = edited_images[idx].resize((px(img_size), px(img_size)), Image.Resampling.LANCZOS)
+                    # Juodas rėmelis
+                    framed = ImageOps.expand(img_resized, border=px(15), fill=(20, 20, 20))
+                    x = gap + col * (img_size + gap)
+                    y = gap + row * (img_size + gap)
+                    collage.paste(framed, (px(x), px(y)))
+                    idx += 1
+
+    # ============ MINIMALIST STILIUS ============
+    elif "Minimalist" in collage_style:
+        img_size = 600
+        gap = 60
+
+        collage = Image.new('RGB', (px(canvas_width), px(canvas_height)), (255, 255, 255))
+
+        idx = 0
+        for row in range(rows):
+            for col in range(cols):
+                if idx < len(edited_images):
+                    img_resized = edited_images[idx].resize((px(img_size), px(img_size)), Image.Resampling.LANCZOS)
+                    # Labai plonas pilkas rėmelis
+                    framed = ImageOps.expand(img_resized, border=px(2), fill=(200, 200, 200))
+                    x = gap + col * (img_size + gap)
+                    y = gap + row * (img_size + gap)
+                    collage.paste(framed, (px(x), px(y)))
+                    idx += 1
+
+    return collage
+
+
+def encode_collage(collage):
+    """Išsaugome collage į JPEG baitus"""
+    collage_bytes = io.BytesIO()
+    collage.save(collage_bytes, format='JPEG', quality=95)
+    return collage_bytes.getvalue()
@@ -0,0 +1,99 @@
+import io, os, math, time, logging, threading, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image
+from collage import COLLAGE_STYLES, COLLAGE_TILE_SIZE, build_collage, canvas_size
+
+logger = logging.getLogger(__name__)
+
+# ---------- Nustatymai ----------
+# Visų stilių palyginimas: mažos miniatiūros, pilnas collage - tik pasirinktam stiliui
+COMPARE_THUMBNAIL_EDGE = int(os.getenv("COLLAGE_COMPARE_EDGE", "480"))
+COMPARE_JPEG_QUALITY = int(os.getenv("COLLAGE_COMPARE_QUALITY", "75"))
+# Procesų kiekis (1 - be procesų baseino, viskas vykdoma šiame procese)
+COMPARE_WORKERS = int(os.getenv("COLLAGE_COMPARE_WORKERS", str(min(len(COLLAGE_STYLES), os.cpu_count() or 1))))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def compare_pool():
+    """
+    Procesų baseinas stiliams (vienas procesui, kuriamas pirmą kartą prireikus).
+    "spawn" - fork iš daugiagijio Streamlit serverio nėra saugus.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=COMPARE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def thumbnail_scale(collage_style, collage_layout, max_edge):
+    """Mastelis, kuriuo collage piešiamas tiesiai miniatiūros dydžio"""
+    return min(1.0, max_edge / max(canvas_size(collage_style, collage_layout)))
+
+
+def pack_tiles(tiles, edge):
+    """
+    Plytelės -> (režimas, dydis, baitai): vieną kartą sumažinamos iki edge x edge kvadrato
+    (visi stiliai plyteles ištempia į kvadratus) ir siunčiamos visiems stiliams.
+    """
+    packed = []
+    for tile in tiles:
+        if tile.mode != "RGB":
+            tile = tile.convert("RGB")
+        tile = tile.resize((edge, edge), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        packed.append((tile.mode, tile.size, tile.tobytes()))
+    return packed
+
+
+def render_thumbnail(packed_tiles, collage_style, collage_layout, season, holiday, seed, max_edge, quality):
+    """Vieno stiliaus collage miniatiūra (JPEG baitai) - vykdoma baseino procese"""
+    tiles = [Image.frombytes(mode, size, data) for mode, size, data in packed_tiles]
+    # Piešiama iškart miniatiūros masteliu (plytelės, tarpai, rėmeliai) - ne pilnas collage ir sumažinimas
+    scale = thumbnail_scale(collage_style, collage_layout, max_edge)
+    collage = build_collage(tiles, collage_style, collage_layout, season, holiday, seed=seed, scale=scale)
+
+    output = io.BytesIO()
+    collage.save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+
+def render_style_thumbnails(tiles, collage_layout, season, holiday, seed, styles=None, max_edge=None, quality=None):
+    """
+    Visų stilių miniatiūros lygiagrečiai: {stilius: JPEG baitai}.
+    Tos pačios plytelės ir sėkla - pasirinkto stiliaus pilnas collage atrodys taip pat.
+    """
+    styles = styles or COLLAGE_STYLES
+    max_edge = max_edge or COMPARE_THUMBNAIL_EDGE
+    quality = quality or COMPARE_JPEG_QUALITY
+    # Didžiausia plytelė (Scrapbook) didžiausiu iš stilių masteliu
+    edge = math.ceil(COLLAGE_TILE_SIZE * max(thumbnail_scale(style, collage_layout, max_edge) for style in styles))
+    packed = pack_tiles(tiles, edge)
+    args = (collage_layout, season, holiday, seed, max_edge, quality)
+
+    if COMPARE_WORKERS > 1:
+        try:
+            pool = compare_pool()
+            futures = {style: pool.submit(render_thumbnail, packed, style, *args) for style in styles}
+            return {style: future.result() for style, future in futures.items()}
+        except BrokenProcessPool as e:
+            # Procesas nutrūko (pvz. trūko atminties) - baseiną kursime iš naujo, dabar - šiame procese
+            logger.warning("Collage procesų baseinas sugedo: %s", e)
+            _reset_pool()
+
+    return {style: render_thumbnail(packed, style, *args) for style in styles}
+
+
+def new_seed():
+    """Palyginimo sėkla (miniatiūroms ir vėliau pasirinktam pilnam collage)"""
+    return time.time_ns() & 0xFFFFFFFF
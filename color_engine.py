@@ -0,0 +1,87 @@
+import os
+from PIL import Image, ImageEnhance
+
+# NumPy neprivalomas - be jo naudojama įprasta ImageEnhance grandinė
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Spalvų variklis: "fused" (vienas sulietas praėjimas) arba "pil" (trys ImageEnhance praėjimai)
+COLOR_ENGINE = os.getenv("COLOR_ENGINE", "fused" if NUMPY_AVAILABLE else "pil")
+
+# Didžiausias skirtumas nuo ImageEnhance grandinės (kanalo lygiais, 0-255)
+MAX_ABS_DIFF = 2
+
+# Pillow "L" konversijos svoriai (ITU-R 601-2, fiksuoto kablelio /65536)
+LUMA_WEIGHTS = (19595 / 65536, 38470 / 65536, 7471 / 65536)
+
+
+def _blend_lut(lut, base, alpha):
+    """
+    Image.blend semantika LUT reikšmėms: base + alpha * (lut - base).
+    Skaičiuojama float32 (kaip Pillow C kode), apkarpoma ir nukertama iki sveikojo.
+    """
+    alpha = np.float32(alpha)
+    temp = np.float32(base) + alpha * (lut - np.float32(base))
+    return np.clip(temp, 0, 255).astype(np.uint8).astype(np.float32)
+
+
+def enhance_chain(img, brightness=1.0, contrast=1.0, saturation=1.0):
+    """Originali grandinė: ImageEnhance.Brightness -> Contrast -> Color (trys pilni praėjimai)"""
+    if brightness != 1.0:
+        img = ImageEnhance.Brightness(img).enhance(brightness)
+
+    if contrast != 1.0:
+        img = ImageEnhance.Contrast(img).enhance(contrast)
+
+    if saturation != 1.0:
+        img = ImageEnhance.Color(img).enhance(saturation)
+
+    return img
+
+
+def fused_color(img, brightness=1.0, contrast=1.0, saturation=1.0):
+    """
+    Šviesumas, kontrastas ir sodrumas vienu sulietu praėjimu (RGB vaizdui):
+    - Šviesumas ir kontrastas visiems kanalams yra ta pati funkcija, todėl sujungiami į vieną 256 reikšmių LUT
+      (img.point - vienas C praėjimas)
+    - Kontrasto vidurkis skaičiuojamas iš kanalų histogramos (be atskiros pilkos kopijos)
+    - Sodrumas yra tiesinis maišymas su pilka versija, t.y. 3x3 matrica (img.convert su matrica - vienas C praėjimas)
+    Rezultatas sutampa su enhance_chain ±MAX_ABS_DIFF lygių tikslumu (skiriasi tik apvalinimas).
+    """
+    identity = np.arange(256, dtype=np.float32)
+    lut = identity
+    if brightness != 1.0:
+        # Brightness = blend(juodas, img, brightness)
+        lut = _blend_lut(lut, 0, brightness)
+
+    if contrast != 1.0:
+        # Contrast = blend(vidurkio pilkuma, img, contrast); vidurkis - po šviesumo korekcijos
+        hist = np.asarray(img.histogram(), dtype=np.float64).reshape(3, 256)
+        channel_means = (hist * lut).sum(axis=1) / (img.width * img.height)
+        mean = int(float(np.dot(LUMA_WEIGHTS, channel_means)) + 0.5)
+        lut = _blend_lut(lut, mean, contrast)
+
+    if not np.array_equal(lut, identity):
+        img = img.point(lut.astype(np.uint8).tolist() * 3)
+
+    if saturation != 1.0:
+        # Color = blend(pilka, img, saturation) => out = saturation * c + (1 - saturation) * L
+        # Poslinkis -0.5 paverčia matricos apvalinimą į Image.blend nukirtimą
+        matrix = []
+        for channel in range(3):
+            row = [(1 - saturation) * w for w in LUMA_WEIGHTS]
+            row[channel] += saturation
+            matrix += row + [-0.5 + 1e-4]
+        img = img.convert("RGB", matrix)
+
+    return img
+
+
+def apply_color(img, brightness=1.0, contrast=1.0, saturation=1.0):
+    """Spalvų koregavimas pasirinktu varikliu (COLOR_ENGINE)"""
+    if COLOR_ENGINE == "fused" and NUMPY_AVAILABLE and img.mode == "RGB":
+        return fused_color(img, brightness, contrast, saturation)
+    return enhance_chain(img, brightness, contrast, saturation)
@@ -0,0 +1,563 @@
+import os, re, json, time, base64, logging
+from ai_cache import CACHE_DIR, DiskCache, analysis_cache
+from image_hash import fingerprint
+from similar_index import similar_index
+from instrumentation import stage, record_usage
+from rate_limiter import create_completion
+
+logger = logging.getLogger(__name__)
+
+# Vaizdų analizės modelis ir prompt'o versija (keičiant prompt'ą - pakelti versiją, kad talpykla nebūtų naudojama)
+ANALYSIS_MODEL = "gpt-4o-mini"
+ANALYSIS_PROMPT_VERSION = "v1"
+
+ANALYSIS_SYSTEM_PROMPT = """Tu esi langų uždangalų ir žaliuzių produktų atpažinimo EKSPERTAS. 
+Tavo užduotis - TIKSLIAI ir DETALIZUOTAI identifikuoti KIEKVIENĄ produktą nuotraukoje."""
+
+ANALYSIS_USER_PROMPT = """Analizuok šią nuotrauką kaip ŽALIUZIŲ EKSPERTAS ir BŪTINAI nurodyk:
+
+1. **PRODUKTO TIPAS IR KIEKIS** (labai svarbu!):
+   ⚠️ Jei matai KELIS skirtingus produktus - BŪTINAI aprašyk KIEKVIENĄ ATSKIRAI!
+   Produktų tipai:
+   - Roletai (tekstiliniai, roll-up blinds)
+   - Roletai Diena-Naktis / Zebra (duo blinds su juostelėmis)
+   - Horizontalios žaliuzės / Venetian (horizontalios lamelės)
+   - Vertikalios žaliuzės (vertikalios lamelės)
+   - Plisuotos žaliuzės / Pleated (sulankstomos)
+   - Medinės žaliuzės / Wood blinds (medžio lamelės)
+   - Romanetės / Roman shades
+   - Lamelės / Panel blinds
+   - Užuolaidos / Curtains
+
+2. **SPALVOS, MEDŽIAGA, TEKSTŪRA**:
+   - Tikslios spalvos (balta, pilka, smėlio, mėlyna, etc.)
+   - Medžiaga (medis, audinys, PVC, aliuminis)
+   - Ar matinė, blizgi, skaidri, tamsinanti
+
+3. **MONTAVIMO VIETA IR KAMBARYS**:
+   - Kokio tipo kambarys (svetainė, miegamasis, virtuvė, biuras)
+   - Kaip sumontuota (sienoje, lubose, lange)
+
+4. **VIZUALINĖS DETALĖS**:
+   - Apšvietimas (dienos šviesa, dirbtinė)
+   - Interjero stilius
+   - Vandens ženklas ar tekstas (jei yra)
+   - Vaizdas pro langą
+
+PRIVALOMA: Pradėk aprašymą nuo TIKSLAUS produkto tipo. 
+Pavyzdys: "Nuotraukoje matosi TRYS SKIRTINGI PRODUKTAI: 1) PLISUOTOS ŽALIUZĖS pilkos spalvos, 2) MEDINĖS HORIZONTALIOS ŽALIUZĖS šviesaus ąžuolo, 3) ROLETAI DIENA-NAKTIS balti..." """
+
+# Atsakymo ilgis vienos nuotraukos analizei (tokenais)
+ANALYSIS_MAX_TOKENS = 500
+
+# Vieno kvietimo laiko riba sekundėmis (bendri ryšio nustatymai - openai_client.py)
+ANALYSIS_TIMEOUT = float(os.getenv("ANALYSIS_TIMEOUT", "30"))
+CAPTION_TIMEOUT = float(os.getenv("CAPTION_TIMEOUT", "60"))
+
+
+def analyze_image(client, image_bytes, detail="auto", reuse_similar=False):
+    """
+    Naudoja GPT-4o-mini vaizdo analizei su konkrečiu produktų atpažinimu (rezultatai talpinami diske).
+    reuse_similar - beveik vienodai ir tų pačių spalvų, jau analizuotai nuotraukai (similar_index.py) naudojama jos analizė.
+    """
+    with stage("analyze_image", bytes_in=len(image_bytes), detail=detail) as entry:
+        cache_key = analysis_cache.make_key(ANALYSIS_MODEL, ANALYSIS_PROMPT_VERSION, detail, image_bytes)
+        cached = analysis_cache.get(cache_key)
+        entry["cache_hit"] = cached is not None
+        if cached is not None:
+            return cached
+        
+        namespace = f"{ANALYSIS_MODEL}:{ANALYSIS_PROMPT_VERSION}:{detail}"
+        photo_fingerprint = fingerprint(base64.b64decode(image_bytes))
+        similar = similar_index.lookup(photo_fingerprint, namespace) if reuse_similar else None
+        if similar is not None:
+            analysis, distance = similar
+            entry["cache_hit"] = True
+            entry["similar_distance"] = distance
+            analysis_cache.set(cache_key, analysis)
+            return analysis
+        
+        analysis = _request_analysis(client, image_bytes, detail, entry)
+        analysis_cache.set(cache_key, analysis)
+        similar_index.add(photo_fingerprint, namespace, analysis)
+        return analysis
+
+def _request_analysis(client, image_bytes, detail, entry):
+    """Vaizdo analizės užklausa (be talpyklos); tokenai įrašomi į diagnostikos įrašą"""
+    response = create_completion(
+        client,
+        model=ANALYSIS_MODEL,
+        messages=[
+            {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+            {"role": "user", "content": [
+                {"type": "text", "text": ANALYSIS_USER_PROMPT},
+                {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64," + image_bytes, "detail": detail}}
+            ]}
+        ],
+        max_tokens=ANALYSIS_MAX_TOKENS,
+        timeout=ANALYSIS_TIMEOUT
+    )
+    record_usage(entry, response.usage)
+    return response.choices[0].message.content.strip()
+
+# Tekstų modelis ir prompt'o versija (keičiant prompt'ą - pakelti versiją)
+CAPTION_MODEL = "gpt-4o-mini"
+CAPTION_PROMPT_VERSION = "v2"
+
+# ULTRA GRIEŽTA sezonų ir švenčių kontrolė
+SEASON_RULES = {
+    "Pavasaris": {
+        "must_have": ["pavasari", "atsinaujinim", "šviesi", "gaivu", "pavasario"],
+        "forbidden": ["žiem", "šalt", "snieg", "kalėd", "ruduo", "ruden", "vasara", "vasar", "karšt"],
+        "message": "pavasario gaivumą ir šviesumą"
+    },
+    "Vasara": {
+        "must_have": ["vasara", "vasar", "saulė", "šilum", "vėsin", "karšt"],
+        "forbidden": ["žiem", "šalt", "snieg", "kalėd", "pavasa", "ruduo", "ruden"],
+        "message": "vasaros šviesumą ir vėsumą"
+    },
+    "Ruduo": {
+        "must_have": ["ruden", "jauk", "šilt", "rudeni", "ruduo"],
+        "forbidden": ["žiem", "kalėd", "pavasa", "vasara", "karšt", "sniegas"],
+        "message": "rudenio jaukumą"
+    },
+    "Žiema": {
+        "must_have": ["žiem", "šalt", "šilum", "kalėd"],
+        "forbidden": ["pavasa", "vasara", "ruden", "karšt", "velyk"],
+        "message": "žiemos šilumą"
+    }
+}
+
+# Švenčių kontrolė
+HOLIDAY_RULES = {
+    "Velykos": {
+        "must_have": ["velyk", "velykini", "pavasari"],
+        "forbidden": ["kalėd", "nauj metin", "žiem"],
+        "keywords": "Velykų, pavasario šventės, šeimos susibūrimas"
+    },
+    "Šv. Kalėdos": {
+        "must_have": ["kalėd", "švent", "žiem"],
+        "forbidden": ["velyk", "pavasa", "vasara"],
+        "keywords": "Kalėdų, žiemos švenčių, dovanų"
+    },
+    "Kūčios": {
+        "must_have": ["kūč", "kalėd", "žiem"],
+        "forbidden": ["velyk", "pavasa"],
+        "keywords": "Kūčių, šventinės vakarienės, šeimos"
+    },
+    "Šv. Valentino diena": {
+        "must_have": ["valentin", "meilė"],
+        "forbidden": ["kalėd", "velyk"],
+        "keywords": "Valentino dienos, meilės, romantikos"
+    }
+}
+
+# Sistemos žinutė ir taisyklių dalis nesikeičia tarp užklausų - bendras prefiksas
+# leidžia OpenAI pakartotinai naudoti jau apdorotus tokenus (prompt caching).
+# Kas keičiasi (sezonas, šventė, analizė) - tik užklausos pabaigoje.
+CAPTION_SYSTEM_PROMPT = "Tu esi AI asistentas. ABSOLIUTI TAISYKLĖ: rašai TIK apie sezoną ir šventę, nurodytus užklausos skiltyje \"ŠIOS UŽKLAUSOS DUOMENYS\". Tu NIEKADA nerašai apie kitus sezonus ar šventes. Jei bandysi pažeisti - tekstas bus atmestas."
+
+CAPTION_RULES_PROMPT = """KRITIŠKAI SVARBU! Perskaityk šias taisykles 3 KARTUS prieš rašydamas:
+
+═══════════════════════════════════════
+🚨 ABSOLIUČIOS TAISYKLĖS (NEGALIMA PAŽEISTI!) 🚨
+═══════════════════════════════════════
+
+1. Rašyk TIK apie SEZONĄ ir ŠVENTĘ iš skilties "ŠIOS UŽKLAUSOS DUOMENYS" (užklausos pabaigoje)
+2. Kiekviename tekste PRIVALOMA naudoti bent vieną PRIVALOMĄ žodį
+3. GRIEŽTAI DRAUDŽIAMA naudoti DRAUDŽIAMUS žodžius
+4. Produktus vadink tiksliais pavadinimais iš nuotraukų analizės
+
+═══════════════════════════════════════
+📝 UŽDUOTIS: Sukurk 3 tekstus (iki 250 simbolių kiekvienas)
+═══════════════════════════════════════
+
+**TEKSTO PAVYZDYS KĄ RAŠYTI:**
+"Pavasario gaivumas su mūsų žaliuzėmis! 🌸 Šviesios spalvos, atsinaujinimas, nauji sprendimai Velykų proga!"
+
+**TEKSTO PAVYZDYS KO NERAŠYTI:**
+"Žiemos šiluma..." ❌ (jei sezonas PAVASARIS!)
+"Kalėdų dovanos..." ❌ (jei šventė VELYKOS!)
+
+═══════════════════════════════════════
+
+VARIANTAS 1 - MARKETINGINIS 💼
+- Profesionalus tonas
+- Produktų privalumai + sezono nuotaika
+- Šventės kontekstas (jei nurodyta šventė)
+- 2-3 hashtag'us
+
+VARIANTAS 2 - DRAUGIŠKAS 🏡
+- Šiltas tonas
+- Praktiška nauda + sezono nuotaika
+- Šventės jaukumas (jei nurodyta šventė)
+- 1-2 hashtag'us
+
+VARIANTAS 3 - SU HUMORU 😄
+- Linksmas tonas
+- Juokas + sezono nuotaika
+- Šventė su šypsena (jei nurodyta šventė)
+- 2-3 hashtag'us
+
+═══════════════════════════════════════
+⚠️ PRIEŠ SIŲSDAMAS ATSAKYMĄ - PATIKRINK:
+═══════════════════════════════════════
+1. Ar KIEKVIENAME tekste yra bent vienas PRIVALOMAS žodis?
+2. Ar NĖRA nei vieno DRAUDŽIAMO žodžio?
+3. Ar produktai paminėti tiksliais pavadinimais?
+
+Jei bent vienas patikrinimas FAILED - PERRAŠYK tekstus!
+
+Atskirk variantus su "---"
+Rašyk LIETUVIŠKAI.
+"""
+
+
+def _rule_lists(season, holiday):
+    """Grąžina (sezono taisyklės, šventės taisyklės arba None, privalomi, draudžiami) žodžių kamienai"""
+    current_season = SEASON_RULES.get(season, SEASON_RULES["Pavasaris"])
+    current_holiday = HOLIDAY_RULES.get(holiday) if holiday != "Nėra" else None
+    
+    forbidden_list = current_season["forbidden"].copy()
+    must_have_list = current_season["must_have"].copy()
+    
+    if current_holiday:
+        forbidden_list.extend(current_holiday["forbidden"])
+        must_have_list.extend(current_holiday["must_have"])
+    return current_season, current_holiday, must_have_list, forbidden_list
+
+def _compile_rules(season, holiday):
+    """Sezono ir šventės taisyklių blokas (kintama užklausos dalis, be analizės)"""
+    current_season, current_holiday, must_have_list, forbidden_list = _rule_lists(season, holiday)
+    
+    if current_holiday:
+        holiday_text = f"""🎄 PRIVALOMA ŠVENTĖ: {holiday}
+Kiekviename tekste TURI būti: {current_holiday["keywords"]}
+NIEKADA nerašyk apie: {', '.join(current_holiday["forbidden"])}"""
+    elif holiday != "Nėra":
+        holiday_text = f"🎉 ŠVENTĖ: {holiday} - įtrauk šventės kontekstą į tekstus"
+    else:
+        holiday_text = "Šventės nėra - nerašyk apie jokias šventes!"
+    
+    return f"""═══════════════════════════════════════
+📌 ŠIOS UŽKLAUSOS DUOMENYS
+═══════════════════════════════════════
+
+📅 SEZONAS: {season.upper()}
+Sezono nuotaika: {current_season["message"]}
+✅ PRIVALOMA naudoti šiuos žodžius: {', '.join(must_have_list)}
+❌ GRIEŽTAI DRAUDŽIAMA naudoti: {', '.join(forbidden_list)}
+
+{holiday_text}
+"""
+
+# Visi žinomi sezono/šventės deriniai paruošiami vieną kartą (importuojant)
+RULE_BLOCKS = {
+    (season, holiday): _compile_rules(season, holiday)
+    for season in SEASON_RULES
+    for holiday in [*HOLIDAY_RULES, "Nėra"]
+}
+
+def rules_block(season, holiday):
+    """Paruoštas taisyklių blokas (kitoms šventėms - sukuriamas)"""
+    return RULE_BLOCKS.get((season, holiday)) or _compile_rules(season, holiday)
+
+def caption_request(analysis_text, season, holiday):
+    """
+    Paruošia užklausos parametrus 3 teksto variantams (bendra generate_captions ir stream_captions).
+    Pastovus prefiksas (sistemos žinutė + taisyklės) + maža kintama dalis gale (sezonas, šventė, analizė).
+    """
+    variable_part = f"""{rules_block(season, holiday)}
+📋 PRODUKTAI (iš nuotraukų):
+{analysis_text}
+"""
+    
+    return dict(
+        model=CAPTION_MODEL,
+        messages=[
+            {"role": "system", "content": CAPTION_SYSTEM_PROMPT},
+            {"role": "user", "content": CAPTION_RULES_PROMPT + "\n" + variable_part}
+        ],
+        temperature=0.5,  # DAR sumažinta - maksimalus tikslumas
+        max_tokens=1200,
+        timeout=CAPTION_TIMEOUT
+    )
+
+def _log_caption_usage(usage):
+    """Žurnale - tokenų kiekiai (kiek prompt'o tokenų paimta iš OpenAI prefiksų talpyklos)"""
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
+    logger.info(
+        "Tekstų užklausa: %d prompt tokenų (iš jų talpykloje %d, %.0f%%), %d atsakymo tokenų",
+        usage.prompt_tokens, cached, 100 * cached / max(1, usage.prompt_tokens), usage.completion_tokens
+    )
+
+def generate_captions(client, analysis_text, season, holiday):
+    """Sukuria 3 teksto variantus lietuviškai pagal tikslią produkto analizę"""
+    with stage("generate_captions", bytes_in=len(analysis_text.encode())) as entry:
+        response = create_completion(client, **caption_request(analysis_text, season, holiday))
+        record_usage(entry, response.usage)
+        _log_caption_usage(response.usage)
+        return response.choices[0].message.content.strip()
+
+def stream_captions(client, analysis_text, season, holiday):
+    """Kaip generate_captions, bet grąžina teksto gabalus vos jie atkeliauja (stream=True)"""
+    started = time.perf_counter()
+    with stage("generate_captions", bytes_in=len(analysis_text.encode()), stream=True) as entry:
+        stream = create_completion(
+            client,
+            **caption_request(analysis_text, season, holiday),
+            stream=True,
+            stream_options={"include_usage": True}  # Paskutiniame gabale - tokenų kiekiai
+        )
+        for chunk in stream:
+            if chunk.usage is not None:
+                record_usage(entry, chunk.usage)
+                _log_caption_usage(chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                entry.setdefault("first_token_seconds", round(time.perf_counter() - started, 6))
+                yield chunk.choices[0].delta.content
+
+def split_variants(captions):
+    """Padalina atsakymą į variantus pagal "---" skirtuką (tušti gabalai praleidžiami)"""
+    return [variant.strip() for variant in captions.split("---") if variant.strip()]
+
+# Greitas režimas: visos nuotraukos ir tekstų nurodymai viena užklausa (struktūrizuotas JSON atsakymas)
+FAST_MODE_INSTRUCTIONS = f"""Gausi kelias žaliuzių/roletų nuotraukas. Atlik DVI užduotis vienu atsakymu:
+
+A) KIEKVIENAI nuotraukai (ta pačia tvarka) - atskira analizė pagal šiuos nurodymus:
+{ANALYSIS_USER_PROMPT}
+
+B) Pagal VISAS analizes - socialinių tinklų tekstai pagal šias taisykles:
+{CAPTION_RULES_PROMPT}
+Atsakyk JSON: "analyses" - po vieną analizę kiekvienai nuotraukai, "variants" - lygiai 3 tekstų variantai (be "---" skirtukų).
+"""
+
+FAST_MODE_SCHEMA = {
+    "name": "analizes_ir_tekstai",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "analyses": {"type": "array", "items": {"type": "string"}},
+            "variants": {"type": "array", "items": {"type": "string"}}
+        },
+        "required": ["analyses", "variants"],
+        "additionalProperties": False
+    }
+}
+
+def fast_request(payloads, season, holiday):
+    """Greito režimo užklausos parametrai; payloads = [(base64, detail), ...] (žr. prepare_vision_payload)"""
+    content = [{"type": "text", "text": FAST_MODE_INSTRUCTIONS + "\n" + rules_block(season, holiday)}]
+    for i, (image_b64, detail) in enumerate(payloads, start=1):
+        content.append({"type": "text", "text": f"Nuotrauka {i}:"})
+        content.append({"type": "image_url", "image_url": {"url": "data:image/jpeg;base64," + image_b64, "detail": detail}})
+    
+    return dict(
+        model=CAPTION_MODEL,
+        messages=[
+            {"role": "system", "content": CAPTION_SYSTEM_PROMPT},
+            {"role": "user", "content": content}
+        ],
+        response_format={"type": "json_schema", "json_schema": FAST_MODE_SCHEMA},
+        temperature=0.5,
+        max_tokens=ANALYSIS_MAX_TOKENS * len(payloads) + 1200,
+        timeout=ANALYSIS_TIMEOUT + CAPTION_TIMEOUT
+    )
+
+def analyze_and_caption(client, payloads, season, holiday):
+    """
+    Greitas režimas: nuotraukų analizės ir 3 tekstų variantai viena užklausa.
+    Grąžina (analizių sąrašas, tekstai su "---" skirtukais - kaip generate_captions)
+    """
+    with stage("analyze_and_caption", bytes_in=sum(len(image_b64) for image_b64, _detail in payloads), images=len(payloads)) as entry:
+        response = create_completion(client, **fast_request(payloads, season, holiday))
+        record_usage(entry, response.usage)
+        _log_caption_usage(response.usage)
+    
+    message = response.choices[0].message
+    if getattr(message, "refusal", None):
+        raise ValueError(f"Modelis atsisakė atsakyti: {message.refusal}")
+    try:
+        result = json.loads(message.content)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Netinkamas atsakymo formatas: {e}")
+    
+    analyses = [analysis.strip() for analysis in result.get("analyses", []) if analysis.strip()]
+    variants = [variant.strip() for variant in result.get("variants", []) if variant.strip()]
+    if not variants:
+        raise ValueError("Atsakyme nėra tekstų variantų")
+    if len(analyses) != len(payloads):
+        logger.warning("Greitas režimas: %d nuotraukos, bet %d analizės", len(payloads), len(analyses))
+    return analyses, "\n---\n".join(variants)
+
+# ---------- Sezono/šventės taisyklių patikra ----------
+# Kiek kartų galima taisyti netinkamus variantus (kiekvieną kartą - tik netinkamus)
+CAPTION_REPAIR_RETRIES = int(os.getenv("CAPTION_REPAIR_RETRIES", "2"))
+
+# Vienam pataisytam variantui (tokenais)
+REPAIR_MAX_TOKENS_PER_VARIANT = 200
+
+def _stem_pattern(stems):
+    """Kamienai tikrinami žodžio pradžioje, be raidžių dydžio (pvz. "#Vasara" atitinka "vasar")"""
+    if not stems:
+        return None
+    alternatives = "|".join(re.escape(stem) for stem in sorted(set(stems), key=len, reverse=True))
+    return re.compile(rf"(?<!\w)(?:{alternatives})\w*", re.IGNORECASE)
+
+def _compile_validator(season, holiday):
+    """
+    (privalomų šablonai, draudžiamų kamienų šablonas) sezonui ir šventei.
+    Privalomi tikrinami atskirai: [("sezono", šablonas), ("šventės", šablonas)] - pasirinkus šventę,
+    tekste turi būti ir sezono, ir šventės žodis (vieno sezono žodžio neužtenka).
+    """
+    current_season, current_holiday, must_have_list, forbidden_list = _rule_lists(season, holiday)
+    # Jei draudžiamas kamienas yra privalomo pradžia (pvz. "pavasa" ir "pavasari" per Velykas) - privalomas svarbesnis
+    forbidden_list = [
+        stem for stem in forbidden_list
+        if not any(required.startswith(stem) for required in must_have_list)
+    ]
+    required = [("sezono", _stem_pattern(current_season["must_have"]))]
+    if current_holiday:
+        # Sezono pavadinimas (pvz. "žiem" per Kalėdas) šventės nepamini - šventės šablonui netinka
+        season_names = [name.casefold() for name in SEASON_RULES]
+        holiday_stems = [
+            stem for stem in current_holiday["must_have"]
+            if not any(name.startswith(stem) or stem.startswith(name[:-1]) for name in season_names)
+        ]
+        required.append(("šventės", _stem_pattern(holiday_stems)))
+    return [(kind, pattern) for kind, pattern in required if pattern is not None], _stem_pattern(forbidden_list)
+
+# Patikros šablonai - kaip ir taisyklių blokai, paruošiami importuojant
+VALIDATORS = {
+    (season, holiday): _compile_validator(season, holiday)
+    for season in SEASON_RULES
+    for holiday in [*HOLIDAY_RULES, "Nėra"]
+}
+
+def validate_variant(variant, season, holiday):
+    """Patikrina vieną variantą: {"ok", "missing_required", "missing": ["sezono"/"šventės"], "forbidden": [rasti žodžiai]}"""
+    required, forbidden = VALIDATORS.get((season, holiday)) or _compile_validator(season, holiday)
+    missing = [kind for kind, pattern in required if pattern.search(variant) is None]
+    found = sorted({match.group(0).lower() for match in forbidden.finditer(variant)}) if forbidden else []
+    return {"ok": not missing and not found, "missing_required": bool(missing), "missing": missing, "forbidden": found}
+
+def validate_captions(captions, season, holiday):
+    """Padalina į variantus ir patikrina kiekvieną. Grąžina [(variantas, rezultatas), ...]"""
+    return [(variant, validate_variant(variant, season, holiday)) for variant in split_variants(captions)]
+
+def _describe_problem(result):
+    problems = []
+    for kind in result.get("missing", []):
+        problems.append(f"nėra nė vieno PRIVALOMO {kind} žodžio")
+    if result["forbidden"]:
+        problems.append(f"yra DRAUDŽIAMI žodžiai: {', '.join(result['forbidden'])}")
+    return "; ".join(problems)
+
+def repair_request(failing, season, holiday):
+    """Trumpa užklausa tik netinkamiems variantams; failing = [(variantas, rezultatas), ...]"""
+    listing = "\n\n".join(
+        f"TEKSTAS {i}:\n{variant}\nPROBLEMA: {_describe_problem(result)}"
+        for i, (variant, result) in enumerate(failing, start=1)
+    )
+    prompt = f"""{rules_block(season, holiday)}
+Šie tekstai pažeidžia taisykles. Perrašyk TIK juos: išlaikyk toną, produktus, emoji ir hashtag'us,
+pridėk PRIVALOMĄ žodį ir pašalink DRAUDŽIAMUS. Grąžink {len(failing)} tekstus ta pačia tvarka, atskirtus "---", be paaiškinimų.
+
+{listing}
+"""
+    return dict(
+        model=CAPTION_MODEL,
+        messages=[
+            {"role": "system", "content": CAPTION_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.3,
+        max_tokens=REPAIR_MAX_TOKENS_PER_VARIANT * len(failing),
+        timeout=CAPTION_TIMEOUT
+    )
+
+def repair_captions(client, captions, season, holiday, max_retries=None):
+    """
+    Patikrina variantus vietoje ir pakartotinai užklausia TIK netinkamų (ne daugiau max_retries kartų).
+    Grąžina (tekstai su "---" skirtukais, ataskaita) - ataskaitoje kiekvienam variantui:
+    {"variant", "ok", "missing_required", "forbidden", "repairs"}
+    """
+    max_retries = CAPTION_REPAIR_RETRIES if max_retries is None else max_retries
+    checked = validate_captions(captions, season, holiday)
+    variants = [variant for variant, _result in checked]
+    results = [result for _variant, result in checked]
+    repairs = [0] * len(variants)
+    
+    for _attempt in range(max_retries):
+        failing = [i for i, result in enumerate(results) if not result["ok"]]
+        if not failing:
+            break
+        
+        with stage("repair_captions", variants=len(failing)) as entry:
+            response = create_completion(client, **repair_request([(variants[i], results[i]) for i in failing], season, holiday))
+            record_usage(entry, response.usage)
+        
+        repaired = split_variants(response.choices[0].message.content)
+        if len(repaired) != len(failing):
+            logger.warning("Taisymas: laukta %d variantų, gauta %d", len(failing), len(repaired))
+        for i, variant in zip(failing, repaired):
+            variants[i] = variant
+            results[i] = validate_variant(variant, season, holiday)
+            repairs[i] += 1
+    
+    report = [
+        dict(result, variant=i + 1, repairs=repairs[i])
+        for i, result in enumerate(results)
+    ]
+    return "\n---\n".join(variants), report
+
+# ---------- Tekstų talpykla ----------
+# Atskiras katalogas (ne analizių talpyklos viduje - ji valo visą savo katalogą)
+CAPTION_CACHE_DIR = os.getenv("CAPTION_CACHE_DIR", os.path.join(os.path.dirname(CACHE_DIR), ".caption_cache"))
+CAPTION_CACHE_TTL_HOURS = float(os.getenv("CAPTION_CACHE_TTL_HOURS", "24"))
+CAPTION_CACHE_MAX_MB = float(os.getenv("CAPTION_CACHE_MAX_MB", "20"))
+
+caption_cache = DiskCache(CAPTION_CACHE_DIR, CAPTION_CACHE_MAX_MB * 1024 * 1024, CAPTION_CACHE_TTL_HOURS * 3600)
+
+def caption_cache_key(analysis_text, season, holiday):
+    """Raktas: normalizuota analizė (tarpai, raidžių dydis) + sezonas + šventė + modelis + prompt'o versija"""
+    normalized = " ".join(analysis_text.split()).casefold()
+    return caption_cache.make_key(CAPTION_MODEL, CAPTION_PROMPT_VERSION, season, holiday, normalized)
+
+def create_captions(client, analysis_text, season, holiday, fresh=False, on_text=None):
+    """
+    Tekstai su talpykla ir sezono taisyklių patikra. Grąžina (tekstai, ataskaita, ar iš talpyklos).
+    - fresh=True - talpykla praleidžiama ("generuoti iš naujo"), naujas rezultatas išsaugomas
+    - on_text(tekstas iki šiol) - jei nurodyta, tekstai kuriami stream režimu
+    Talpykloje laikomi jau patikrinti (pataisyti) tekstai.
+    """
+    key = caption_cache_key(analysis_text, season, holiday)
+    with stage("caption_cache") as entry:
+        cached = None if fresh else caption_cache.get(key)
+        entry["cache_hit"] = cached is not None
+    if cached is not None:
+        # Tik vietinė patikra (max_retries=0 - be užklausų)
+        captions, report = repair_captions(client, cached, season, holiday, max_retries=0)
+        return captions, report, True
+    
+    if on_text is None:
+        captions = generate_captions(client, analysis_text, season, holiday)
+    else:
+        captions = ""
+        for delta in stream_captions(client, analysis_text, season, holiday):
+            captions += delta
+            on_text(captions)
+        captions = captions.strip()
+    
+    try:
+        captions, report = repair_captions(client, captions, season, holiday)
+    except Exception as e:
+        # Tekstai vis tiek grąžinami, tik nepatikrinti (ir netalpinami)
+        logger.warning("Nepavyko pataisyti tekstų: %s", e)
+        return captions, None, False
+    caption_cache.set(key, captions)
+    return captions, report, False
@@ -0,0 +1,72 @@
+import streamlit as st
+from contextlib import contextmanager
+from instrumentation import trace
+from openai_client import connection_metrics
+from rate_limiter import scheduler
+
+# Kiek paskutinių matavimų rodoma diagnostikos skydelyje (vienos sesijos ribose)
+DIAGNOSTICS_HISTORY = 20
+DIAGNOSTICS_SHOWN = 5
+
+
+def remember_trace(current):
+    """Išsaugo matavimo suvestinę sesijoje (skydeliui ir eksportui)"""
+    history = st.session_state.setdefault("diagnostics", [])
+    history.append({
+        "label": current.label,
+        "seconds": current.seconds,
+        "summary": current.summary(),
+        "jsonl": current.jsonl(),
+    })
+    del history[:-DIAGNOSTICS_HISTORY]
+
+
+@contextmanager
+def traced(label, only_computed=False):
+    """
+    instrumentation.trace + suvestinė sesijoje; tinka ir kaip dekoratorius.
+    only_computed - matavimas, kuriame viskas paimta iš talpyklų (pvz. peržiūra be pakeitimų), neišsaugomas,
+    kad dažni perkrovimai neišstumtų AI ir collage matavimų iš istorijos.
+    """
+    current = None
+    try:
+        with trace(label, only_computed=only_computed) as current:
+            yield current
+    finally:
+        if current is not None and (not only_computed or current.computed()):
+            remember_trace(current)
+
+
+def diagnostics_panel():
+    """Suskleidžiamas skydelis: etapų trukmės, baitai, tokenai, talpyklos pataikymai"""
+    history = st.session_state.get("diagnostics") or []
+    with st.expander("🩺 Diagnostika"):
+        connections = connection_metrics.stats()
+        if connections["requests"]:
+            st.caption(
+                f"🔌 OpenAI HTTP (visas procesas): {connections['requests']} užklausos, "
+                f"{connections['reused_connections']} per esamą jungtį ({connections['reuse_ratio']:.0%}), "
+                f"{connections['new_connections']} naujos jungtys, {connections['retried_responses']} kartota (429/5xx)"
+            )
+        limits = scheduler.stats()
+        if limits["granted"]:
+            st.caption(
+                f"🚦 Limitų planuoklis: {limits['granted']} leista, {limits['waiting']} laukia, "
+                f"vid. laukimas {limits['avg_wait_seconds']:.2f} s, {limits['retried']} kartota po 429"
+            )
+        
+        if not history:
+            st.caption("Matavimų dar nėra.")
+            return
+
+        for item in reversed(history[-DIAGNOSTICS_SHOWN:]):
+            st.markdown(f"**{item['label']}** - {item['seconds']:.2f} s")
+            st.dataframe(item["summary"], hide_index=True, use_container_width=True)
+
+        st.download_button(
+            label="📥 Eksportuoti (JSON-lines)",
+            data="".join(item["jsonl"] for item in history),
+            file_name="diagnostika.jsonl",
+            mime="application/x-ndjson",
+            key="download_diagnostics"
+        )
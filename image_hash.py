@@ -0,0 +1,106 @@
+import io, os, threading
+from collections import OrderedDict
+from PIL import Image, ImageOps
+from image_pipeline import read_source
+
+# ---------- Nustatymai ----------
+# Kiek bitų (iš 64) gali skirtis, kad nuotraukos būtų laikomos ta pačia (0 - tik identiškos)
+DUPLICATE_HASH_DISTANCE = int(os.getenv("DUPLICATE_HASH_DISTANCE", "2"))
+# dHash nemato spalvų (tas pats langas su pilkomis ir mėlynomis žaliuzėmis - atstumas 0),
+# todėl dublikatas dar turi sutapti ir spalvomis: didžiausias vidutinės RGB skirtumas tinklelio langelyje
+DUPLICATE_COLOR_DIFFERENCE = int(os.getenv("DUPLICATE_COLOR_DIFFERENCE", "10"))
+
+# dHash: 9x8 pilkas vaizdas -> 64 bitai (ar pikselis šviesesnis už kaimyną dešinėje)
+HASH_WIDTH, HASH_HEIGHT = 9, 8
+# Spalvų parašas: 4x4 langelių vidutinė RGB spalva -> 48 baitai
+COLOR_GRID = 4
+
+# Apskaičiuoti atspaudai pagal turinio maišą (maži - todėl tiesiog ribotas kiekis)
+HASH_CACHE_ENTRIES = 4096
+_hashes = OrderedDict()
+_lock = threading.Lock()
+
+
+def dhash(img):
+    """Percepcinis dHash (64 bitų int) pilkam vaizdui"""
+    pixels = img.convert("L").resize((HASH_WIDTH, HASH_HEIGHT), Image.Resampling.BOX).tobytes()
+    value = 0
+    for y in range(HASH_HEIGHT):
+        row = pixels[y * HASH_WIDTH:(y + 1) * HASH_WIDTH]
+        for x in range(HASH_WIDTH - 1):
+            value = (value << 1) | (row[x] > row[x + 1])
+    return value
+
+
+def color_signature(img):
+    """Vidutinės spalvos COLOR_GRID x COLOR_GRID tinklelyje (bytes, RGB eilės tvarka)"""
+    return img.convert("RGB").resize((COLOR_GRID, COLOR_GRID), Image.Resampling.BOX).tobytes()
+
+
+def fingerprint(data):
+    """
+    Nuotraukos atspaudas (dHash, spalvų parašas). JPEG dekoduojamas iškart sumažintas (draft),
+    pasukama pagal EXIF - tas pats kadras iš skirtingų šaltinių gauna artimą atspaudą.
+    """
+    img = Image.open(io.BytesIO(data))
+    img.draft("RGB", (HASH_WIDTH * 8, HASH_HEIGHT * 8))
+    img = ImageOps.exif_transpose(img).convert("RGB")
+    return dhash(img), color_signature(img)
+
+
+def _cached(key):
+    with _lock:
+        if key in _hashes:
+            _hashes.move_to_end(key)
+            return _hashes[key]
+    return None
+
+
+def image_fingerprint(image_file):
+    """Atspaudas failui (talpinamas pagal turinio maišą - perkrovimų metu nedekoduojama iš naujo)"""
+    # Saugyklos failų (AssetFile) maišas žinomas - talpykloje radus, baitai net neskaitomi
+    content_hash = getattr(image_file, "content_hash", None)
+    value = _cached(content_hash) if content_hash else None
+    if value is not None:
+        return value
+
+    data, key = read_source(image_file)
+    value = _cached(key)
+    if value is not None:
+        return value
+    value = fingerprint(data)
+    with _lock:
+        _hashes[key] = value
+        while len(_hashes) > HASH_CACHE_ENTRIES:
+            _hashes.popitem(last=False)
+    return value
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def color_difference(a, b):
+    """Didžiausias vieno kanalo skirtumas tarp spalvų parašų (0-255)"""
+    return max(abs(x - y) for x, y in zip(a, b))
+
+
+def find_duplicates(fingerprints, max_distance=None, max_color_difference=None):
+    """
+    Randa pasikartojančias nuotraukas sąraše (pirmoji lieka, vėlesnės - dublikatai).
+    Dublikatas - beveik tas pats dHash IR tos pačios spalvos (kitos spalvos žaliuzės - ne dublikatas).
+    Grąžina {dublikato indeksas: (originalo indeksas, atstumas bitais)}.
+    """
+    max_distance = DUPLICATE_HASH_DISTANCE if max_distance is None else max_distance
+    max_color_difference = DUPLICATE_COLOR_DIFFERENCE if max_color_difference is None else max_color_difference
+    duplicates = {}
+    kept = []
+    for i, (value, colors) in enumerate(fingerprints):
+        for j in kept:
+            distance = hamming(value, fingerprints[j][0])
+            if distance <= max_distance and color_difference(colors, fingerprints[j][1]) <= max_color_difference:
+                duplicates[i] = (j, distance)
+                break
+        else:
+            kept.append(i)
+    return duplicates
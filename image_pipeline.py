@@ -0,0 +1,224 @@
+import io, os, time, hashlib, threading
+from collections import OrderedDict
+from PIL import Image, ImageOps
+from color_engine import apply_color
+from watermark import SHADOW_OFFSETS, apply_watermark
+from instrumentation import record
+
+# ---------- Nustatymai ----------
+# Kiek atminties (MB) gali užimti tarpiniai etapų rezultatai (viename procese)
+RENDER_CACHE_MB = float(os.getenv("RENDER_CACHE_MB", "384"))
+
+# AUTO spalvų optimizacija marketinginėms nuotraukoms (šviesumas, kontrastas, sodrumas)
+AUTO_ENHANCE = {"brightness": 1.1, "contrast": 1.15, "saturation": 1.1}
+
+# Peržiūros miniatiūros generuojamos 2x didesnės nei rodomos (ryškiems ekranams)
+THUMBNAIL_DPR = 2
+
+
+class StageCache:
+    """
+    LRU talpykla tarpiniams apdorojimo etapų rezultatams (PIL vaizdams ir JPEG baitams).
+    Riba - bendras užimamas baitų kiekis. Talpinami objektai laikomi nekeičiamais.
+    Pirmas rakto elementas - etapo pavadinimas (diagnostikai, žr. instrumentation.py).
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(value):
+        if isinstance(value, tuple):
+            return sum(StageCache._size(item) for item in value if isinstance(item, (Image.Image, bytes)))
+        if isinstance(value, Image.Image):
+            return value.width * value.height * len(value.getbands())
+        return len(value)
+
+    def get_or_compute(self, key, compute):
+        """Grąžina talpinamą reikšmę arba ją apskaičiuoja ir išsaugo"""
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                value, size = self._items[key]
+                record(key[0], cache_hit=True, seconds=0.0, bytes_out=size)
+                return value
+            self.misses += 1
+
+        started = time.perf_counter()
+        value = compute()
+        size = self._size(value)
+        record(key[0], cache_hit=False, seconds=round(time.perf_counter() - started, 6), bytes_out=size)
+
+        with self._lock:
+            if key not in self._items and size <= self.max_bytes:
+                self._items[key] = (value, size)
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    _key, (_value, old_size) = self._items.popitem(last=False)
+                    self._bytes -= old_size
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+
+stage_cache = StageCache(RENDER_CACHE_MB * 1024 * 1024)
+
+
+# ---------- Etapai ----------
+
+def read_source(image_file):
+    """Perskaito failo baitus ir grąžina (baitai, turinio maišas)"""
+    if isinstance(image_file, (bytes, bytearray)):
+        data = bytes(image_file)
+    else:
+        image_file.seek(0)
+        data = image_file.read()
+        # Saugyklos failai (asset_store.AssetFile) maišą jau turi - to paties formato
+        content_hash = getattr(image_file, "content_hash", None)
+        if content_hash:
+            return data, content_hash
+    return data, hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def decode_stage(data, min_size=None):
+    """
+    Atidaro nuotrauką ir konvertuoja į RGB (permatomi vaizdai - ant balto fono).
+    Jei nurodytas min_size (plotis, aukštis) - dekoduoja ne didesne raiška nei reikia:
+    - JPEG - draft režimu (DCT mastelis 1/2, 1/4, 1/8), t.y. iškart artimiausiu
+      2 laipsnio masteliu, kuris dar ne mažesnis už min_size
+    - Kiti formatai - Image.reduce sveiku 2 laipsnio koeficientu
+    Grąžina (vaizdas, mastelis nuo originalo)
+    """
+    img = Image.open(io.BytesIO(data))
+    full_width, full_height = img.size
+
+    if min_size and img.format == 'JPEG':
+        img.draft('RGB', min_size)
+
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+    else:
+        img.load()
+
+    if min_size and img.size == (full_width, full_height):
+        factor = min(full_width // min_size[0], full_height // min_size[1])
+        power = 1
+        while power * 2 <= factor:
+            power *= 2
+        if power > 1:
+            img = img.reduce(power)
+
+    return img, img.width / full_width
+
+
+def color_stage(img, brightness=1.0, contrast=1.0, saturation=1.0):
+    """Spalvų koregavimai (šviesumas, kontrastas, sodrumas) - žr. color_engine"""
+    return apply_color(img, brightness, contrast, saturation)
+
+
+def border_stage(img, scale=1.0):
+    """Baltas 20px rėmelis (sumažintame vaizde - proporcingai plonesnis)"""
+    return ImageOps.expand(img, border=max(1, round(20 * scale)), fill=(255, 255, 255))
+
+
+def watermark_stage(img, watermark_text, watermark_size, scale=1.0):
+    """
+    Vandens ženklas (baltas su šešėliu) dešiniame apatiniame kampe - paruoštas sprite'as
+    uždedamas viena operacija (žr. watermark.py).
+    scale - vaizdo mastelis nuo originalo (šriftas, paraštė ir šešėlis mažinami proporcingai)
+    """
+    # TIESIAI: slider reikšmė = px dydis (originalo raiškoje)
+    font_size = max(1, round(max(30, int(watermark_size)) * scale))
+    margin = round(30 * scale)
+    shadow_offsets = tuple(
+        (max(1, round(dx * scale)), max(1, round(dy * scale))) for dx, dy in SHADOW_OFFSETS
+    )
+
+    img = img.copy()  # Talpinamas įvesties vaizdas neturi būti keičiamas
+    return apply_watermark(img, watermark_text, font_size, margin, shadow_offsets)
+
+
+def encode_stage(img):
+    """Išsaugome į JPEG su AUKŠTA kokybe"""
+    output = io.BytesIO()
+    img.save(output, format='JPEG', quality=98, optimize=False)
+    return output.getvalue()
+
+
+def _render_stages(image_file, min_size, add_watermark, add_border, brightness, contrast, saturation, watermark_text, watermark_size):
+    """
+    Dekodavimas -> spalvos -> rėmelis -> vandens ženklas. Kiekvieno etapo rezultatas
+    talpinamas pagal ankstesnio etapo raktą + savo parametrus, todėl pakeitus vieną
+    nustatymą perskaičiuojami tik paskesni etapai. Grąžina (vaizdas, raktas).
+    """
+    data, key = read_source(image_file)
+    key = ("decode", key, min_size)
+    img, scale = stage_cache.get_or_compute(key, lambda: decode_stage(data, min_size))
+
+    # Neveikiantys etapai praleidžiami - raktas ir vaizdas perduodami toliau
+    if (brightness, contrast, saturation) != (1.0, 1.0, 1.0):
+        key = ("color", key, brightness, contrast, saturation)
+        img = stage_cache.get_or_compute(key, lambda: color_stage(img, brightness, contrast, saturation))
+
+    if add_border:
+        key = ("border", key)
+        img = stage_cache.get_or_compute(key, lambda: border_stage(img, scale))
+
+    if add_watermark and watermark_text:
+        key = ("watermark", key, watermark_text, watermark_size)
+        img = stage_cache.get_or_compute(key, lambda: watermark_stage(img, watermark_text, watermark_size, scale))
+
+    return img, key
+
+
+def render_overlay(image_file, add_watermark=False, add_border=False, brightness=1.0, contrast=1.0, saturation=1.0, watermark_text="", watermark_size=150):
+    """
+    Inkrementinis add_marketing_overlay variantas (pilna raiška, atsisiuntimui).
+    Pvz. keičiant vandens ženklo tekstą naudojamas jau pakoreguotų spalvų vaizdas.
+    Grąžina JPEG baitus.
+    """
+    img, key = _render_stages(image_file, None, add_watermark, add_border, brightness, contrast, saturation, watermark_text, watermark_size)
+    return stage_cache.get_or_compute(("encode", key), lambda: encode_stage(img))
+
+
+def render_overlay_image(image_file, min_size, add_watermark=False, add_border=False, brightness=1.0, contrast=1.0, saturation=1.0, watermark_text="", watermark_size=150):
+    """
+    Tas pats apdorojimas sumažinta raiška (collage plytelėms ir pan.): dekoduojama
+    iškart artimiausiu 2 laipsnio masteliu, ne mažesniu nei min_size.
+    Grąžina PIL vaizdą iš talpyklos - jo keisti negalima (tik resize/copy).
+    """
+    img, _key = _render_stages(image_file, tuple(min_size), add_watermark, add_border, brightness, contrast, saturation, watermark_text, watermark_size)
+    return img
+
+
+def thumbnail_image(image_file, width):
+    """
+    Mažas peržiūros vaizdas (pvz. width=150): dekoduojamas sumažinta raiška,
+    pasukamas pagal EXIF, 2x pločio ryškiems ekranams.
+    """
+    data, key = read_source(image_file)
+    target = width * THUMBNAIL_DPR
+
+    def make_thumbnail():
+        img, _scale = decode_stage(data, (target, target))
+        img = ImageOps.exif_transpose(img)
+        if img.width > target:
+            img = img.resize((target, max(1, round(img.height * target / img.width))), Image.Resampling.LANCZOS)
+        return img
+
+    return stage_cache.get_or_compute(("thumbnail", key, target), make_thumbnail)
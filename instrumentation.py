@@ -0,0 +1,146 @@
+import os, json, time, uuid, logging, threading, contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# ---------- Nustatymai ----------
+# JSON-lines žurnalas analizei neprisijungus (tuščias kelias - nerašoma)
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".diagnostics", "stages.jsonl"))
+
+# Lauko pavadinimai, kurie sumuojami suvestinėje
+SUMMED_FIELDS = ("seconds", "bytes_in", "bytes_out", "prompt_tokens", "completion_tokens", "cached_tokens")
+
+# Aktyvus matavimas (perduodamas ir į gijas - žr. ai_parallel.py)
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_log_lock = threading.Lock()
+
+
+class Trace:
+    """Vieno veiksmo (peržiūros, collage, AI turinio) etapų įrašai"""
+
+    def __init__(self, label):
+        self.label = label
+        self.trace_id = uuid.uuid4().hex[:12]
+        self.started = time.time()
+        self.seconds = 0.0
+        self.records = []
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def computed(self):
+        """Ar bent vienas etapas iš tikrųjų vykdytas (ne paimtas iš talpyklos)"""
+        with self._lock:
+            return any(not record.get("cache_hit") for record in self.records)
+
+    def summary(self):
+        """Suvestinė pagal etapą: kiekis, talpyklos pataikymai ir sumuoti laukai"""
+        stages = {}
+        with self._lock:
+            records = list(self.records)
+        for record in records:
+            row = stages.setdefault(record["stage"], {"stage": record["stage"], "calls": 0, "cache_hits": 0, "errors": 0})
+            row["calls"] += 1
+            row["cache_hits"] += bool(record.get("cache_hit"))
+            row["errors"] += "error" in record
+            for field in SUMMED_FIELDS:
+                if record.get(field) is not None:
+                    row[field] = row.get(field, 0) + record[field]
+        for row in stages.values():
+            row["seconds"] = round(row.get("seconds", 0.0), 4)
+        return list(stages.values())
+
+    def to_dict(self):
+        with self._lock:
+            records = list(self.records)
+        return {
+            "trace_id": self.trace_id,
+            "label": self.label,
+            "started": self.started,
+            "seconds": round(self.seconds, 4),
+            "records": records,
+        }
+
+    def jsonl(self):
+        """Kiekvienas etapas - atskira JSON eilutė"""
+        header = {"trace_id": self.trace_id, "label": self.label, "started": self.started}
+        return "".join(json.dumps(dict(header, **record), ensure_ascii=False) + "\n" for record in self.to_dict()["records"])
+
+
+def write_jsonl(text, path=None):
+    """Prideda eilutes prie žurnalo (kelios sesijos rašo į tą patį failą)"""
+    path = TRACE_LOG_PATH if path is None else path
+    if not path or not text:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with _log_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(text)
+    except OSError as e:
+        logger.warning("Nepavyko įrašyti diagnostikos žurnalo %s: %s", path, e)
+
+
+@contextmanager
+def trace(label, log_path=None, only_computed=False):
+    """
+    Matuoja veiksmą: bloke (ir jo gijose) užregistruoti etapai surenkami į Trace.
+    only_computed - į žurnalą rašoma tik tada, kai bent vienas etapas vykdytas (ne vien talpyklos pataikymai).
+    """
+    current = Trace(label)
+    token = _current_trace.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.seconds = time.perf_counter() - started
+        _current_trace.reset(token)
+        if not only_computed or current.computed():
+            write_jsonl(current.jsonl(), log_path)
+
+
+def record(name, **fields):
+    """Užregistruoja jau įvykusį etapą (jei matavimas aktyvus)"""
+    current = _current_trace.get()
+    if current is not None:
+        current.add({"stage": name, **fields})
+
+
+@contextmanager
+def stage(name, **fields):
+    """
+    Matuoja etapo trukmę. Bloke galima papildyti įrašą (bytes_out, cache_hit, tokenai...).
+    Be aktyvaus matavimo tik grąžina tuščią žodyną.
+    """
+    entry = dict(fields)
+    if _current_trace.get() is None:
+        yield entry
+        return
+
+    started = time.perf_counter()
+    try:
+        yield entry
+    except Exception as e:
+        entry["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        entry["seconds"] = round(time.perf_counter() - started, 6)
+        record(name, **entry)
+
+
+def record_usage(entry, usage):
+    """Į etapo įrašą perkelia OpenAI atsakymo tokenų kiekius"""
+    if usage is None:
+        return
+    entry["prompt_tokens"] = usage.prompt_tokens
+    entry["completion_tokens"] = usage.completion_tokens
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is not None and getattr(details, "cached_tokens", None) is not None:
+        entry["cached_tokens"] = details.cached_tokens
+
+
+def propagate(func):
+    """Apgaubia funkciją, kad kitoje gijoje ji matytų dabartinį matavimą"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(func, *args, **kwargs)
@@ -0,0 +1,103 @@
+import os, threading
+import httpx
+from openai import OpenAI
+
+# ---------- Nustatymai ----------
+# Vienas klientas (ir HTTP jungčių baseinas) visam procesui - bendras visoms sesijoms
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "10"))
+OPENAI_KEEPALIVE_SECONDS = float(os.getenv("OPENAI_KEEPALIVE_SECONDS", "60"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+
+# Pakartojimai (429, 5xx, nutrūkęs ryšys) - OpenAI biblioteka laukia eksponentiškai ir paiso Retry-After.
+# Užklausos per rate_limiter.create_completion kartojamos planuoklyje (tiek pat kartų, žr. RATE_LIMIT_MAX_RETRIES)
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+
+# Atsakymų kodai, po kurių biblioteka kartoja užklausą
+RETRIED_STATUSES = (408, 409, 429, 500, 502, 503, 504)
+
+
+class ConnectionMetrics:
+    """Kiek HTTP užklausų išsiųsta per naują ir per jau atidarytą (keep-alive) jungtį"""
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.retried_responses = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def on_request(self, request):
+        # httpcore praneša apie jungties etapus - "connect_tcp" būna tik naujai jungčiai
+        state = {"new": False}
+
+        def trace(event_name, info):
+            if event_name == "connection.connect_tcp.started":
+                state["new"] = True
+            elif event_name == "http11.send_request_headers.started" or event_name == "http2.send_request_headers.started":
+                with self._lock:
+                    self.requests += 1
+                    self.new_connections += state["new"]
+
+        request.extensions["trace"] = trace
+
+    def on_response(self, response):
+        if response.status_code in RETRIED_STATUSES:
+            with self._lock:
+                self.retried_responses += 1
+        elif response.status_code >= 400:
+            with self._lock:
+                self.errors += 1
+
+    def stats(self):
+        with self._lock:
+            reused = self.requests - self.new_connections
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": reused,
+                "reuse_ratio": reused / self.requests if self.requests else 0.0,
+                "retried_responses": self.retried_responses,
+                "errors": self.errors,
+            }
+
+
+connection_metrics = ConnectionMetrics()
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _http_client():
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            keepalive_expiry=OPENAI_KEEPALIVE_SECONDS,
+        ),
+        timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+        event_hooks={"request": [connection_metrics.on_request], "response": [connection_metrics.on_response]},
+    )
+
+
+def get_client(api_key, base_url=None):
+    """
+    Bendras OpenAI klientas procesui (vienas kiekvienam raktui):
+    Streamlit kiekvieną perkrovimą vykdo skriptą iš naujo, o modulis lieka -
+    todėl jungtys (TCP/TLS) naudojamos pakartotinai tarp perkrovimų ir sesijų.
+    Atskiram kvietimui laiką galima keisti: client.with_options(timeout=...) arba create(..., timeout=...).
+    """
+    key = (api_key, base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=_http_client(),
+                max_retries=OPENAI_MAX_RETRIES,
+                timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+            )
+            _clients[key] = client
+        return client
@@ -0,0 +1,115 @@
+import io, os, logging, threading
+from contextlib import contextmanager
+from functools import wraps
+from PIL import Image
+from image_pipeline import stage_cache, read_source, decode_stage, thumbnail_image
+
+logger = logging.getLogger(__name__)
+
+# ---------- Nustatymai ----------
+# Naršyklei rodomi vaizdai - sumažinti ir lengvesni (pilna kokybė - tik atsisiuntimui)
+PREVIEW_MAX_EDGE = int(os.getenv("PREVIEW_MAX_EDGE", "800"))
+COLLAGE_PREVIEW_EDGE = int(os.getenv("COLLAGE_PREVIEW_EDGE", "1200"))
+PREVIEW_JPEG_QUALITY = int(os.getenv("PREVIEW_JPEG_QUALITY", "80"))
+THUMBNAIL_JPEG_QUALITY = int(os.getenv("THUMBNAIL_JPEG_QUALITY", "75"))
+
+
+def encode_jpeg(img, quality):
+    output = io.BytesIO()
+    img.save(output, format='JPEG', quality=quality, optimize=True)
+    return output.getvalue()
+
+
+def display_rendition(image_file, max_edge=None, quality=None):
+    """
+    Peržiūros versija (JPEG baitai) naršyklei: ilgiausia kraštinė ne didesnė nei max_edge,
+    žemesnė JPEG kokybė. JPEG dekoduojamas iškart sumažinta raiška (draft).
+    """
+    max_edge = max_edge or PREVIEW_MAX_EDGE
+    quality = quality or PREVIEW_JPEG_QUALITY
+    data, key = read_source(image_file)
+
+    def make_rendition():
+        img, _scale = decode_stage(data, (max_edge, max_edge))
+        img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        return encode_jpeg(img, quality)
+
+    return stage_cache.get_or_compute(("display", key, max_edge, quality), make_rendition)
+
+
+def thumbnail_rendition(image_file, width, quality=None):
+    """Miniatiūra (žr. thumbnail_image) kaip lengvas JPEG - st.image PIL vaizdus koduoja 100 kokybe"""
+    quality = quality or THUMBNAIL_JPEG_QUALITY
+    data, key = read_source(image_file)
+    return stage_cache.get_or_compute(
+        ("thumbnail_jpeg", key, width, quality),
+        lambda: encode_jpeg(thumbnail_image(data, width), quality)
+    )
+
+
+# ---------- Išsiųstų baitų apskaita ----------
+# Streamlit kiekvieną perkrovimą vykdo vienoje gijoje - skaitliukai laikomi gijos lygyje
+_local = threading.local()
+
+
+def _meters():
+    if not hasattr(_local, "meters"):
+        _local.meters = []
+    return _local.meters
+
+
+def record_sent(nbytes):
+    """Užregistruoja naršyklei siunčiamo vaizdo dydį"""
+    meters = _meters()
+    if meters:
+        meters[-1]["images"] += 1
+        meters[-1]["bytes"] += nbytes
+
+
+def _finish(label, meter):
+    meters = _meters()
+    level = logging.INFO
+    if meters:
+        # Vidinis skaitliukas (pvz. fragmentas pilno perkrovimo metu) pridedamas prie išorinio
+        meters[-1]["images"] += meter["images"]
+        meters[-1]["bytes"] += meter["bytes"]
+        level = logging.DEBUG
+    logger.log(level, "Naršyklei išsiųsta (%s): %d vaizdai, %.1f KB", label, meter["images"], meter["bytes"] / 1024)
+
+
+def begin_rerun_meter():
+    """Pradeda pilno perkrovimo skaitliuką (ankstesni nebaigti, pvz. po st.rerun(), išmetami)"""
+    _local.meters = [{"images": 0, "bytes": 0}]
+
+
+def end_rerun_meter(label="perkrovimas"):
+    meters = _meters()
+    if meters:
+        meter = meters.pop(0)
+        meters.clear()
+        _finish(label, meter)
+
+
+@contextmanager
+def payload_meter(label):
+    """Skaičiuoja bloke (pvz. fragmente) naršyklei išsiųstus vaizdų baitus"""
+    meter = {"images": 0, "bytes": 0}
+    meters = _meters()
+    meters.append(meter)
+    try:
+        yield meter
+    finally:
+        if meters and meters[-1] is meter:
+            meters.pop()
+            _finish(label, meter)
+
+
+def metered(label):
+    """Dekoratorius: funkcijos (fragmento) išsiųstų baitų apskaita ir žurnalas"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with payload_meter(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,248 @@
+import io, os, time, base64, random, logging, threading, contextvars
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import openai
+from PIL import Image
+from vision_payload import estimate_image_tokens
+from openai_client import OPENAI_MAX_RETRIES
+
+logger = logging.getLogger(__name__)
+
+# ---------- Nustatymai ----------
+# Organizacijos OpenAI limitai (užklausos ir tokenai per minutę) - bendri visoms sesijoms procese
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "200000"))
+
+# 429 ir laikinos klaidos kartojamos su atsitiktiniu (jitter) eksponentiniu laukimu.
+# Kliento pakartojimai išjungti, todėl kiek kartų kartoti - OPENAI_MAX_RETRIES (jei nenurodyta kitaip)
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", str(OPENAI_MAX_RETRIES)))
+RATE_LIMIT_BACKOFF_SECONDS = float(os.getenv("RATE_LIMIT_BACKOFF_SECONDS", "1"))
+RATE_LIMIT_MAX_BACKOFF_SECONDS = float(os.getenv("RATE_LIMIT_MAX_BACKOFF_SECONDS", "30"))
+# Po tiek sekundžių nuo pirmo bandymo nebekartojama (darbo gija neužstringa minutėms)
+RATE_LIMIT_MAX_RETRY_SECONDS = float(os.getenv("RATE_LIMIT_MAX_RETRY_SECONDS", "90"))
+
+# Klaidos, po kurių užklausa kartojama per planuoklį.
+# Laiko viršijimas (APITimeoutError) nekartojamas - jau laukta visą timeout, kartojimas tik pailgintų laukimą
+RETRIED_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+# 429 dėl išnaudotos kvotos (sąskaitos) - kartojimas niekada nepadės
+UNRETRIED_ERROR_CODES = ("insufficient_quota",)
+
+# Kieno (kurios sesijos) užklausa - perduodama ir į gijas (žr. instrumentation.propagate)
+_current_owner = contextvars.ContextVar("rate_limit_owner", default="default")
+
+
+class TokenBucket:
+    """Kibiras, kuris prisipildo tolygiai: capacity vienetų per minutę"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Kiek sekundžių reikia palaukti, kol kibire bus amount (0 - galima iškart)"""
+        self._refill(now)
+        # Didesnė už visą kibirą užklausa laukia pilno kibiro (kitaip lauktų amžinai)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= amount
+
+    def give_back(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+    def drain(self, seconds, now):
+        """Po 429 - kibiras ištuštinamas, kad kitos užklausos palauktų (seconds) kartu"""
+        self._refill(now)
+        self.level = min(self.level, -seconds * self.rate)
+
+
+class RateLimitScheduler:
+    """
+    Bendras procesui OpenAI užklausų planuoklis:
+    - RPM ir TPM kibirai (tokenai įvertinami iš prompt'o, vaizdų ir max_tokens)
+    - Sąžininga eilė: sesijos aptarnaujamos paeiliui (round-robin), ne pagal tai, kas daugiau pateikė
+    - Po atsakymo TPM kibiras patikslinamas pagal tikrą usage
+    """
+
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._queues = OrderedDict()  # savininkas -> deque[bilietas]; pirmas - kurio eilė
+        self._condition = threading.Condition()
+        self.granted = 0
+        self.retried = 0
+        self.waited_seconds = 0.0
+
+    def _next_ticket(self):
+        for queue in self._queues.values():
+            if queue:
+                return queue[0]
+        return None
+
+    def acquire(self, cost, owner=None):
+        """Laukia savo eilės ir limitų; grąžina paimtą tokenų kiekį"""
+        owner = owner or _current_owner.get()
+        ticket = object()
+        started = time.monotonic()
+        with self._condition:
+            self._queues.setdefault(owner, deque()).append(ticket)
+            try:
+                while True:
+                    timeout = None
+                    if self._next_ticket() is ticket:
+                        now = time.monotonic()
+                        timeout = max(self.requests.wait_time(1, now), self.tokens.wait_time(cost, now))
+                        if timeout == 0:
+                            self.requests.take(1)
+                            self.tokens.take(cost)
+                            self.granted += 1
+                            self.waited_seconds += now - started
+                            break
+                    self._condition.wait(timeout)
+            finally:
+                queue = self._queues[owner]
+                queue.remove(ticket)
+                # Aptarnauta sesija keliauja į eilės galą
+                self._queues.move_to_end(owner)
+                if not queue:
+                    del self._queues[owner]
+                self._condition.notify_all()
+        return cost
+
+    def settle(self, estimated, actual):
+        """Grąžina arba papildomai nurašo tokenus pagal tikrą sunaudojimą"""
+        if actual is None:
+            return
+        with self._condition:
+            if actual < estimated:
+                self.tokens.give_back(estimated - actual)
+                self._condition.notify_all()
+            else:
+                self.tokens.take(actual - estimated)
+
+    def back_off(self, seconds):
+        """429 - visi laukia kartu (kitaip kitos sesijos tuoj pat vėl gautų 429)"""
+        with self._condition:
+            self.retried += 1
+            self.requests.drain(seconds, time.monotonic())
+
+    def position(self, owner):
+        """Kelinta (nuo 1) sesijos užklausa eilėje; None - nelaukia"""
+        with self._condition:
+            if not self._queues.get(owner):
+                return None
+            # Round-robin: po vieną iš kiekvienos sesijos, kol prieinama iki šios sesijos pirmos
+            position = 0
+            for other, queue in self._queues.items():
+                if not queue:
+                    continue
+                position += 1
+                if other == owner:
+                    return position
+            return position
+
+    def stats(self):
+        with self._condition:
+            waiting = sum(len(queue) for queue in self._queues.values())
+            return {
+                "granted": self.granted,
+                "waiting": waiting,
+                "retried": self.retried,
+                "avg_wait_seconds": self.waited_seconds / self.granted if self.granted else 0.0,
+            }
+
+
+scheduler = RateLimitScheduler(OPENAI_RPM, OPENAI_TPM)
+
+
+@contextmanager
+def session(owner):
+    """Bloke (ir jo gijose) pateiktos užklausos priskiriamos šiai sesijai"""
+    token = _current_owner.set(owner)
+    try:
+        yield
+    finally:
+        _current_owner.reset(token)
+
+
+def _image_tokens(part):
+    url = part["image_url"]["url"]
+    detail = part["image_url"].get("detail", "auto")
+    try:
+        # Užtenka JPEG antraštės - vaizdas nedekoduojamas
+        size = Image.open(io.BytesIO(base64.b64decode(url.split(",", 1)[1]))).size
+    except Exception:
+        size = (2048, 2048)
+    if detail == "auto":
+        detail = "high"
+    return estimate_image_tokens(*size, detail)
+
+
+def estimate_tokens(request):
+    """Apytikslė užklausos kaina TPM limite: tekstas (~4 simboliai tokenui) + vaizdai + max_tokens"""
+    total = 0
+    for message in request.get("messages", []):
+        content = message["content"]
+        parts = [{"type": "text", "text": content}] if isinstance(content, str) else content
+        for part in parts:
+            if part["type"] == "text":
+                total += len(part["text"]) // 4 + 1
+            elif part["type"] == "image_url":
+                total += _image_tokens(part)
+    return total + request.get("max_tokens", 0)
+
+
+def _retry_after(error, attempt):
+    """Serverio nurodytas laukimas (Retry-After) arba eksponentinis su pilnu jitter"""
+    response = getattr(error, "response", None)
+    header = response.headers.get("retry-after") if response is not None else None
+    try:
+        if header:
+            return float(header) + random.uniform(0, RATE_LIMIT_BACKOFF_SECONDS)
+    except ValueError:
+        pass
+    return random.uniform(0, min(RATE_LIMIT_MAX_BACKOFF_SECONDS, RATE_LIMIT_BACKOFF_SECONDS * 2 ** attempt))
+
+
+def _retryable(error):
+    if isinstance(error, openai.APITimeoutError):
+        return False
+    return getattr(error, "code", None) not in UNRETRIED_ERROR_CODES
+
+
+def create_completion(client, **request):
+    """
+    client.chat.completions.create per bendrą planuoklį.
+    Kartojimus atlieka planuoklis (kliento pakartojimai išjungti), todėl jie irgi paiso limitų.
+    """
+    cost = estimate_tokens(request)
+    client = client.with_options(max_retries=0)
+    started = time.monotonic()
+    for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+        scheduler.acquire(cost)
+        try:
+            response = client.chat.completions.create(**request)
+        except RETRIED_ERRORS as e:
+            # Užklausa neįvykdyta - jos tokenai grąžinami į TPM kibirą
+            scheduler.settle(cost, 0)
+            delay = _retry_after(e, attempt)
+            if (attempt == RATE_LIMIT_MAX_RETRIES or not _retryable(e)
+                    or time.monotonic() - started + delay > RATE_LIMIT_MAX_RETRY_SECONDS):
+                raise
+            logger.warning("OpenAI %s - kartojama po %.1f s (%d/%d)", type(e).__name__, delay, attempt + 1, RATE_LIMIT_MAX_RETRIES)
+            if isinstance(e, openai.RateLimitError):
+                scheduler.back_off(delay)
+            else:
+                time.sleep(delay)
+            continue
+        if not request.get("stream"):
+            usage = getattr(response, "usage", None)
+            scheduler.settle(cost, usage.total_tokens if usage is not None else None)
+        return response
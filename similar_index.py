@@ -0,0 +1,164 @@
+import os, time, sqlite3, logging, threading
+import numpy as np
+from ai_cache import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# ---------- Nustatymai ----------
+# Panašių nuotraukų (dHash) indeksas analizėms pakartotinai naudoti - bendras visoms sesijoms ir paleidimams
+SIMILAR_INDEX_PATH = os.getenv("SIMILAR_INDEX_PATH", os.path.join(CACHE_DIR, "similar.sqlite"))
+# Kiek bitų (iš 64) gali skirtis nuotrauka, kad būtų naudojama jos analizė (-1 - išjungta)
+SIMILAR_ANALYSIS_DISTANCE = int(os.getenv("SIMILAR_ANALYSIS_DISTANCE", "5"))
+# dHash nemato spalvų - analizė (su tiksliomis spalvomis) naudojama tik tų pačių spalvų nuotraukai:
+# didžiausias vidutinės RGB skirtumas spalvų tinklelio langelyje (žr. image_hash.color_signature)
+SIMILAR_COLOR_DIFFERENCE = int(os.getenv("SIMILAR_COLOR_DIFFERENCE", "8"))
+SIMILAR_INDEX_MAX_ENTRIES = int(os.getenv("SIMILAR_INDEX_MAX_ENTRIES", "50000"))
+
+# Bitų skaičius kiekvienam baitui (numpy < 2.0 neturi bitwise_count)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _signed(value):
+    """SQLite INTEGER - su ženklu (64 bitų maišas perkeliamas į int64 ribas)"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _color_differences(colors, signature):
+    return np.abs(colors.astype(np.int16) - np.frombuffer(signature, dtype=np.uint8)).max(axis=1)
+
+
+def _distances(hashes, value):
+    xor = hashes ^ np.uint64(value)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(xor)
+    return _POPCOUNT[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class SimilarityIndex:
+    """
+    Nuotraukų atspaudų (dHash + spalvų parašas) -> analizių indeksas:
+    - Įrašai saugomi SQLite faile (išlieka tarp paleidimų, bendri keliems procesams)
+    - Paieškai atspaudai laikomi atmintyje numpy masyvuose: XOR + bitų skaičius visam masyvui,
+      spalvos tikrinamos tik artimiems maišams (dešimtys tūkstančių įrašų - mažiau nei milisekundė)
+    - Kitam procesui pakeitus failą (PRAGMA data_version) masyvai perkraunami, savi įrašai - pridedami
+    - Raktų erdvė (namespace) - modelis + prompt'o versija + detail: pakeitus prompt'ą seni įrašai nenaudojami
+    """
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._version = None
+        self._arrays = {}  # namespace -> (uint64 maišai, uint8 spalvų parašai, įrašų id)
+
+    def _connect(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS photos ("
+                "id INTEGER PRIMARY KEY, namespace TEXT NOT NULL, hash INTEGER NOT NULL, "
+                "colors BLOB NOT NULL, analysis TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.commit()
+        return self._db
+
+    def _refresh(self, db):
+        """Perkrauna masyvus, jei failas pasikeitė (kviečiama su užraktu)"""
+        version = db.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._version:
+            return
+        grouped = {}
+        for row_id, namespace, value, colors in db.execute("SELECT id, namespace, hash, colors FROM photos ORDER BY id"):
+            ids, hashes, signatures = grouped.setdefault(namespace, ([], [], []))
+            ids.append(row_id)
+            hashes.append(value)
+            signatures.append(colors)
+        self._arrays = {
+            namespace: (
+                np.array(hashes, dtype=np.int64).view(np.uint64),
+                np.frombuffer(b"".join(signatures), dtype=np.uint8).reshape(len(ids), -1),
+                np.array(ids, dtype=np.int64),
+            )
+            for namespace, (ids, hashes, signatures) in grouped.items()
+        }
+        self._version = version
+
+    def lookup(self, fingerprint, namespace, max_distance=None, max_color_difference=None):
+        """Artimiausia žinoma tų pačių spalvų nuotrauka: (analizė, atstumas bitais) arba None"""
+        max_distance = SIMILAR_ANALYSIS_DISTANCE if max_distance is None else max_distance
+        max_color_difference = SIMILAR_COLOR_DIFFERENCE if max_color_difference is None else max_color_difference
+        if max_distance < 0:
+            return None
+        value, signature = fingerprint
+        try:
+            with self._lock:
+                db = self._connect()
+                self._refresh(db)
+                hashes, colors, ids = self._arrays.get(namespace, (None, None, None))
+                if hashes is None or not len(hashes):
+                    self.misses += 1
+                    return None
+                distances = _distances(hashes, value)
+                # Spalvos tikrinamos tik maišu artimiems įrašams
+                candidates = np.flatnonzero(distances <= max_distance)
+                if len(candidates):
+                    candidates = candidates[_color_differences(colors[candidates], signature) <= max_color_difference]
+                if not len(candidates):
+                    self.misses += 1
+                    return None
+                best = int(candidates[distances[candidates].argmin()])
+                row = db.execute("SELECT analysis FROM photos WHERE id = ?", (int(ids[best]),)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                self.hits += 1
+                return row[0], int(distances[best])
+        except sqlite3.Error as e:
+            # Indeksas neprivalomas - klaida neturi sustabdyti darbo
+            logger.warning("Panašių nuotraukų indeksas nepasiekiamas: %s", e)
+            return None
+
+    def add(self, fingerprint, namespace, analysis):
+        value, signature = fingerprint
+        try:
+            with self._lock:
+                db = self._connect()
+                row_id = db.execute(
+                    "INSERT INTO photos (namespace, hash, colors, analysis, created) VALUES (?, ?, ?, ?, ?)",
+                    (namespace, _signed(value), signature, analysis, time.time())
+                ).lastrowid
+                # Seniausi įrašai išmetami, kai viršijama riba
+                oldest = row_id - self.max_entries
+                db.execute("DELETE FROM photos WHERE id <= ?", (oldest,))
+                db.commit()
+                # data_version keičiasi tik kitų jungčių pakeitimams - savo įrašą pridedame į masyvus patys
+                self._append(namespace, row_id, value, signature, oldest)
+        except sqlite3.Error as e:
+            logger.warning("Nepavyko įrašyti į panašių nuotraukų indeksą: %s", e)
+
+    def _append(self, namespace, row_id, value, signature, oldest):
+        """Naujas įrašas -> atminties masyvai be viso failo perkrovimo (kviečiama su užraktu)"""
+        if self._version is None:
+            # Masyvai dar neužkrauti - pirma paieška perskaitys visą failą
+            return
+        hashes, colors, ids = self._arrays.get(namespace, (
+            np.empty(0, dtype=np.uint64), np.empty((0, len(signature)), dtype=np.uint8), np.empty(0, dtype=np.int64)
+        ))
+        keep = ids > oldest
+        self._arrays[namespace] = (
+            np.append(hashes[keep], np.array([_signed(value)], dtype=np.int64).view(np.uint64)),
+            np.vstack([colors[keep], np.frombuffer(signature, dtype=np.uint8)]),
+            np.append(ids[keep], row_id),
+        )
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+
+similar_index = SimilarityIndex(SIMILAR_INDEX_PATH, SIMILAR_INDEX_MAX_ENTRIES)
@@ -0,0 +1,107 @@
+import io, os, math, time, base64, logging
+from PIL import Image, ImageOps
+from instrumentation import record
+
+logger = logging.getLogger(__name__)
+
+# ---------- Nustatymai ----------
+# Ilgiausia kraštinė (px), JPEG kokybė ir vision "detail" lygis (auto/low/high)
+VISION_MAX_EDGE = int(os.getenv("VISION_MAX_EDGE", "1024"))
+VISION_JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", "80"))
+VISION_DETAIL = os.getenv("VISION_DETAIL", "auto")
+
+# Iki tokio dydžio užtenka "low" režimo (viena 512px plytelė)
+LOW_DETAIL_EDGE = 512
+
+
+def estimate_image_tokens(width, height, detail):
+    """
+    Apytikslis vaizdo tokenų kiekis pagal OpenAI plytelių formulę:
+    low = 85; high = 85 + 170 už kiekvieną 512px plytelę
+    (vaizdas sutalpinamas į 2048x2048, trumpesnė kraštinė sumažinama iki 768)
+    """
+    if detail == "low":
+        return 85
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return 85 + 170 * tiles
+
+
+def pick_detail(width, height, detail=None):
+    """Parenka detail lygį: mažiems vaizdams - low, kitiems - high"""
+    detail = detail or VISION_DETAIL
+    if detail != "auto":
+        return detail
+    return "low" if max(width, height) <= LOW_DETAIL_EDGE else "high"
+
+
+def prepare_vision_payload(image_file, max_edge=None, quality=None, detail=None):
+    """
+    Paruošia nuotrauką siuntimui į vision modelį:
+    - Sumažina iki max_edge ilgiausios kraštinės
+    - Perkoduoja į JPEG su nurodyta kokybe
+    - Parenka detail lygį
+    Grąžina (base64 tekstas, detail)
+    """
+    started = time.perf_counter()
+    max_edge = max_edge or VISION_MAX_EDGE
+    quality = quality or VISION_JPEG_QUALITY
+
+    if isinstance(image_file, (bytes, bytearray)):
+        original = bytes(image_file)
+    else:
+        image_file.seek(0)
+        original = image_file.read()
+
+    img = Image.open(io.BytesIO(original))
+    original_format = img.format
+    original_size = img.size
+    orientation = img.getexif().get(0x0112, 1)
+
+    # Permatomus vaizdus dedame ant balto fono
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        img = background
+
+    # thumbnail() JPEG failams pats naudoja draft režimą - dekoduoja jau sumažintą
+    img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+    # Pasukame pagal EXIF (telefonų nuotraukos)
+    img = ImageOps.exif_transpose(img)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    output = io.BytesIO()
+    img.save(output, format='JPEG', quality=quality, optimize=True)
+    payload = output.getvalue()
+
+    # Jei vaizdas nebuvo mažinamas ir originalus JPEG mažesnis - siunčiame originalą
+    if (img.size == original_size and original_format == 'JPEG' and orientation == 1
+            and len(original) <= len(payload)):
+        payload = original
+
+    chosen_detail = pick_detail(*img.size, detail=detail)
+
+    tokens_before = estimate_image_tokens(*original_size, "high")
+    tokens_after = estimate_image_tokens(*img.size, chosen_detail)
+    logger.info(
+        "Vision payload: %dx%d -> %dx%d, %d -> %d B (sutaupyta %d B), ~%d -> ~%d vaizdo tokenų, detail=%s",
+        original_size[0], original_size[1], img.size[0], img.size[1],
+        len(original), len(payload), len(original) - len(payload),
+        tokens_before, tokens_after, chosen_detail
+    )
+
+    encoded = base64.b64encode(payload).decode()
+    record(
+        "vision_payload",
+        seconds=round(time.perf_counter() - started, 6),
+        bytes_in=len(original),
+        bytes_out=len(encoded),
+        image_tokens=tokens_after
+    )
+    return encoded, chosen_detail
@@ -0,0 +1,81 @@
+import os
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont
+
+# Šriftų paieškos tvarka (PRIORITY: Bold)
+FONT_PATHS = [
+    "C:/Windows/Fonts/arialbd.ttf",  # Arial Bold (Windows)
+    "C:/Windows/Fonts/arial.ttf",    # Arial Regular
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",  # Linux Bold
+    "/System/Library/Fonts/Helvetica.ttc"  # Mac
+]
+
+# STORESNIS šešėlis (juodas) - poslinkiai px originalo raiškoje
+SHADOW_OFFSETS = ((3, 3), (2, 2), (1, 1), (4, 4))
+
+# Kiek paruoštų vandens ženklų (tekstas, dydis, šešėlis) laikoma atmintyje
+WATERMARK_SPRITE_CACHE_SIZE = int(os.getenv("WATERMARK_SPRITE_CACHE_SIZE", "64"))
+
+
+@lru_cache(maxsize=1)
+def resolve_font_path():
+    """Suranda pirmą veikiantį šriftą (vieną kartą procesui). None - jei nė vienas neveikia"""
+    for font_path in FONT_PATHS:
+        try:
+            ImageFont.truetype(font_path, 10)
+            return font_path
+        except OSError:
+            continue
+    return None
+
+
+@lru_cache(maxsize=32)
+def get_font(size):
+    """FreeTypeFont pagal dydį (talpinamas)"""
+    font_path = resolve_font_path()
+    if font_path is None:
+        return ImageFont.load_default()
+    return ImageFont.truetype(font_path, size)
+
+
+@lru_cache(maxsize=WATERMARK_SPRITE_CACHE_SIZE)
+def watermark_sprite(watermark_text, font_size, shadow_offsets=SHADOW_OFFSETS):
+    """
+    Iš anksto nupiešia vandens ženklą (juodi šešėliai + baltas tekstas) į RGBA sprite'ą.
+    Grąžina (sprite, teksto bbox nuo piešimo taško). Sprite'o (0, 0) atitinka bbox kairį viršutinį kampą.
+    """
+    font = get_font(font_size)
+    if resolve_font_path() is None:
+        # Default font nemažas - pakartojame tekstą kad būtų didesnis
+        watermark_text = watermark_text * 2
+
+    bbox = font.getbbox(watermark_text)
+    max_dx = max(dx for dx, _dy in shadow_offsets)
+    max_dy = max(dy for _dx, dy in shadow_offsets)
+    size = (bbox[2] - bbox[0] + max_dx, bbox[3] - bbox[1] + max_dy)
+    origin = (-bbox[0], -bbox[1])
+
+    # Šešėliai - viename juodame sluoksnyje, tekstas - baltame (permatomas fonas tos pačios spalvos,
+    # kad kraštų glotninimas nepatamsėtų)
+    shadow = Image.new("RGBA", size, (0, 0, 0, 0))
+    shadow_draw = ImageDraw.Draw(shadow)
+    for dx, dy in shadow_offsets:
+        shadow_draw.text((origin[0] + dx, origin[1] + dy), watermark_text, fill=(0, 0, 0, 255), font=font)
+
+    text = Image.new("RGBA", size, (255, 255, 255, 0))
+    ImageDraw.Draw(text).text(origin, watermark_text, fill=(255, 255, 255, 255), font=font)
+
+    return Image.alpha_composite(shadow, text), bbox
+
+
+def apply_watermark(img, watermark_text, font_size, margin, shadow_offsets=SHADOW_OFFSETS):
+    """Uždeda vandens ženklą dešiniame apatiniame kampe viena operacija (img keičiamas vietoje)"""
+    sprite, bbox = watermark_sprite(watermark_text, font_size, tuple(shadow_offsets))
+
+    text_width = bbox[2] - bbox[0]
+    text_height = bbox[3] - bbox[1]
+    x = img.width - text_width - margin
+    y = img.height - text_height - margin
+
+    img.paste(sprite, (x + bbox[0], y + bbox[1]), sprite)
+    return img